@@ -0,0 +1,188 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import tempfile
+from typing import Optional, TextIO
+
+from audit import AuditLog
+from resources import ResourceSchedule
+from schedule import BaseSchedule
+from schedule_index import ALL_WEEKDAYS, MINUTES_IN_DAY, format_slot_key, parse_date, parse_time
+from settings import load_settings
+from storage import create_schedule
+
+EXPORT_FORMATS: tuple[str, ...] = ("csv", "jsonl")  # Форматы выгрузки броней
+
+
+def parse_admins(value: str) -> frozenset[int]:
+    """
+    Перевод настройки admins (id через запятую) в множество id.
+
+    :param value: Значение настройки
+    :return: Id администраторов
+    """
+    return frozenset(int(user_id) for user_id in value.split(",") if user_id.strip())
+
+
+def parse_weekdays(value: str) -> int:
+    """
+    Перевод списка дней недели через запятую (1 - понедельник, 7 - воскресенье) в маску дней недели.
+
+    :param value: Дни недели
+    :return: Маска дней недели или -1, если список некорректен
+    """
+    weekdays = 0
+    for day in value.split(","):
+        day = day.strip()
+        if not day.isdecimal() or not 1 <= int(day) <= 7:
+            return -1
+        weekdays |= 1 << int(day) - 1
+    return weekdays
+
+
+def parse_period(args: list[str]) -> Optional[tuple[int, int, int, int]]:
+    """
+    Разбор промежутка из аргументов команды: "dd.mm.yyyy dd.mm.yyyy [HH:MM HH:MM]" - первый и последний день
+    (включительно) и, если указано, время записей.
+
+    :param args: Аргументы
+    :return: (первый день, день после последнего, начало времени, конец времени) или None, если аргументы некорректны
+    """
+    if len(args) not in (2, 4):
+        return None
+    first_ordinal, last_ordinal = parse_date(args[0]), parse_date(args[1])
+    time_from, time_to = (parse_time(args[2]), parse_time(args[3])) if len(args) == 4 else (0, MINUTES_IN_DAY)
+    if first_ordinal < 0 or last_ordinal < first_ordinal or time_from < 0 or time_to <= time_from:
+        return None
+    return first_ordinal, last_ordinal + 1, time_from, time_to
+
+
+def export_bookings(schedule: BaseSchedule, first_ordinal: int, last_ordinal: int, f: TextIO,
+                    export_format: str = "csv") -> int:
+    """
+    Выгрузка броней промежутка дней в файл. Брони пишутся по мере чтения из расписания (см. iter_bookings),
+    поэтому выгрузка большого промежутка не занимает память. Если расписание состоит из нескольких мастеров
+    (см. resources.py), брони выгружаются по мастерам, с именем мастера в поле master.
+
+    :param schedule: Расписание
+    :param first_ordinal: Порядковый номер первого дня
+    :param last_ordinal: Порядковый номер дня, следующего за последним
+    :param f: Файл
+    :param export_format: Формат: "csv" ([master,]date,time,user_id) или "jsonl" (json на строку)
+    :return: Количество выгруженных броней
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат выгрузки: {export_format}")
+    resources = schedule.resources()
+    fields = ("master", "date", "time", "user_id") if len(resources) > 1 else ("date", "time", "user_id")
+    writer = csv.writer(f)
+    if export_format == "csv":
+        writer.writerow(fields)
+    count = 0
+    for name, resource in resources:
+        for key, user_id in resource.iter_bookings(first_ordinal, last_ordinal):
+            row = (name, *format_slot_key(key).split(), user_id)[-len(fields):]
+            if export_format == "csv":
+                writer.writerow(row)
+            else:
+                f.write(json.dumps(dict(zip(fields, row)), ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def export_to_file(schedule: BaseSchedule, first_ordinal: int, last_ordinal: int,
+                   export_format: str = "csv") -> tuple[str, int]:
+    """
+    Выгрузка броней во временный файл (для отправки документом). Выполняется в потоке, а не в цикле событий:
+    файл удаляет вызывающий.
+
+    :param schedule: Расписание
+    :param first_ordinal: Порядковый номер первого дня
+    :param last_ordinal: Порядковый номер дня, следующего за последним
+    :param export_format: Формат выгрузки (см. export_bookings)
+    :return: (путь к файлу, количество выгруженных броней)
+    """
+    fd, path = tempfile.mkstemp(prefix="bookings_", suffix="." + export_format)
+    try:
+        with os.fdopen(fd, "w", newline="", encoding="utf-8") as f:
+            count = export_bookings(schedule, first_ordinal, last_ordinal, f, export_format)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, count
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """
+    Точка входа: выгрузка броней и массовое открытие/закрытие записей из командной строки.
+    Расписание открывается с настройками из файла конфигурации, как в боте. С хранилищем json изменения
+    выполняются при остановленном боте (журнал пишет один процесс), с sqlite - в любое время.
+
+    :param argv: Аргументы командной строки
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description="Управление расписанием парикмахерской")
+    parser.add_argument("--config", default="config.txt", help="Файл конфигурации бота")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Выгрузка броней за промежуток дней")
+    export_parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv", help="Формат выгрузки")
+    export_parser.add_argument("--output", help="Файл выгрузки (по умолчанию - стандартный вывод)")
+    for command, description in (("close", "Закрытие свободных записей"), ("open", "Открытие закрытых записей")):
+        edit_parser = commands.add_parser(command, help=description)
+        edit_parser.add_argument("--time-from", default="00:00", help="Записи не раньше этого времени")
+        edit_parser.add_argument("--time-to", default="",
+                                 help="Записи раньше этого времени (по умолчанию - до конца дня)")
+        edit_parser.add_argument("--weekdays", default="",
+                                 help="Дни недели через запятую: 1 - понедельник, 7 - воскресенье (по умолчанию - все)")
+    for command_parser in commands.choices.values():
+        command_parser.add_argument("--branch", type=int, help="Номер филиала, с 1 (если заданы филиалы)")
+        command_parser.add_argument("--master", type=int, help="Номер мастера в филиале, с 1")
+        command_parser.add_argument("first", help="Первый день: dd.mm.yyyy")
+        command_parser.add_argument("last", help="Последний день (включительно): dd.mm.yyyy")
+    args = parser.parse_args(argv)
+
+    period = parse_period([args.first, args.last])
+    if period is None:
+        parser.error("Некорректный промежуток дней")
+    first_ordinal, last_ordinal, _, _ = period
+    settings = load_settings(args.config)
+    async_schedule = create_schedule(settings)  # Хранилище выбирается настройками, как в боте
+    # Открытие и закрытие записей попадают в журнал аудита, как из бота (чат 0 - командная строка)
+    async_schedule.audit = AuditLog(settings.audit_file, async_schedule.schedule.clock) if settings.audit_file else None
+    schedule = async_schedule.schedule
+    resource: BaseSchedule = schedule  # Филиал или мастер, к которому относится команда
+    try:
+        if args.branch is not None or args.master is not None:
+            if not isinstance(schedule, ResourceSchedule) or args.branch is None or \
+                    not 1 <= args.branch <= len(schedule.branches):
+                parser.error("Некорректный филиал (филиалы задаются настройкой resources_file)")
+            resource = schedule.branches[args.branch - 1][1]
+            if args.master is not None:
+                if not 1 <= args.master <= len(resource.masters):
+                    parser.error("Некорректный мастер")
+                resource = resource.masters[args.master - 1][1]
+        if args.command == "export":
+            if args.output is None:
+                count = export_bookings(resource, first_ordinal, last_ordinal, sys.stdout, args.format)
+            else:
+                with open(args.output, "w", newline="", encoding="utf-8") as f:
+                    count = export_bookings(resource, first_ordinal, last_ordinal, f, args.format)
+            print(f"Выгружено броней: {count}", file=sys.stderr)
+            return
+        time_from = parse_time(args.time_from)
+        time_to = parse_time(args.time_to) if args.time_to else MINUTES_IN_DAY
+        weekdays = parse_weekdays(args.weekdays) if args.weekdays else ALL_WEEKDAYS
+        if time_from < 0 or time_to <= time_from or weekdays < 0:
+            parser.error("Некорректное время или дни недели")
+        count = async_schedule.set_resource_availability(0, resource, first_ordinal, last_ordinal,
+                                                         args.command == "open", time_from, time_to, weekdays,
+                                                         async_schedule.now_cutoff())
+        print(f"{'Открыто' if args.command == 'open' else 'Закрыто'} записей: {count}")
+    finally:
+        async_schedule.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,207 @@
+import argparse
+import datetime
+import json
+import os
+import queue
+import sys
+import threading
+from typing import Any, Optional
+
+from clock import Clock
+from schedule_index import NO_RECORD, UNAVAILABLE, format_slot_key, parse_slot_key
+
+
+class AuditLog:
+    """
+    Журнал аудита: каждое изменение брони (кто, какая запись какого ресурса, состояние до и после, время операции)
+    и каждое открытие и закрытие записей (со списком измененных записей) дописывается в файл строкой json. Файл
+    только дописывается и не ротируется, поэтому по нему можно восстановить состояния записей (см. replay_audit).
+    Ресурс - имя мастера из BaseSchedule.resources (пустая строка для расписания без филиалов и мастеров).
+    Время изменений берется по часам парикмахерской и записывается со смещением часового пояса.
+
+    Обработчики только ставят изменения в очередь; фоновый поток сериализует их и дописывает накопившиеся строки
+    одним системным вызовом write. Файл открыт на дозапись (O_APPEND), поэтому несколько процессов могут писать
+    в один журнал: строки не перемешиваются.
+    """
+
+    def __init__(self, filename: str, clock: Optional[Clock] = None) -> None:
+        """
+        Конструктор. Открывает файл и запускает поток записи.
+
+        :param filename: Имя файла журнала аудита
+        :param clock: Часы парикмахерской (по умолчанию - в часовом поясе сервера)
+        """
+        self.filename: str = filename
+        self.clock: Clock = Clock() if clock is None else clock
+        self.written: int = 0  # Сколько изменений записано
+        self._fd: int = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._write_loop, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def record(self, event: str, chat_id: int, resource: str, key: int, old: int, new: int, latency: float) -> None:
+        """
+        Запись изменения состояния записи.
+
+        :param event: Событие: "book", "reschedule", "cancel"
+        :param chat_id: Id чата, из которого выполнено изменение
+        :param resource: Ресурс (мастер), у которого изменена запись
+        :param key: Момент записи
+        :param old: Состояние записи до изменения (0 - свободна, иначе id пользователя)
+        :param new: Состояние записи после изменения
+        :param latency: Время операции с расписанием, секунды
+        :return: None
+        """
+        self._queue.put((self._now(), event, chat_id, latency,
+                         {"resource": resource, "slot": format_slot_key(key), "old": old, "new": new}))
+
+    def record_period(self, event: str, chat_id: int, resource: str, first_ordinal: int, last_ordinal: int,
+                      time_from: int, time_to: int, weekdays: int, keys: list[int], latency: float) -> None:
+        """
+        Запись массового открытия или закрытия записей ресурса (брони при этом не меняются).
+
+        :param event: Событие: "open" или "close"
+        :param chat_id: Id чата менеджера (0 - командная строка, см. admin.py)
+        :param resource: Ресурс (мастер), у которого изменены записи
+        :param first_ordinal: Порядковый номер первого дня
+        :param last_ordinal: Порядковый номер дня, следующего за последним
+        :param time_from: Записи не раньше этого времени, минуты от начала дня
+        :param time_to: Записи раньше этого времени, минуты от начала дня
+        :param weekdays: Маска дней недели
+        :param keys: Моменты измененных записей
+        :param latency: Время операции с расписанием, секунды
+        :return: None
+        """
+        self._queue.put((self._now(), event, chat_id, latency,
+                         {"resource": resource,
+                          "first": datetime.date.fromordinal(first_ordinal).strftime("%d.%m.%Y"),
+                          "last": datetime.date.fromordinal(last_ordinal - 1).strftime("%d.%m.%Y"),
+                          "time_from": time_from, "time_to": time_to, "weekdays": weekdays, "count": len(keys),
+                          "slots": [format_slot_key(key) for key in keys]}))
+
+    def _now(self) -> datetime.datetime:
+        """
+        Время изменения по часам парикмахерской. Если часовой пояс не задан, к местному времени сервера
+        добавляется его смещение.
+
+        :return: Время с часовым поясом
+        """
+        now = self.clock.now()
+        return now if now.tzinfo is not None else now.astimezone()
+
+    def _write_loop(self) -> None:
+        """
+        Цикл потока записи: ждет изменения, забирает все накопившиеся и дописывает их в файл.
+
+        :return: None
+        """
+        stopped = False
+        while not stopped:
+            batch = [self._queue.get()]
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            lines = []
+            for item in batch:
+                if item is None:  # Сигнал остановки: изменения до него записываются
+                    stopped = True
+                    continue
+                created, event, chat_id, latency, fields = item
+                lines.append(json.dumps({"time": created.isoformat(timespec="milliseconds"), "event": event,
+                                         "chat_id": chat_id, **fields, "latency_ms": round(latency * 1000, 3)}))
+            if lines:
+                os.write(self._fd, ("\n".join(lines) + "\n").encode())
+                self.written += len(lines)
+
+    def close(self) -> None:
+        """
+        Запись оставшихся изменений и закрытие файла.
+
+        :return: None
+        """
+        if self._fd < 0:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        os.close(self._fd)
+        self._fd = -1
+
+
+def replay_audit(filename: str) -> dict[tuple[str, int], int]:
+    """
+    Восстановление состояний записей по журналу аудита: изменения броней, открытие и закрытие записей применяются
+    по порядку. Открытие и закрытие, записанные без списка измененных записей (журналы старых версий),
+    пропускаются.
+
+    :param filename: Имя файла журнала аудита
+    :return: Для каждой записи (ресурс, момент записи), встречавшейся в журнале, - её состояние после последнего
+        изменения: 0 - свободна, id пользователя - забронирована, UNAVAILABLE - закрыта
+    """
+    states: dict[tuple[str, int], int] = {}
+    with open(filename, "r", encoding="utf-8") as f:
+        for line in f:
+            entry: dict[str, Any] = json.loads(line)
+            resource = entry.get("resource", "")
+            if "slot" in entry:
+                states[(resource, parse_slot_key(entry["slot"]))] = entry["new"]
+            else:
+                state = 0 if entry["event"] == "open" else UNAVAILABLE
+                for str_slot in entry.get("slots", ()):
+                    states[(resource, parse_slot_key(str_slot))] = state
+    return states
+
+
+def describe_state(state: int) -> str:
+    """
+    Описание состояния записи для вывода.
+
+    :param state: Состояние записи
+    :return: Описание
+    """
+    if state > 0:
+        return f"забронирована {state}"
+    return {0: "свободна", UNAVAILABLE: "закрыта", NO_RECORD: "нет записи"}.get(state, f"недоступна ({state})")
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """
+    Точка входа: восстановление состояний записей по журналу аудита и, с --verify, сверка с расписанием.
+
+    :param argv: Аргументы командной строки
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description="Восстановление состояний записей по журналу аудита")
+    parser.add_argument("audit_file", help="Файл журнала аудита")
+    parser.add_argument("--verify", action="store_true", help="Сверить восстановленные записи с расписанием")
+    parser.add_argument("--config", default="config.txt", help="Файл конфигурации бота (для --verify)")
+    args = parser.parse_args(argv)
+
+    states = replay_audit(args.audit_file)
+    print(f"Броней по журналу аудита: {sum(state > 0 for state in states.values())} "
+          f"(записей в журнале: {len(states)})")
+    if not args.verify:
+        for (resource, key), state in sorted(states.items(), key=lambda item: (item[0][1], item[0][0])):
+            if state != 0:
+                print(format_slot_key(key), resource, describe_state(state))
+        return
+
+    from settings import load_settings  # Импорт здесь: storage импортирует этот модуль
+    from storage import create_schedule
+    schedule = create_schedule(load_settings(args.config))
+    try:
+        mismatches = []
+        for (resource, key), state in states.items():
+            actual = schedule.resources[resource].get_slot_state(key) if resource in schedule.resources else NO_RECORD
+            if actual != state:
+                mismatches.append((resource, key, state, actual))
+    finally:
+        schedule.close()
+    for resource, key, state, actual in mismatches:
+        print(f"{format_slot_key(key)} {resource}: по журналу {describe_state(state)}, "
+              f"в расписании {describe_state(actual)}")
+    print(f"Расхождений: {len(mismatches)}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
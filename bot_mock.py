@@ -0,0 +1,88 @@
+import asyncio
+import datetime
+from collections import deque
+from typing import Any, AsyncGenerator, Optional
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.types import Chat, Message
+
+
+class MockSession(BaseSession):
+    """
+    Сессия бота, которая не обращается к Telegram Bot API. Запросы запоминаются, а в ответ на отправку сообщения
+    возвращается сообщение, как если бы Telegram его принял. Используется для локальной проверки бота
+    (replay_updates.py) и нагрузочного тестирования.
+    """
+
+    def __init__(self, latency: float = 0.0, keep_requests: int = 1000) -> None:
+        """
+        Конструктор.
+
+        :param latency: Имитируемая задержка ответа Bot API в секундах
+        :param keep_requests: Сколько последних запросов хранить
+        """
+        super().__init__()
+        self.latency: float = latency
+        self.requests_count: int = 0  # Количество выполненных запросов
+        self.requests: deque[TelegramMethod[Any]] = deque(maxlen=keep_requests)  # Последние запросы
+        self._message_id: int = 0
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[Any], timeout: Optional[int] = None) -> Any:
+        """
+        Имитация запроса к Bot API.
+
+        :param bot: Объект бота
+        :param method: Метод Bot API
+        :param timeout: Не используется
+        :return: Результат метода
+        """
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.requests_count += 1
+        self.requests.append(method)
+        if method.__returning__ is Message:
+            self._message_id += 1
+            return Message(message_id=self._message_id, date=datetime.datetime.now(),
+                           chat=Chat(id=getattr(method, "chat_id", 0), type="private"),
+                           text=getattr(method, "text", None))
+        return True
+
+    async def stream_content(self, url: str, headers: Optional[dict[str, Any]] = None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True) -> AsyncGenerator[bytes, None]:
+        """
+        Скачивание файлов не поддерживается.
+        """
+        yield b""
+
+    async def close(self) -> None:
+        """
+        Закрытие сессии (ничего не делает).
+
+        :return: None
+        """
+
+
+def make_update(update_id: int, chat_id: int, text: str) -> dict[str, Any]:
+    """
+    Создание обновления Telegram с текстовым сообщением пользователя в личном чате.
+
+    :param update_id: Id обновления
+    :param chat_id: Id чата (совпадает с id пользователя)
+    :param text: Текст сообщения
+    :return: Обновление в формате json Bot API
+    """
+    user = {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(datetime.datetime.now().timestamp()),
+            "chat": {"id": chat_id, "type": "private", "first_name": user["first_name"]},
+            "from": user,
+            "text": text,
+            **({"entities": [{"type": "bot_command", "offset": 0, "length": len(text)}]}
+               if text.startswith("/") else {}),
+        },
+    }
@@ -0,0 +1,68 @@
+import datetime
+from typing import Any, Awaitable, Callable, Optional
+from zoneinfo import ZoneInfo
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from schedule_index import MINUTES_IN_DAY
+
+
+class Clock:
+    """
+    Часы парикмахерской: текущий момент в её часовом поясе, а не в часовом поясе сервера. Момент - целое число
+    минут, как момент записи (см. schedule.BaseSchedule): номер_дня * MINUTES_IN_DAY + минуты_от_начала_дня.
+
+    Источник времени подменяется (source), поэтому в проверках время можно остановить или сдвинуть.
+    """
+
+    def __init__(self, timezone: str = "",
+                 source: Optional[Callable[[Optional[datetime.tzinfo]], datetime.datetime]] = None) -> None:
+        """
+        Конструктор.
+
+        :param timezone: Часовой пояс парикмахерской (например, "Europe/Moscow"); пусто - часовой пояс сервера
+        :param source: Текущее время в часовом поясе (по умолчанию datetime.datetime.now)
+        """
+        self.timezone: Optional[datetime.tzinfo] = ZoneInfo(timezone) if timezone else None
+        self.source: Callable[[Optional[datetime.tzinfo]], datetime.datetime] = \
+            datetime.datetime.now if source is None else source
+
+    def now(self) -> datetime.datetime:
+        """
+        Текущее время парикмахерской.
+
+        :return: Время (с часовым поясом, если он задан)
+        """
+        return self.source(self.timezone)
+
+    def cutoff(self) -> int:
+        """
+        Текущий момент в минутах. Вычисляется один раз на обновление (см. ClockMiddleware) и передается
+        во все фильтры.
+
+        :return: Текущий момент
+        """
+        now = self.source(self.timezone)
+        return now.toordinal() * MINUTES_IN_DAY + now.hour * 60 + now.minute
+
+
+class ClockMiddleware(BaseMiddleware):
+    """
+    Снимок часов на обновление (внешний промежуточный обработчик диспетчера): текущий момент вычисляется один раз
+    и передается обработчикам аргументом cutoff. Поэтому все проверки при обработке одного обновления видят одно
+    и то же время.
+    """
+
+    def __init__(self, clock: Clock) -> None:
+        """
+        Конструктор.
+
+        :param clock: Часы парикмахерской
+        """
+        self.clock: Clock = clock
+
+    async def __call__(self, handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: dict[str, Any]) -> Any:
+        data["cutoff"] = self.clock.cutoff()
+        return await handler(event, data)
@@ -0,0 +1,262 @@
+import asyncio
+import logging
+import multiprocessing
+import signal
+import sys
+from types import ModuleType
+from typing import Any, Awaitable, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from logs import setup_logging
+from settings import Settings
+
+
+def chat_id_of(update: Update) -> int:
+    """
+    Id чата, к которому относится обновление (или пользователя, если чата нет). Обновления одного чата
+    направляются в один процесс и обрабатываются по порядку.
+
+    :param update: Обновление
+    :return: Id чата или 0, если обновление не относится к чату
+    """
+    try:
+        event = update.event
+    except Exception:  # Неизвестный тип обновления
+        return 0
+    chat = getattr(event, "chat", None) or getattr(getattr(event, "message", None), "chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(event, "from_user", None)
+    return user.id if user is not None else 0
+
+
+class ChatSequencer:
+    """
+    Запуск обработки обновлений: обновления разных чатов обрабатываются одновременно, обновления одного чата -
+    строго по очереди, в порядке поступления.
+    """
+
+    def __init__(self) -> None:
+        """
+        Конструктор.
+        """
+        self._tails: dict[int, asyncio.Task] = {}  # Последняя задача каждого чата
+
+    def submit(self, chat_id: int, coroutine: Awaitable[Any]) -> asyncio.Task:
+        """
+        Запуск обработки обновления после всех ранее поступивших обновлений этого чата.
+
+        :param chat_id: Id чата
+        :param coroutine: Обработка обновления
+        :return: Задача
+        """
+        task = asyncio.create_task(self._run_after(self._tails.get(chat_id), coroutine))
+        self._tails[chat_id] = task
+        task.add_done_callback(lambda done: self._tails.pop(chat_id) if self._tails.get(chat_id) is done else None)
+        return task
+
+    @staticmethod
+    async def _run_after(previous: Optional[asyncio.Task], coroutine: Awaitable[Any]) -> None:
+        if previous is not None:
+            await asyncio.wait((previous,))
+        try:
+            await coroutine
+        except Exception:
+            logging.exception("Ошибка при обработке обновления")
+
+    async def join(self) -> None:
+        """
+        Ожидание обработки всех поступивших обновлений.
+
+        :return: None
+        """
+        while self._tails:
+            await asyncio.wait(list(self._tails.values()))
+
+
+def _bot_module() -> ModuleType:
+    """
+    Модуль main.py в рабочем процессе. Если бот запущен командой "python main.py", рабочий процесс при старте
+    уже импортировал его под именем __mp_main__, и повторный импорт создал бы второй экземпляр бота и расписания.
+
+    :return: Модуль с ботом, обработчиками и расписанием
+    """
+    module = sys.modules.get("__mp_main__")
+    if module is not None and hasattr(module, "dp"):
+        return module
+    import main
+    return main
+
+
+def _interrupt(signum: int, frame: Any) -> None:
+    """
+    Обработчик SIGTERM главного процесса: остановка так же, как по Ctrl+C.
+    """
+    raise KeyboardInterrupt
+
+
+def _worker(number: int, queue: multiprocessing.Queue) -> None:
+    """
+    Рабочий процесс: получает обновления из своей очереди и обрабатывает их обработчиками из main.py.
+    Бот, обработчики и расписание создаются при импорте main в этом процессе.
+
+    :param number: Номер процесса
+    :param queue: Очередь обновлений (json Bot API), None - сигнал остановки
+    :return: None
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Остановкой управляет главный процесс
+    main = _bot_module()
+    log_listener = setup_logging(main.settings, number)  # У процесса свой поток записи логов и свой файл логов
+    if main.settings.metrics_port:
+        main.settings.metrics_port += number  # Каждый процесс отдает метрики на своем порту
+    if main.settings.reminders_enabled:  # Каждый процесс напоминает пользователям, чаты которых он обрабатывает
+        main.reminders.owns = lambda user_id: user_id % main.settings.workers == number
+    logging.info("Процесс %d запущен", number)
+    try:
+        asyncio.run(_consume(queue, main.dp, main.bot))
+    finally:
+        main.close_storage()
+        log_listener.stop()
+
+
+async def _consume(queue: multiprocessing.Queue, dispatcher: Dispatcher, bot: Bot) -> None:
+    """
+    Цикл рабочего процесса.
+
+    :param queue: Очередь обновлений
+    :param dispatcher: Обработчик сообщений
+    :param bot: Объект бота
+    :return: None
+    """
+    loop = asyncio.get_running_loop()
+    sequencer = ChatSequencer()
+    await dispatcher.emit_startup(bot=bot)
+    while (data := await loop.run_in_executor(None, queue.get)) is not None:
+        update = Update.model_validate(data, context={"bot": bot})
+        sequencer.submit(chat_id_of(update), dispatcher.feed_update(bot, update))
+    await sequencer.join()
+    await dispatcher.emit_shutdown(bot=bot)
+    await bot.session.close()
+
+
+class UpdateRouter:
+    """
+    Распределение обновлений между рабочими процессами: все обновления одного чата попадают в один процесс
+    (номер процесса - остаток от деления id чата на количество процессов), поэтому диалог обрабатывается по порядку.
+    """
+
+    def __init__(self, workers: int) -> None:
+        """
+        Конструктор. Запускает рабочие процессы.
+
+        :param workers: Количество процессов
+        """
+        context = multiprocessing.get_context("spawn")  # Процессы не наследуют соединения и потоки главного
+        self.queues: list[multiprocessing.Queue] = [context.Queue() for _ in range(workers)]
+        self.processes = [context.Process(target=_worker, args=(number, queue), name=f"bot-worker-{number}")
+                          for number, queue in enumerate(self.queues)]
+        for process in self.processes:
+            process.start()
+
+    def route(self, update: Update, data: dict[str, Any]) -> None:
+        """
+        Отправка обновления в процесс, отвечающий за его чат.
+
+        :param update: Обновление
+        :param data: Обновление в формате json Bot API
+        :return: None
+        """
+        self.queues[chat_id_of(update) % len(self.queues)].put(data)
+
+    def stop(self) -> None:
+        """
+        Остановка процессов после обработки всех отправленных им обновлений.
+
+        :return: None
+        """
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            process.join()
+
+
+async def _poll(bot: Bot, router: UpdateRouter) -> None:
+    """
+    Получение обновлений методом long polling и их распределение между процессами.
+
+    :param bot: Объект бота
+    :param router: Распределитель обновлений
+    :return: None
+    """
+    offset: Optional[int] = None
+    try:
+        while True:
+            for update in await bot.get_updates(offset=offset, timeout=30):
+                router.route(update, update.model_dump(mode="json", exclude_unset=True, by_alias=True))
+                offset = update.update_id + 1
+    finally:
+        await bot.session.close()
+
+
+def _create_routing_app(bot: Bot, router: UpdateRouter, settings: Settings) -> web.Application:
+    """
+    Веб-приложение, которое принимает обновления от Telegram и распределяет их между процессами.
+
+    :param bot: Объект бота
+    :param router: Распределитель обновлений
+    :param settings: Настройки
+    :return: Веб-приложение
+    """
+    async def handle(request: web.Request) -> web.Response:
+        if settings.webhook_secret and \
+                request.headers.get("X-Telegram-Bot-Api-Secret-Token", "") != settings.webhook_secret:
+            return web.Response(status=401)
+        data = await request.json()
+        router.route(Update.model_validate(data, context={"bot": bot}), data)
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_post(settings.webhook_path, handle)
+    if settings.webhook_url:
+        async def register_webhook(_: web.Application) -> None:
+            await bot.set_webhook(settings.webhook_url + settings.webhook_path,
+                                  secret_token=settings.webhook_secret or None)
+        app.on_startup.append(register_webhook)
+
+    async def close_session(_: web.Application) -> None:
+        await bot.session.close()
+    app.on_cleanup.append(close_session)
+    return app
+
+
+def run_cluster(bot: Bot, settings: Settings) -> None:
+    """
+    Запуск бота в settings.workers процессах. Главный процесс получает обновления (long polling или webhook,
+    см. settings.mode) и распределяет их по чатам между рабочими процессами. Процессы работают с общим
+    расписанием, общими датами бронирования и общими листами ожидания в базах данных SQLite (storage = sqlite,
+    waitlist_file).
+
+    :param bot: Объект бота (используется только для получения обновлений)
+    :param settings: Настройки
+    :return: None
+    """
+    if settings.storage != "sqlite":
+        raise ValueError("Для нескольких процессов нужно хранилище расписания sqlite")
+    if not settings.waitlist_file:  # Листы ожидания в памяти процесса не видны другим процессам
+        raise ValueError("Для нескольких процессов нужна база данных листов ожидания (waitlist_file)")
+    router = UpdateRouter(settings.workers)
+    signal.signal(signal.SIGTERM, _interrupt)
+    try:
+        if settings.mode == "webhook":
+            web.run_app(_create_routing_app(bot, router, settings),
+                        host=settings.webhook_host, port=settings.webhook_port)
+        else:
+            try:
+                asyncio.run(_poll(bot, router))
+            except KeyboardInterrupt:
+                pass
+    finally:
+        router.stop()
@@ -1,7 +1,12 @@
+import argparse
 import calendar
 import datetime
-import json
-import random
+import sys
+from typing import Optional, TextIO
+
+import numpy as np
+
+from schedule_index import MAX_SLOTS, format_minutes, parse_date, parse_time
 
 
 class RecordStates:
@@ -13,77 +18,178 @@ class RecordStates:
     not_available = busy_prob + 0.05
 
     @classmethod
-    def state(cls) -> int:
-        cur_state = random.random()
-        if cur_state < cls.free_prob:
-            return 0
-        elif cur_state < cls.busy_prob:
-            return random.randint(1_000_000, 4_000_000)
-        else:
-            return -1
+    def states(cls, rng: np.random.Generator, shape: tuple[int, int]) -> np.ndarray:
+        """
+        Статусы записей, сгенерированные одним вызовом: 0 - свободна, id клиента - занята, -1 - недоступна.
 
+        :param rng: Генератор случайных чисел
+        :param shape: Размер (количество дней, количество записей в дне)
+        :return: Массив статусов
+        """
+        probabilities = rng.random(shape)
+        clients = rng.integers(1_000_000, 4_000_000, size=shape, endpoint=True)
+        return np.where(probabilities < cls.free_prob, 0, np.where(probabilities < cls.busy_prob, clients, -1))
 
-def gen_day_schedule(is_workday: bool, date_range: datetime.timedelta) -> dict[str, int]:
+
+def parse_holidays(values: list[str], first_year: int, last_year: int) -> set[int]:
     """
-    Генерация дня расписания. Каждая запись с вероятностью, описанными в RecordStates, получает статус.
+    Перевод списка праздников в порядковые номера дней. Праздник задается датой "dd.mm.yyyy"
+    или днем "dd.mm", который повторяется каждый год.
 
-    :param is_workday: Является ли день рабочим
-    :param date_range: Сколько дней должны иметь занятые записи
-    :return: Расписание на день
+    :param values: Праздники
+    :param first_year: Первый год расписания
+    :param last_year: Последний год расписания
+    :return: Порядковые номера праздничных дней
+    """
+    holidays: set[int] = set()
+    for value in values:
+        if len(value) == 5:
+            for year in range(first_year, last_year + 1):
+                ordinal = parse_date(f"{value}.{year:04}")
+                if ordinal >= 0:  # 29.02 есть не в каждом году
+                    holidays.add(ordinal)
+            continue
+        ordinal = parse_date(value)
+        if ordinal < 0:
+            raise ValueError(f"Некорректная дата праздника: {value}")
+        holidays.add(ordinal)
+    return holidays
+
+
+class YearLayout:
+    """
+    Общая для всех филиалов часть расписания на год: даты, названия и рабочие дни. Вычисляется один раз,
+    для каждого филиала генерируются только статусы записей.
     """
-    day_schedule = {}
-    if is_workday and date_range.days < 50:
-        for i in range(7):
-            cur_time = datetime.timedelta(hours=10, minutes=90 * i)
-            cur_state = RecordStates.state()
-            day_schedule[f"{cur_time.seconds // 3600:02}:{cur_time.seconds % 3600 // 60:02}"] = cur_state
-    elif is_workday:
-        for i in range(7):
-            cur_time = datetime.timedelta(hours=10, minutes=90 * i)
-            day_schedule[f"{cur_time.seconds // 3600:02}:{cur_time.seconds % 3600 // 60:02}"] = 0
-    else:
-        for i in range(7):
-            cur_time = datetime.timedelta(hours=10, minutes=90 * i)
-            day_schedule[f"{cur_time.seconds // 3600:02}:{cur_time.seconds % 3600 // 60:02}"] = 2
-    return day_schedule
-
-
-def is_workday(day_index: int) -> bool:
+
+    def __init__(self, year: int, holidays: set[int], busy_days: int) -> None:
+        """
+        Конструктор.
+
+        :param year: Год
+        :param holidays: Порядковые номера праздничных дней
+        :param busy_days: Записи в днях раньше чем через busy_days дней от сегодняшнего получают случайный статус,
+            более поздние свободны
+        """
+        self.year: int = year
+        first = datetime.date(year, 1, 1).toordinal()
+        self.ordinals: np.ndarray = np.arange(first, datetime.date(year, 12, 31).toordinal() + 1)
+        week_days = (self.ordinals - 1) % 7  # datetime.date.fromordinal(1) - понедельник
+        self.workdays: np.ndarray = (week_days <= 5) & ~np.isin(self.ordinals, list(holidays))
+        self.random_days: np.ndarray = self.ordinals - datetime.date.today().toordinal() < busy_days
+        # Месяцы: (название, первый и последний+1 номер дня в году)
+        self.months: list[tuple[str, int, int]] = []
+        # Начало json каждого дня, без записей
+        self.day_heads: list[str] = []
+        for month in range(1, 13):
+            start = len(self.day_heads)
+            for day in range(1, calendar.monthrange(year, month)[1] + 1):
+                date = datetime.date(year, month, day)
+                self.day_heads.append(
+                    f'{{"date": "{date:%d.%m.%Y}", "name": "{date:%A}", "week_day": {date.weekday()}, '
+                    f'"is_workday": {"true" if self.workdays[len(self.day_heads)] else "false"}, "records": ')
+            self.months.append((datetime.date(year, month, 1).strftime("%B"), start, len(self.day_heads)))
+
+    def states(self, rng: np.random.Generator, slots_count: int) -> np.ndarray:
+        """
+        Статусы записей на год для одного филиала.
+
+        :param rng: Генератор случайных чисел филиала
+        :param slots_count: Количество записей в дне
+        :return: Массив статусов (день, запись)
+        """
+        states = RecordStates.states(rng, (len(self.ordinals), slots_count))
+        states[~self.random_days] = 0
+        states[~self.workdays] = 2
+        return states
+
+
+def write_schedule(f: TextIO, layouts: list[YearLayout], rng: np.random.Generator, slot_minutes: list[int]) -> None:
     """
-    Проверка, является ли день рабочим. Праздники не учитываются. Не рабочий день - воскресенье.
+    Запись расписания одного филиала в формате json (годы -> месяцы -> дни -> записи) по частям, без построения
+    всего дерева в памяти.
 
-    :param day_index: Номер дня в неделе - 1 (т.е. понедельник = 0, ..., воскресенье = 6)
-    :return: Статус дня
+    :param f: Файл
+    :param layouts: Годы расписания
+    :param rng: Генератор случайных чисел филиала
+    :param slot_minutes: Время записей в минутах от начала дня
+    :return: None
     """
-    return day_index <= 5
-
-
-# Создание расписания
-now = calendar.Calendar()
-new_c = now.yeardayscalendar(2024, width=12)
-schedule = {"2024": {"months": []}}
-for month_index, month in enumerate(new_c[0]):
-    cur_month = {"name": datetime.date(2024, month_index + 1, 1).strftime("%B"), "days": []}
-    for week_index, week in enumerate(month):
-        for day_index, day in enumerate(week):
-            if day == 0:
-                continue
-            date_range = datetime.date(year=2024, month=month_index + 1, day=day) - datetime.date.today()
-            cur_day = {
-                "date": datetime.date(year=2024, month=month_index + 1, day=day).strftime("%d.%m.%Y"),
-                "name": datetime.date(2024, month_index + 1, day).strftime("%A"),
-                "week_day": datetime.date(2024, month_index + 1, day).weekday(),
-                "is_workday": is_workday(day_index),
-                "records": gen_day_schedule(is_workday(day_index), date_range)
-            }
-            cur_month["days"].append(cur_day)
-    schedule["2024"]["months"].append(cur_month)
-
-with open("schedule.json", "w") as f:
-    json.dump(schedule, f, indent=2)
-
-# with open("schedule.json", "r") as f:
-#     data = json.load(f)
-
-# print(data)
-# print(schedule["2024"]["months"][0]["weeks"][0]["days"][0])
+    # Шаблон записей дня: {"10:00": %d, "11:30": %d, ...}
+    records_template = "{" + ", ".join(f'"{format_minutes(minutes)}": %d' for minutes in slot_minutes) + "}}"
+    f.write("{")
+    for year_number, layout in enumerate(layouts):
+        rows = layout.states(rng, len(slot_minutes)).tolist()
+        f.write(f'{"," if year_number else ""}\n"{layout.year}": {{"months": [')
+        for month_number, (name, start, end) in enumerate(layout.months):
+            f.write(f'{"," if month_number else ""}\n{{"name": "{name}", "days": [\n')
+            f.write(",\n".join(layout.day_heads[day] + records_template % tuple(rows[day])
+                               for day in range(start, end)))
+            f.write("]}")
+        f.write("]}")
+    f.write("\n}\n")
+
+
+def output_name(output: str, branch: int, branches: int) -> str:
+    """
+    Имя файла расписания филиала. Если филиал один, используется output. Иначе номер филиала подставляется
+    вместо "{branch}" в output или добавляется перед расширением (schedule.json -> schedule.1.json).
+
+    :param output: Имя файла из аргументов
+    :param branch: Номер филиала, с 1
+    :param branches: Количество филиалов
+    :return: Имя файла
+    """
+    if branches == 1:
+        return output
+    if "{branch}" in output:
+        return output.replace("{branch}", str(branch))
+    stem, dot, extension = output.rpartition(".")
+    return f"{stem}.{branch}.{extension}" if dot else f"{output}.{branch}"
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """
+    Точка входа: генерация расписаний для проверки и нагрузочного тестирования бота.
+
+    :param argv: Аргументы командной строки
+    :return: None
+    """
+    this_year = datetime.date.today().year
+    parser = argparse.ArgumentParser(description="Генерация случайного расписания парикмахерской")
+    parser.add_argument("--first-year", type=int, default=this_year, help="Первый год расписания")
+    parser.add_argument("--last-year", type=int, help="Последний год расписания (по умолчанию равен первому)")
+    parser.add_argument("--branches", type=int, default=1, help="Количество филиалов (по файлу на филиал)")
+    parser.add_argument("--start", default="10:00", help="Время первой записи в дне")
+    parser.add_argument("--step", type=int, default=90, help="Длительность записи в минутах")
+    parser.add_argument("--slots", type=int, default=7, help="Количество записей в дне")
+    parser.add_argument("--holidays", default="",
+                        help="Праздники через запятую: dd.mm.yyyy или dd.mm (каждый год)")
+    parser.add_argument("--busy-days", type=int, default=50,
+                        help="Записи раньше чем через столько дней от сегодняшнего получают случайный статус")
+    parser.add_argument("--seed", type=int, help="Начальное значение генератора случайных чисел")
+    parser.add_argument("--output", default="schedule.json",
+                        help="Файл расписания; для нескольких филиалов номер подставляется вместо {branch}")
+    args = parser.parse_args(argv)
+
+    last_year = args.first_year if args.last_year is None else args.last_year
+    start = parse_time(args.start)
+    if start < 0 or args.step <= 0 or args.slots <= 0 or start + args.step * (args.slots - 1) >= 24 * 60:
+        parser.error("Записи должны помещаться в один день")
+    if args.slots > MAX_SLOTS:
+        parser.error(f"В дне может быть не больше {MAX_SLOTS} записей")
+    if last_year < args.first_year or args.branches <= 0:
+        parser.error("Некорректный диапазон лет или количество филиалов")
+    holidays = parse_holidays([value.strip() for value in args.holidays.split(",") if value.strip()],
+                              args.first_year, last_year)
+
+    slot_minutes = [start + args.step * i for i in range(args.slots)]
+    layouts = [YearLayout(year, holidays, args.busy_days) for year in range(args.first_year, last_year + 1)]
+    # У каждого филиала свой поток случайных чисел: расписание филиала не зависит от количества филиалов
+    for branch, seed in enumerate(np.random.SeedSequence(args.seed).spawn(args.branches), start=1):
+        with open(output_name(args.output, branch, args.branches), "w") as f:
+            write_schedule(f, layouts, np.random.default_rng(seed), slot_minutes)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,307 @@
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Iterator, Optional
+
+
+SNAPSHOT_NAME: str = "snapshot.json"
+SEGMENT_PREFIX: str = "journal."
+SEGMENT_SUFFIX: str = ".log"
+
+
+class BookingJournal:
+    """
+    Журнал изменений расписания (write-ahead log) со снимками.
+
+    Каждое изменение записи дописывается в конец текущего сегмента журнала строкой "день минуты состояние id"
+    (или "день минуты состояние id ресурс", если в журнал пишут расписания нескольких ресурсов) одним системным
+    вызовом write, поэтому после возврата из append изменение переживет аварийное завершение
+    процесса. fsync выполняется пачками фоновым потоком раз в fsync_interval секунд, так что при отключении питания
+    может быть потеряно не больше изменений, чем записано за этот интервал.
+
+    Когда сегмент становится длиннее compact_every строк, журнал переключается на новый сегмент, а снимок
+    расписания на момент переключения записывается в фоне. После записи снимка старые сегменты удаляются.
+    При запуске загружается снимок, после чего применяются сегменты, записанные позже него.
+
+    Один журнал могут вести расписания нескольких ресурсов (мастеров, см. resources.py): у них общие сегменты,
+    поток fsync и поток снимков, а снимок содержит состояния всех ресурсов. Каждое расписание восстанавливает
+    своё состояние (restore) и регистрирует функцию снятия копии (register), после чего журнал открывается
+    один раз (open).
+    """
+
+    def __init__(self, directory: str, fsync_interval: float = 0.05, compact_every: int = 10_000) -> None:
+        """
+        Конструктор. Создает каталог журнала, если его нет. Запись начинается после вызова open.
+
+        :param directory: Каталог для сегментов журнала и снимка
+        :param fsync_interval: Интервал между fsync в секундах
+        :param compact_every: Количество строк в сегменте, после которого делается снимок
+        """
+        self.directory: str = directory
+        self.fsync_interval: float = fsync_interval
+        self.compact_every: int = compact_every
+        os.makedirs(directory, exist_ok=True)
+
+        self._fd: int = -1  # Дескриптор текущего сегмента
+        self._segment: int = 0  # Номер текущего сегмента
+        self._segment_entries: int = 0  # Количество строк в текущем сегменте
+        self._written: int = 0  # Количество записанных строк
+        self._synced: int = 0  # Количество строк, для которых выполнен fsync
+        # Блокировка между потоком fsync и потоком снимков (закрытие дескрипторов), append её не берет
+        self._fd_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._fsync_thread: Optional[threading.Thread] = None
+        self._compactor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal-compact")
+        self._compacting: Optional[Future] = None  # Запись последнего снимка
+        # Ресурс -> функция, которая снимает копию состояния и возвращает функцию её сериализации
+        self._make_snapshots: dict[str, Callable[[], Callable[[], Any]]] = {}
+        # Снимок и изменения после него по ресурсам: читаются при первом вызове restore
+        self._restored: Optional[tuple[dict[str, Any], dict[str, list[tuple[int, int, int, int]]]]] = None
+        self.replayed: int = 0  # Количество изменений, примененных при восстановлении
+
+    def _segment_path(self, number: int) -> str:
+        """
+        Путь к сегменту журнала по его номеру.
+
+        :param number: Номер сегмента
+        :return: Путь к файлу
+        """
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{number:08}{SEGMENT_SUFFIX}")
+
+    def _segments(self) -> list[int]:
+        """
+        Номера сегментов, существующих в каталоге, по возрастанию.
+
+        :return: Номера сегментов
+        """
+        result: list[int] = []
+        for name in os.listdir(self.directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                number = name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]
+                if number.isdecimal():
+                    result.append(int(number))
+        return sorted(result)
+
+    def load_snapshot(self) -> Optional[dict[str, Any]]:
+        """
+        Загрузка последнего снимка.
+
+        :return: Содержимое снимка или None, если снимка нет
+        """
+        try:
+            with open(os.path.join(self.directory, SNAPSHOT_NAME), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def replay(self, first_segment: int = 0) -> Iterator[tuple[int, int, int, int, str]]:
+        """
+        Перебор изменений из сегментов с номерами не меньше first_segment (т.е. не вошедших в снимок).
+        Недописанная последняя строка сегмента (процесс завершился во время записи) пропускается.
+
+        :param first_segment: Номер первого сегмента, не вошедшего в снимок
+        :return: Изменения (день, минуты, состояние, id пользователя, ресурс; "" - строка без ресурса)
+        """
+        for number in self._segments():
+            if number < first_segment:
+                continue
+            with open(self._segment_path(number), "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):  # Строка не была записана до конца
+                        break
+                    fields = line.split()
+                    yield int(fields[0]), int(fields[1]), int(fields[2]), int(fields[3]), \
+                        fields[4].decode() if len(fields) > 4 else ""
+
+    def restore(self, resource: str = "") -> tuple[Optional[dict[str, Any]], list[tuple[int, int, int, int]]]:
+        """
+        Состояние ресурса из последнего снимка и изменения ресурса, записанные после снимка. Снимок и сегменты
+        читаются один раз для всех ресурсов.
+
+        :param resource: Ресурс ("" - расписание, которое ведет журнал одно)
+        :return: Состояние из снимка (None, если в снимке его нет) и изменения: (день, минуты, состояние, id)
+        """
+        if self._restored is None:
+            snapshot = self.load_snapshot()
+            states: dict[str, Any] = {}
+            first_segment = 0
+            if snapshot is not None:
+                # Снимки журнала одного расписания хранят его состояние без ресурсов
+                states = snapshot["state"].get("resources", {"": snapshot["state"]})
+                first_segment = snapshot["segment"]
+            changes: dict[str, list[tuple[int, int, int, int]]] = {}
+            for ordinal, minutes, state, user_id, change_resource in self.replay(first_segment):
+                changes.setdefault(change_resource, []).append((ordinal, minutes, state, user_id))
+                self.replayed += 1
+            self._restored = (states, changes)
+        states, changes = self._restored
+        return states.get(resource), changes.pop(resource, [])
+
+    def register(self, resource: str, make_snapshot: Callable[[], Callable[[], Any]]) -> None:
+        """
+        Регистрация расписания ресурса, которое пишет изменения в журнал.
+
+        :param resource: Ресурс ("" - расписание, которое ведет журнал одно)
+        :param make_snapshot: Функция, которая снимает копию состояния для снимка и возвращает функцию, переводящую
+            эту копию в json-совместимый объект. Копия снимается в потоке, который пишет в журнал, а сериализуется
+            в фоне
+        :return: None
+        """
+        self._make_snapshots[resource] = make_snapshot
+
+    def open(self, compact: bool = False) -> None:
+        """
+        Начало записи (после регистрации всех расписаний): создается новый сегмент, запускается поток fsync.
+        Состояния ресурсов, которые не зарегистрированы, в следующий снимок не попадают.
+
+        :param compact: Сразу сделать снимок (например, если при запуске были применены изменения из журнала)
+        :return: None
+        """
+        self._restored = None  # Восстановление завершено
+        segments = self._segments()
+        for number in segments[:-1]:  # Пустые сегменты остаются после запусков без изменений
+            if os.path.getsize(self._segment_path(number)) == 0:
+                os.remove(self._segment_path(number))
+        self._segment = segments[-1] + 1 if segments else 1
+        self._fd = os.open(self._segment_path(self._segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._fsync_directory()
+        self._fsync_thread = threading.Thread(target=self._fsync_loop, name="journal-fsync", daemon=True)
+        self._fsync_thread.start()
+        if compact:
+            self.compact()
+
+    def append(self, ordinal: int, minutes: int, state: int, user_id: int, resource: str = "") -> None:
+        """
+        Запись изменения в журнал. После возврата изменение находится в файле (в кэше ОС).
+        Если текущий сегмент заполнен, перед записью делается снимок: к этому моменту все предыдущие изменения
+        уже применены к расписанию, поэтому снимок содержит ровно изменения из предыдущих сегментов.
+
+        :param ordinal: Порядковый номер дня
+        :param minutes: Время записи в минутах от начала дня
+        :param state: Новое состояние записи
+        :param user_id: Id пользователя, совершившего изменение (0, если изменение не связано с пользователем)
+        :param resource: Ресурс, расписание которого изменилось ("" - расписание, которое ведет журнал одно)
+        :return: None
+        """
+        if self._segment_entries >= self.compact_every:
+            self.compact()
+        suffix = f" {resource}\n" if resource else "\n"
+        os.write(self._fd, f"{ordinal} {minutes} {state} {user_id}{suffix}".encode())
+        self._written += 1
+        self._segment_entries += 1
+
+    def append_many(self, changes: list[tuple[int, int, int, int]], resource: str = "") -> None:
+        """
+        Запись нескольких изменений в журнал одним системным вызовом write (массовые изменения расписания).
+        Снимок делается до записи, поэтому изменения пачки не разделяются между сегментами.
+
+        :param changes: Изменения: (порядковый номер дня, время в минутах, новое состояние, id пользователя)
+        :param resource: Ресурс, расписание которого изменилось ("" - расписание, которое ведет журнал одно)
+        :return: None
+        """
+        if not changes:
+            return
+        if self._segment_entries >= self.compact_every:
+            self.compact()
+        suffix = f" {resource}\n" if resource else "\n"
+        os.write(self._fd, "".join(f"{ordinal} {minutes} {state} {user_id}{suffix}"
+                                   for ordinal, minutes, state, user_id in changes).encode())
+        self._written += len(changes)
+        self._segment_entries += len(changes)
+
+    def compact(self) -> Future:
+        """
+        Переключение на новый сегмент и запись снимка в фоне. Копия состояния снимается синхронно, до того как
+        в новый сегмент будет что-то записано. Пока пишется предыдущий снимок, новый не начинается: записи
+        продолжаются в текущий сегмент.
+
+        :return: Future, который завершается после записи снимка
+        """
+        if self._compacting is not None and not self._compacting.done():
+            return self._compacting
+        old_fd = self._fd
+        self._segment += 1
+        self._segment_entries = 0
+        self._fd = os.open(self._segment_path(self._segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        serializers = {resource: make_snapshot() for resource, make_snapshot in self._make_snapshots.items()}
+        self._compacting = self._compactor.submit(self._write_snapshot, old_fd, self._segment, serializers)
+        return self._compacting
+
+    def _write_snapshot(self, old_fd: int, segment: int, serializers: dict[str, Callable[[], Any]]) -> None:
+        """
+        Запись снимка (выполняется в фоновом потоке). Снимок пишется во временный файл и атомарно заменяет
+        предыдущий, после чего сегменты, вошедшие в него, удаляются.
+
+        :param old_fd: Дескриптор предыдущего сегмента
+        :param segment: Номер первого сегмента, не вошедшего в снимок
+        :param serializers: Функции сериализации копий состояний: ресурс -> функция
+        :return: None
+        """
+        with self._fd_lock:
+            os.fsync(old_fd)
+            os.close(old_fd)
+        path = os.path.join(self.directory, SNAPSHOT_NAME)
+        with open(path + ".tmp", "w") as f:
+            state = {"resources": {resource: serialize() for resource, serialize in serializers.items()}}
+            json.dump({"segment": segment, "state": state}, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        self._fsync_directory()
+        for number in self._segments():
+            if number < segment:
+                os.remove(self._segment_path(number))
+
+    def _fsync_directory(self) -> None:
+        """
+        fsync каталога журнала, чтобы созданные и переименованные файлы пережили отключение питания.
+
+        :return: None
+        """
+        if os.name != "posix":
+            return
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _fsync_loop(self) -> None:
+        """
+        Цикл фонового потока: раз в fsync_interval выполняет fsync текущего сегмента, если в него что-то записано.
+
+        :return: None
+        """
+        while not self._stop.wait(self.fsync_interval):
+            self.sync()
+
+    def sync(self) -> None:
+        """
+        fsync текущего сегмента, если с прошлого вызова в него что-то записано.
+
+        :return: None
+        """
+        written = self._written
+        if written == self._synced:
+            return
+        with self._fd_lock:
+            if self._fd >= 0:
+                os.fsync(self._fd)
+        self._synced = written
+
+    def close(self) -> None:
+        """
+        Остановка журнала: ожидание записи снимков, последний fsync, закрытие сегмента.
+
+        :return: None
+        """
+        if self._fd < 0:
+            return
+        self._stop.set()
+        if self._fsync_thread is not None:
+            self._fsync_thread.join()
+        self._compactor.shutdown(wait=True)
+        self.sync()
+        os.close(self._fd)
+        self._fd = -1
@@ -0,0 +1,176 @@
+import datetime
+from functools import lru_cache
+
+from aiogram import types
+from aiogram.utils.keyboard import ReplyKeyboardBuilder
+
+# Начальное меню: кнопки "Записаться", "Контакты", "Найти ближайшее свободное" и "Мои записи". Не меняется,
+# поэтому создается один раз
+START_MENU = types.ReplyKeyboardMarkup(
+    keyboard=[
+        [
+            types.KeyboardButton(text="Записаться"),
+            types.KeyboardButton(text="Контакты")
+        ],
+        [
+            types.KeyboardButton(text="Найти ближайшее свободное"),
+            types.KeyboardButton(text="Мои записи")
+        ],
+    ],
+    resize_keyboard=True,
+    input_field_placeholder="Выберите действие"
+)
+
+# Начальное меню, если у парикмахерской несколько филиалов или мастеров: еще кнопка "Филиал и мастер"
+RESOURCES_START_MENU = types.ReplyKeyboardMarkup(
+    keyboard=[
+        *START_MENU.keyboard,
+        [
+            types.KeyboardButton(text="Филиал и мастер")
+        ],
+    ],
+    resize_keyboard=True,
+    input_field_placeholder="Выберите действие"
+)
+
+# Выбор времени суток для поиска ближайшего свободного времени
+SEARCH_WINDOWS_KEYBOARD = types.ReplyKeyboardMarkup(
+    keyboard=[
+        [
+            types.KeyboardButton(text="Утром"),
+            types.KeyboardButton(text="Днем"),
+            types.KeyboardButton(text="Вечером")
+        ],
+        [
+            types.KeyboardButton(text="В любое время"),
+            types.KeyboardButton(text="Меню")
+        ],
+    ],
+    resize_keyboard=True,
+    input_field_placeholder="Когда вам удобно?"
+)
+
+
+# Клавиатуры выбора даты и времени кэшируются по набору дат (времени), который они показывают. Когда состояние
+# записей меняется, меняется и набор, поэтому клавиатура с устаревшим набором больше не запрашивается и со временем
+# вытесняется из кэша. Клавиатуры не изменяются после создания, поэтому одну клавиатуру можно отправлять многим
+# пользователям.
+
+@lru_cache(maxsize=1024)
+def dates_keyboard(days: tuple[datetime.date, ...]) -> types.ReplyKeyboardMarkup:
+    """
+    Клавиатура выбора даты: даты и кнопка "Меню".
+
+    :param days: Дни со свободными записями
+    :return: Клавиатура
+    """
+    builder = ReplyKeyboardBuilder()
+    for day in days:
+        builder.add(types.KeyboardButton(text=day.strftime("%d.%m.%Y")))
+    builder.add(types.KeyboardButton(text="Меню"))
+    builder.adjust(3)
+    return builder.as_markup(resize_keyboard=True)
+
+
+@lru_cache(maxsize=1024)
+def times_keyboard(free_records: tuple[str, ...], wait_slot: str = "") -> types.ReplyKeyboardMarkup:
+    """
+    Клавиатура выбора времени: свободные окна, кнопка "Ждать <запись>" (если задана занятая запись, которую можно
+    ждать), кнопки "Выбрать другую дату" и "Меню".
+
+    :param free_records: Время свободных записей
+    :param wait_slot: Дата и время занятой записи ("dd.mm.yyyy HH:MM") или пустая строка
+    :return: Клавиатура
+    """
+    builder = ReplyKeyboardBuilder()
+    for record_time in free_records:
+        builder.add(types.KeyboardButton(text=record_time))
+    if wait_slot:
+        builder.add(types.KeyboardButton(text=f"Ждать {wait_slot}"))
+    builder.add(types.KeyboardButton(text="Выбрать другую дату"))
+    builder.add(types.KeyboardButton(text="Меню"))
+    builder.adjust(3)
+    return builder.as_markup(resize_keyboard=True)
+
+
+@lru_cache(maxsize=1024)
+def slots_keyboard(slots: tuple[str, ...], has_more: bool) -> types.ReplyKeyboardMarkup:
+    """
+    Клавиатура выбора найденной записи: дата и время записей, кнопки "Показать еще" (если есть следующие записи)
+    и "Меню".
+
+    :param slots: Дата и время свободных записей ("dd.mm.yyyy HH:MM")
+    :param has_more: Есть ли следующие записи
+    :return: Клавиатура
+    """
+    builder = ReplyKeyboardBuilder()
+    for slot in slots:
+        builder.add(types.KeyboardButton(text=slot))
+    if has_more:
+        builder.add(types.KeyboardButton(text="Показать еще"))
+    builder.add(types.KeyboardButton(text="Меню"))
+    builder.adjust(2)
+    return builder.as_markup(resize_keyboard=True)
+
+
+@lru_cache(maxsize=1024)
+def bookings_keyboard(slots: tuple[str, ...]) -> types.ReplyKeyboardMarkup:
+    """
+    Клавиатура записей пользователя: для каждой записи кнопки "Перенести <запись>" и "Отменить <запись>",
+    кнопка "Меню".
+
+    :param slots: Дата и время записей ("dd.mm.yyyy HH:MM")
+    :return: Клавиатура
+    """
+    builder = ReplyKeyboardBuilder()
+    for slot in slots:
+        builder.row(types.KeyboardButton(text=f"Перенести {slot}"), types.KeyboardButton(text=f"Отменить {slot}"))
+    builder.row(types.KeyboardButton(text="Меню"))
+    return builder.as_markup(resize_keyboard=True)
+
+
+@lru_cache(maxsize=1024)
+def offer_keyboard(slot: str) -> types.ReplyKeyboardMarkup:
+    """
+    Клавиатура предложения освободившейся записи из листа ожидания: "Подтвердить <запись>", "Отказаться <запись>".
+
+    :param slot: Дата и время записи ("dd.mm.yyyy HH:MM")
+    :return: Клавиатура
+    """
+    builder = ReplyKeyboardBuilder()
+    builder.add(types.KeyboardButton(text=f"Подтвердить {slot}"))
+    builder.add(types.KeyboardButton(text=f"Отказаться {slot}"))
+    return builder.as_markup(resize_keyboard=True)
+
+
+@lru_cache(maxsize=64)
+def branches_keyboard(branches: tuple[str, ...]) -> types.ReplyKeyboardMarkup:
+    """
+    Клавиатура выбора филиала: "Филиал: <название>" для каждого филиала и кнопка "Меню".
+
+    :param branches: Названия филиалов
+    :return: Клавиатура
+    """
+    builder = ReplyKeyboardBuilder()
+    for branch in branches:
+        builder.add(types.KeyboardButton(text=f"Филиал: {branch}"))
+    builder.add(types.KeyboardButton(text="Меню"))
+    builder.adjust(1)
+    return builder.as_markup(resize_keyboard=True)
+
+
+@lru_cache(maxsize=256)
+def masters_keyboard(masters: tuple[str, ...]) -> types.ReplyKeyboardMarkup:
+    """
+    Клавиатура выбора мастера: "Любой мастер", "Мастер: <имя>" для каждого мастера филиала и кнопка "Меню".
+
+    :param masters: Имена мастеров
+    :return: Клавиатура
+    """
+    builder = ReplyKeyboardBuilder()
+    builder.add(types.KeyboardButton(text="Любой мастер"))
+    for master in masters:
+        builder.add(types.KeyboardButton(text=f"Мастер: {master}"))
+    builder.add(types.KeyboardButton(text="Меню"))
+    builder.adjust(2)
+    return builder.as_markup(resize_keyboard=True)
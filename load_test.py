@@ -0,0 +1,333 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Any, Callable, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.types import ReplyKeyboardMarkup, Update
+
+from bot_mock import MockSession, make_update
+from outbox import Outbox
+from schedule_index import MINUTES_IN_DAY, parse_date, parse_time
+
+
+class FlowSession(MockSession):
+    """
+    Имитация Bot API, которая раскладывает сообщения бота по чатам, чтобы имитируемые пользователи могли
+    читать ответы и нажимать кнопки.
+    """
+
+    def __init__(self, latency: float = 0.0) -> None:
+        """
+        Конструктор.
+
+        :param latency: Имитируемая задержка ответа Bot API в секундах
+        """
+        super().__init__(latency, keep_requests=0)
+        self.replies: defaultdict[int, asyncio.Queue] = defaultdict(asyncio.Queue)  # Сообщения бота по чатам
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[Any], timeout: Optional[int] = None) -> Any:
+        result = await super().make_request(bot, method, timeout)
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is not None:
+            self.replies[chat_id].put_nowait(method)
+        return result
+
+
+class LoadTest:
+    """
+    Нагрузочный тест: имитируемые пользователи одновременно проходят сценарий записи
+    (/start, "Записаться", выбор даты, выбор времени), обновления передаются диспетчеру бота напрямую.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, session: FlowSession, reply_timeout: float = 30.0,
+                 attempts: int = 3, spread: bool = False, seed: Optional[int] = None,
+                 resource_of: Optional[Callable[[int, int], Optional[str]]] = None) -> None:
+        """
+        Конструктор.
+
+        :param dispatcher: Диспетчер бота
+        :param bot: Объект бота (с сессией session)
+        :param session: Имитация Bot API
+        :param reply_timeout: Сколько секунд ждать ответа бота
+        :param attempts: Сколько раз пользователь выбирает другое время, если выбранное заняли
+        :param spread: Выбирать случайные дату и время (иначе - первые предложенные, чтобы пользователи
+            конкурировали за одни и те же записи)
+        :param seed: Начальное значение генератора случайных чисел
+        :param resource_of: Ресурс (мастер), у которого пользователь записан на момент записи, или None, если
+            пользователь не записан ни у одного мастера. По умолчанию - расписание из одного ресурса
+        """
+        self.dispatcher: Dispatcher = dispatcher
+        self.bot: Bot = bot
+        self.session: FlowSession = session
+        self.reply_timeout: float = reply_timeout
+        self.attempts: int = attempts
+        self.spread: bool = spread
+        self.random: random.Random = random.Random(seed)
+        self.resource_of: Callable[[int, int], Optional[str]] = \
+            (lambda chat_id, key: "") if resource_of is None else resource_of
+        self.latencies: list[float] = []  # Время обработки обновлений диспетчером, секунды
+        # Успешные брони: (пользователь, ресурс или None, если бронь не найдена в расписании, дата, время)
+        self.bookings: list[tuple[int, Optional[str], str, str]] = []
+        self.errors: Counter[str] = Counter()  # Незавершенные сценарии по причинам
+        self._update_id: int = 0
+
+    async def feed(self, data: dict[str, Any]) -> None:
+        """
+        Передача обновления диспетчеру с измерением времени обработки.
+
+        :param data: Обновление в формате json Bot API
+        :return: None
+        """
+        update = Update.model_validate(data, context={"bot": self.bot})
+        started = time.perf_counter()
+        await self.dispatcher.feed_update(self.bot, update)
+        self.latencies.append(time.perf_counter() - started)
+
+    async def say(self, chat_id: int, text: str) -> tuple[str, list[str]]:
+        """
+        Сообщение пользователя и ожидание ответа бота. Ответ заканчивается сообщением с клавиатурой,
+        так заканчивается любой ответ бота.
+
+        :param chat_id: Id чата
+        :param text: Текст сообщения
+        :return: Тексты ответа (через перевод строки) и кнопки клавиатуры
+        """
+        self._update_id += 1
+        await self.feed(make_update(self._update_id, chat_id, text))
+        texts = []
+        while True:
+            method = await asyncio.wait_for(self.session.replies[chat_id].get(), self.reply_timeout)
+            texts.append(getattr(method, "text", ""))
+            markup = getattr(method, "reply_markup", None)
+            if isinstance(markup, ReplyKeyboardMarkup):
+                return "\n".join(texts), [button.text for row in markup.keyboard for button in row]
+
+    def pick(self, options: list[str]) -> str:
+        """
+        Выбор кнопки пользователем.
+
+        :param options: Подходящие кнопки
+        :return: Выбранная кнопка
+        """
+        return self.random.choice(options) if self.spread else options[0]
+
+    async def user_flow(self, chat_id: int) -> None:
+        """
+        Сценарий одного пользователя: /start, "Записаться", дата, время.
+
+        :param chat_id: Id пользователя
+        :return: None
+        """
+        try:
+            await self.say(chat_id, "/start")
+            _, buttons = await self.say(chat_id, "Записаться")
+            dates = [text for text in buttons if parse_date(text) >= 0]
+            if not dates:
+                self.errors["no_free_dates"] += 1
+                return
+            date = self.pick(dates)
+            _, buttons = await self.say(chat_id, date)
+            for _ in range(self.attempts):
+                times = [text for text in buttons if parse_time(text) >= 0]
+                if not times:
+                    self.errors["no_free_times"] += 1
+                    return
+                chosen_time = self.pick(times)
+                reply, buttons = await self.say(chat_id, chosen_time)
+                if "вы записаны" in reply:
+                    key = parse_date(date) * MINUTES_IN_DAY + parse_time(chosen_time)
+                    self.bookings.append((chat_id, self.resource_of(chat_id, key), date, chosen_time))
+                    return
+            self.errors["slot_taken"] += 1
+        except asyncio.TimeoutError:
+            self.errors["reply_timeout"] += 1
+
+    async def run_users(self, users: int, concurrency: int, first_chat_id: int) -> None:
+        """
+        Запуск сценариев пользователей.
+
+        :param users: Количество пользователей
+        :param concurrency: Сколько пользователей проходят сценарий одновременно
+        :param first_chat_id: Id первого пользователя
+        :return: None
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited(chat_id: int) -> None:
+            async with semaphore:
+                await self.user_flow(chat_id)
+
+        await asyncio.gather(*(limited(first_chat_id + number) for number in range(users)))
+
+    async def run_updates(self, updates: list[dict[str, Any]]) -> None:
+        """
+        Передача записанных обновлений: обновления одного чата - по порядку, разных чатов - одновременно.
+
+        :param updates: Обновления в формате json Bot API
+        :return: None
+        """
+        by_chat: defaultdict[int, list[dict[str, Any]]] = defaultdict(list)
+        for data in updates:
+            by_chat[data.get("message", {}).get("chat", {}).get("id", 0)].append(data)
+
+        async def chat_flow(chat_updates: list[dict[str, Any]]) -> None:
+            for data in chat_updates:
+                await self.feed(data)
+
+        await asyncio.gather(*(chat_flow(chat_updates) for chat_updates in by_chat.values()))
+
+    def double_bookings(self) -> int:
+        """
+        Количество лишних броней: сколько раз одна запись одного ресурса (мастера) была успешно забронирована больше
+        одного раза. Бронь, которой сразу после ответа бота нет ни у одного мастера, перезаписана другой бронью
+        и тоже считается лишней.
+
+        :return: Количество двойных броней
+        """
+        slots = Counter((resource, date, chosen_time) for _, resource, date, chosen_time in self.bookings
+                        if resource is not None)
+        lost = sum(1 for _, resource, _, _ in self.bookings if resource is None)
+        return sum(count - 1 for count in slots.values()) + lost
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """
+    Перцентиль (ближайший ранг).
+
+    :param values: Значения, по возрастанию
+    :param fraction: Доля (0.5 - медиана)
+    :return: Значение перцентиля или 0, если значений нет
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def memory_usage_kb() -> int:
+    """
+    Занимаемая процессом память (RSS) в килобайтах или 0, если ее не удалось определить.
+
+    :return: Память
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError:
+        return 0
+
+
+def current_commit() -> str:
+    """
+    Текущий коммит git (для сравнения результатов между версиями).
+
+    :return: Хэш коммита или пустая строка
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    """
+    Запуск нагрузочного теста бота из main.py с имитацией Bot API.
+
+    :param args: Аргументы командной строки
+    :return: Результаты
+    """
+    import main  # Импортируется здесь: при импорте читается config.txt и загружается расписание
+    from replay_updates import read_updates
+
+    session = FlowSession(args.api_latency)
+    main.bot.session = session
+    if not args.rate_limit:  # Ограничения частоты Telegram не должны влиять на измерение обработчиков
+        main.outbox = Outbox(main.bot, global_rate=1e9, chat_rate=1e9, chat_burst=1)
+
+    def booked_resource(chat_id: int, key: int) -> Optional[str]:
+        return next((name for name, resource in main.schedule.schedule.resources()
+                     if resource.is_booked_by(chat_id, key)), None)
+
+    test = LoadTest(main.dp, main.bot, session, attempts=args.attempts, spread=args.spread, seed=args.seed,
+                    resource_of=booked_resource)
+
+    memory_before = memory_usage_kb()
+    started = time.perf_counter()
+    try:
+        if args.updates:
+            await test.run_updates(read_updates(args.updates))
+        else:
+            await test.run_users(args.users, args.concurrency, args.first_chat_id)
+        await main.outbox.close()
+        duration = time.perf_counter() - started
+        memory_after = memory_usage_kb()
+    finally:
+        main.schedule.close()
+
+    latencies = sorted(test.latencies)
+    return {
+        "commit": current_commit(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "parameters": {name: value for name, value in vars(args).items() if name != "output"},
+        "storage": main.settings.storage,
+        "updates": len(latencies),
+        "duration_s": round(duration, 4),
+        "throughput_updates_per_s": round(len(latencies) / duration, 1) if duration else 0.0,
+        "latency_ms": {name: round(percentile(latencies, fraction) * 1000, 3)
+                       for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))},
+        "memory_kb": {"before": memory_before, "after": memory_after, "growth": memory_after - memory_before},
+        "bookings": len(test.bookings),
+        "double_bookings": test.double_bookings(),
+        "unfinished": dict(test.errors),
+        "api_requests": session.requests_count,
+        "outbox": main.outbox.stats(),
+    }
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """
+    Точка входа: python load_test.py [--users N] [--concurrency N] [--updates FILE] [--output FILE]
+
+    Запускается в каталоге с config.txt и расписанием, которое можно испортить: брони записываются в хранилище.
+
+    :param argv: Аргументы командной строки
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота без обращения к Telegram")
+    parser.add_argument("--users", type=int, default=100, help="Количество имитируемых пользователей")
+    parser.add_argument("--concurrency", type=int, default=100, help="Сколько пользователей действуют одновременно")
+    parser.add_argument("--first-chat-id", type=int, default=10_000_000, help="Id первого пользователя")
+    parser.add_argument("--attempts", type=int, default=3, help="Сколько раз пользователь выбирает время")
+    parser.add_argument("--spread", action="store_true",
+                        help="Выбирать случайные дату и время (по умолчанию - первые, с конкуренцией за записи)")
+    parser.add_argument("--seed", type=int, help="Начальное значение генератора случайных чисел")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="Имитируемая задержка Bot API в секундах")
+    parser.add_argument("--rate-limit", action="store_true", help="Соблюдать ограничения частоты отправки")
+    parser.add_argument("--updates", help="Файл с записанными обновлениями вместо сценария пользователей")
+    parser.add_argument("--output", help="Файл для результатов в формате json")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,140 @@
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from typing import Optional
+
+from settings import Settings
+
+# Логгеры, которые пишут запись на каждое обновление: их записи уровня INFO и ниже прореживаются (log_sample_every)
+SAMPLED_LOGGERS: tuple[str, ...] = ("aiogram.event",)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Форматирование записи лога одной строкой json: время, уровень, логгер, процесс, сообщение и, если есть,
+    исключение.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        """
+        Форматирование записи.
+
+        :param record: Запись лога
+        :return: Строка json
+        """
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "process": record.processName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Прореживание частых записей: из записей уровня INFO и ниже логгеров loggers пропускается каждая every-я.
+    Предупреждения и ошибки пропускаются всегда.
+    """
+
+    def __init__(self, every: int, loggers: tuple[str, ...] = SAMPLED_LOGGERS) -> None:
+        """
+        Конструктор.
+
+        :param every: Какая по счету запись пропускается (1 - все записи)
+        :param loggers: Имена прореживаемых логгеров
+        """
+        super().__init__()
+        self.every: int = max(every, 1)
+        self.loggers: frozenset[str] = frozenset(loggers)
+        self.dropped: int = 0  # Сколько записей отброшено
+        self._counter: int = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """
+        Проверка, пропускается ли запись.
+
+        :param record: Запись лога
+        :return: Пропускается ли запись
+        """
+        if record.levelno > logging.INFO or record.name not in self.loggers:
+            return True
+        self._counter += 1
+        if self._counter % self.every == 0:
+            return True
+        self.dropped += 1
+        return False
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Постановка записей лога в очередь без форматирования: сообщение форматируется в потоке записи,
+    а не в цикле событий. Очередь - в памяти процесса, поэтому запись передается как есть.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Подготовка записи к постановке в очередь.
+
+        :param record: Запись лога
+        :return: Та же запись
+        """
+        return record
+
+
+def process_filename(filename: str, process_number: Optional[int]) -> str:
+    """
+    Имя файла лога процесса: у рабочих процессов свои файлы (файл с ротацией может писать только один процесс).
+
+    :param filename: Имя файла из настроек
+    :param process_number: Номер рабочего процесса или None для главного процесса
+    :return: Имя файла: "bot.log" -> "bot.1.log" для процесса 1
+    """
+    if process_number is None:
+        return filename
+    root, extension = os.path.splitext(filename)
+    return f"{root}.{process_number}{extension}"
+
+
+def setup_logging(settings: Settings, process_number: Optional[int] = None) -> logging.handlers.QueueListener:
+    """
+    Настройка логов: обработчики бота и aiogram только ставят записи в очередь, а вывод и запись в файл
+    (с ротацией) выполняет фоновый поток. Поэтому вывод логов не задерживает цикл событий.
+
+    :param settings: Настройки
+    :param process_number: Номер рабочего процесса или None для главного процесса
+    :return: Поток записи логов (запущен; при остановке бота вызывается stop, чтобы записать оставшиеся записи)
+    """
+    if settings.log_format == "json":
+        formatter: logging.Formatter = JsonFormatter()
+    elif settings.log_format == "text":
+        formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s %(processName)s: %(message)s")
+    else:
+        raise ValueError(f"Неизвестный формат логов: {settings.log_format}")
+    handlers: list[logging.Handler] = [logging.StreamHandler(sys.stdout)]
+    handlers[0].setFormatter(formatter)
+    if settings.log_file:
+        file_handler = logging.handlers.RotatingFileHandler(
+            process_filename(settings.log_file, process_number), maxBytes=settings.log_max_bytes,
+            backupCount=settings.log_backup_count, encoding="utf-8")
+        file_handler.setFormatter(JsonFormatter())  # В файле - всегда json, для разбора
+        handlers.append(file_handler)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(settings.log_sample_every))  # Отброшенные записи не попадают в очередь
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(getattr(logging, settings.log_level.upper()))
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -1,24 +1,91 @@
 import asyncio
-import logging
-import sys
+import os
+import time
+from typing import Optional
 
-from aiogram import Bot, Dispatcher, types
+from aiogram import Bot, Dispatcher
 from aiogram import F
 from aiogram.client.bot import DefaultBotProperties
 from aiogram.enums import ParseMode
-from aiogram.filters import CommandStart
-from aiogram.types import Message
-from aiogram.utils.keyboard import ReplyKeyboardBuilder
+from aiogram.filters import Command, CommandObject, CommandStart
+from aiogram.fsm.context import FSMContext
+from aiogram.types import FSInputFile, Message
+
+from admin import EXPORT_FORMATS, export_to_file, parse_admins, parse_period
+from audit import AuditLog
+from clock import Clock, ClockMiddleware
+from cluster import run_cluster
+from keyboards import (RESOURCES_START_MENU, SEARCH_WINDOWS_KEYBOARD, START_MENU, bookings_keyboard,
+                       branches_keyboard, dates_keyboard, masters_keyboard, offer_keyboard, slots_keyboard,
+                       times_keyboard)
+from logs import setup_logging
+from metrics import metrics, setup_metrics
+from outbox import Outbox
+from reminders import ReminderScheduler
+from resources import ResourceSchedule
+from schedule_index import ALL_WEEKDAYS, MINUTES_IN_DAY, format_slot_key, parse_slot_key
+from session_store import SessionStorage, SessionStore
+from settings import load_settings
+from storage import create_schedule
+from waitlist import AsyncWaitlist, SqliteWaitlist, Waitlist
+from webhook import run_webhook
+
+
+settings = load_settings("config.txt")  # Получение токена бота и настроек
+bot = Bot(settings.token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))  # Объект бота
+
+# Часы парикмахерской (в её часовом поясе): текущий момент вычисляется один раз на обновление и передается
+# обработчикам аргументом cutoff
+clock = Clock(settings.timezone)
+# Обработчик пришедших сообщений. Состояния диалогов (FSM) брошенных пользователями удаляются по времени и размеру
+dp = Dispatcher(storage=SessionStorage(SessionStore(settings.session_max_size, settings.session_ttl)))
+dp.update.outer_middleware(ClockMiddleware(clock))  # Снимок часов на каждое обновление
+# Очередь исходящих сообщений: обработчики не ждут отправки, частота отправки ограничена (см. Outbox)
+outbox = Outbox(bot, settings.outbox_global_rate, settings.outbox_chat_rate, settings.outbox_chat_burst)
+dp.shutdown.register(outbox.close)  # При остановке бота отправляются все сообщения из очереди
+# Класс для работы с расписанием, в том числе бронирования. Хранилище (json или sqlite) выбирается в настройках
+schedule = create_schedule(settings, clock)
+schedule.audit = AuditLog(settings.audit_file, clock) if settings.audit_file else None  # Журнал аудита изменений броней
+# Филиалы и мастера (если заданы в настройках, см. resources.py) и начальное меню с их выбором
+resources = schedule.schedule if isinstance(schedule.schedule, ResourceSchedule) else None
+menu_keyboard = START_MENU if resources is None else RESOURCES_START_MENU
+# Листы ожидания занятых записей и задачи, отменяющие неподтвержденные предложения записей (см. restore_offers)
+# Запросы к базе данных листов ожидания выполняются в отдельном потоке (см. AsyncWaitlist)
+waitlist = AsyncWaitlist(SqliteWaitlist(settings.waitlist_file, settings.waitlist_max_size) if settings.waitlist_file
+                         else Waitlist(settings.waitlist_max_size))
+offer_timers: set[asyncio.Task] = set()
+admin_ids = parse_admins(settings.admins)  # Пользователи, которым доступны команды менеджера
+
+
+async def is_still_booked(user_id: int, key: int) -> bool:
+    """
+    Проверка перед отправкой напоминания, что запись все еще забронирована пользователем.
 
-from schedule import Schedule
+    :param user_id: Id пользователя
+    :param key: Момент записи
+    :return: Забронирована ли запись пользователем
+    """
+    return await schedule.is_booked_by(user_id, key)
 
 
-with open("config.txt", "r") as f:  # Получение токена бота
-    TOKEN: str = f.readline()
-    bot = Bot(TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))  # Объект бота
+# Напоминания о предстоящих записях (см. start_reminders). Отправляются через очередь исходящих сообщений
+reminders = ReminderScheduler(outbox.send, clock.cutoff, is_still_booked, settings.reminders_batch_size,
+                              enabled=settings.reminders_enabled)
+if settings.metrics_port:  # Метрики (время обработчиков, запросов к Bot API и к расписанию) на GET /metrics
+    setup_metrics(dp, bot, settings, gauges={
+        "bot_booking_sessions": ("Незавершенные брони (выбрана дата)", lambda: len(schedule.schedule.booking_dates)),
+        "bot_waitlist_users": ("Пользователи в листах ожидания", lambda: waitlist.waiting),
+        "bot_reminders_pending": ("Запланированные напоминания", lambda: len(reminders.wheel)),
+    }, session_stores={"dialogs": dp.storage.store, "booking_dates": schedule.schedule.booking_dates},
+        outbox_stats=outbox.stats)
 
-dp = Dispatcher()  # Обработчик пришедших сообщений
-schedule = Schedule("schedule.json")  # Класс для работы с расписанием, в том числе бронирования
+# Время суток для поиска ближайшего свободного времени: кнопка -> (начало, конец) в минутах от начала дня
+SEARCH_WINDOWS: dict[str, tuple[int, int]] = {
+    "утром": (0, 12 * 60),
+    "днем": (12 * 60, 17 * 60),
+    "вечером": (17 * 60, MINUTES_IN_DAY),
+    "в любое время": (0, MINUTES_IN_DAY),
+}
 
 
 @dp.message(F.text.lower() == "контакты")
@@ -31,100 +98,202 @@ async def show_contacts_handler(message: Message) -> None:
     """
     # Вывод контактов
     contact_info: str = "Мы находимся по адресу: г. A, улица B, дом X.\nНаши контакты: +x(xxx)xxx-xx-xx"
-    await message.answer(contact_info)
+    outbox.send(message.chat.id, contact_info)
     await show_start_menu(message.chat.id)  # Возвращение на меню действий
 
 
 @dp.message(CommandStart())
-async def command_start_handler(message: Message) -> None:
+async def command_start_handler(message: Message, state: FSMContext) -> None:
     """
     Обработчик команды /start
 
     :param message: Пришедшее сообщение
+    :param state: Состояние диалога
     :return: None
     """
     # Очистка даты бронирования (если пользователь осуществлял бронирование, после чего написал /start
-    schedule.reset_booking_date(message.chat.id)
+    await schedule.reset_booking_date(message.chat.id)
+    await state.clear()  # Очистка параметров поиска свободного времени
     # Вывод приветствия
     start_message: str = "Здравствуйте! Это бот для записи в парикмахерскую N."
-    await message.answer(start_message)
+    outbox.send(message.chat.id, start_message)
     # Вывод меню действий
     await show_start_menu(message.chat.id)
 
 
 @dp.message(F.text.lower() == "меню")
-async def show_contacts_handler(message: Message) -> None:
+async def show_menu_handler(message: Message, state: FSMContext) -> None:
     """
     Обработчик сообщения "Меню". Возвращает пользователя на меню действий
 
     :param message: Сообщение, пришедшее от пользователя
+    :param state: Состояние диалога
     :return: None
     """
-    schedule.reset_booking_date(message.chat.id)  # Освобождение переменной, хранящей выбранную дату записи
+    await schedule.reset_booking_date(message.chat.id)  # Освобождение переменной, хранящей выбранную дату записи
+    await state.clear()  # Очистка параметров поиска свободного времени
     # Вывод контактов
     await show_start_menu(message.chat.id)  # Возвращение на меню действий
 
 
 async def show_start_menu(chat_id: int) -> None:
     """
-    Функция отображает начальные кнопки: "Записаться" и "Контакты", а также пишет приглашение ко вводу.
+    Функция отображает начальные кнопки: "Записаться", "Контакты", "Найти ближайшее свободное" и "Мои записи",
+    а также пишет приглашение ко вводу.
 
     :param chat_id: Id чата, где необходимо вывести кнопки
     :return: None
     """
-    # Создание кнопок клавиатуры
-    kb = [
-        [
-            types.KeyboardButton(text="Записаться"),
-            types.KeyboardButton(text="Контакты")
-        ],
-    ]
-    # Создание клавиатуры
-    keyboard = types.ReplyKeyboardMarkup(
-        keyboard=kb,
-        resize_keyboard=True,
-        input_field_placeholder="Выберите действие"
-    )
-    # Отправка сообщения с приглашением, отображение клавиатуры
-    await bot.send_message(chat_id, "Пожалуйста, выберите действие", reply_markup=keyboard)
+    # Отправка сообщения с приглашением, отображение клавиатуры (создана один раз при запуске)
+    outbox.send(chat_id, "Пожалуйста, выберите действие", reply_markup=menu_keyboard)
 
 
 @dp.message(F.text.lower().in_({"записаться", "выбрать другую дату"}))
-async def choose_date_handler(message: Message) -> None:
+async def choose_date_handler(message: Message, state: FSMContext, cutoff: int) -> None:
     """
     Обработчик сообщения о решении записаться. Вызывает функцию для выбора даты.
 
     :param message: Пришедшее сообщение
+    :param state: Состояние диалога
+    :param cutoff: Текущий момент (снимок часов на обновление, см. clock.ClockMiddleware)
     :return: None
     """
-    await choose_date(message.chat.id)  # Функция выбора даты
+    if message.text.lower() == "записаться":  # Новая запись, а не перенос
+        await state.clear()
+    await choose_date(message.chat.id, cutoff)  # Функция выбора даты
 
 
-async def choose_date(chat_id: int) -> None:
+async def choose_date(chat_id: int, cutoff: int) -> None:
     """
     Функция выбора даты. Отображает среди ближайших 7 дней те, на которые есть свободные записи.
     Пишет приглашение для ввода.
 
     :param chat_id: Id чата, в котором происходит выбор даты
+    :param cutoff: Текущий момент, вычисленный для обрабатываемого сообщения
+    :return: None
+    """
+    await schedule.reset_booking_date(chat_id)  # Освобождение переменной, хранящей выбранную дату записи
+
+    # Выбор подходящих дат
+    closest_free_days = await schedule.get_closest_free_dates(chat_id, 7, cutoff)
+    # Отправка сообщения с клавиатурой дат (клавиатура для того же набора дат берется из кэша)
+    selected = "" if resources is None else f"Запись: {resources.selection_name(chat_id)}\n"
+    outbox.send(chat_id, selected + "Выберите дату или напишите желаемую в формате: dd.mm.yyyy",
+                reply_markup=dates_keyboard(tuple(closest_free_days)))
+
+
+@dp.message(F.text.lower() == "найти ближайшее свободное")
+async def find_free_handler(message: Message) -> None:
+    """
+    Обработчик сообщения "Найти ближайшее свободное". Предлагает выбрать удобное время суток.
+
+    :param message: Пришедшее сообщение
+    :return: None
+    """
+    await schedule.reset_booking_date(message.chat.id)
+    outbox.send(message.chat.id, "Когда вам удобно?", reply_markup=SEARCH_WINDOWS_KEYBOARD)
+
+
+@dp.message(F.text.lower().in_(SEARCH_WINDOWS))
+async def chosen_window_handler(message: Message, state: FSMContext, cutoff: int) -> None:
+    """
+    Обработчик выбранного времени суток. Запоминает его в состоянии диалога и показывает первую страницу
+    ближайших свободных записей.
+
+    :param message: Пришедшее сообщение
+    :param state: Состояние диалога
+    :param cutoff: Текущий момент (снимок часов на обновление, см. clock.ClockMiddleware)
+    :return: None
+    """
+    time_from, time_to = SEARCH_WINDOWS[message.text.lower()]
+    await state.set_data({"time_from": time_from, "time_to": time_to})
+    await show_free_slots(message.chat.id, state, cutoff)
+
+
+@dp.message(F.text.lower() == "показать еще")
+async def more_slots_handler(message: Message, state: FSMContext, cutoff: int) -> None:
+    """
+    Обработчик сообщения "Показать еще". Показывает следующую страницу свободных записей.
+
+    :param message: Пришедшее сообщение
+    :param state: Состояние диалога
+    :param cutoff: Текущий момент (снимок часов на обновление, см. clock.ClockMiddleware)
+    :return: None
+    """
+    data = await state.get_data()
+    if "time_from" not in data:  # Поиск не начат (например, состояние удалено по времени)
+        await find_free_handler(message)
+        return
+    await show_free_slots(message.chat.id, state, cutoff, data.get("after"))
+
+
+async def show_free_slots(chat_id: int, state: FSMContext, cutoff: int, after: Optional[int] = None) -> None:
+    """
+    Функция показывает страницу ближайших свободных записей в выбранное время суток на settings.search_days дней
+    вперед. Момент последней показанной записи сохраняется в состоянии диалога: с него начинается следующая
+    страница.
+
+    :param chat_id: Id чата
+    :param state: Состояние диалога (с выбранным временем суток)
+    :param cutoff: Текущий момент, вычисленный для обрабатываемого сообщения
+    :param after: Момент последней записи предыдущей страницы или None для первой страницы
     :return: None
     """
-    schedule.reset_booking_date(chat_id)  # Освобождение переменной, хранящей выбранную дату записи
+    data = await state.get_data()
+    today = cutoff // MINUTES_IN_DAY
+    # Запрашивается на одну запись больше страницы, чтобы узнать, есть ли следующая страница
+    slots = await schedule.find_free_slots(chat_id, today, today + settings.search_days, data["time_from"],
+                                           data["time_to"], settings.search_page_size + 1, after, cutoff)
+    if not slots:
+        outbox.send(chat_id, "К сожалению, в это время свободных записей не найдено. Выберите другое время суток.",
+                    reply_markup=SEARCH_WINDOWS_KEYBOARD)
+        return
+    page = slots[:settings.search_page_size]
+    await state.update_data(after=page[-1])
+    outbox.send(chat_id, "Ближайшие свободные записи. Выберите подходящую",
+                reply_markup=slots_keyboard(tuple(format_slot_key(key) for key in page),
+                                            len(slots) > len(page)))
 
-    closest_free_days = schedule.get_closest_dates(7, schedule.date_have_free_records)  # Выбор подходящих дат
-    # Создание клавиатуры с датами
-    builder = ReplyKeyboardBuilder()
-    for day in closest_free_days:
-        builder.add(types.KeyboardButton(text=str(day["date"])))
-    builder.add(types.KeyboardButton(text="Меню"))
-    builder.adjust(3)
-    # Отправка сообщения
-    await bot.send_message(chat_id=chat_id,
-                           text="Выберите дату или напишите желаемую в формате: dd.mm.yyyy",
-                           reply_markup=builder.as_markup(resize_keyboard=True))
+
+@dp.message(F.text.regexp(r'\d\d\.\d\d\.\d\d\d\d \d\d:\d\d$'))
+async def chosen_slot_handler(message: Message, state: FSMContext, cutoff: int) -> None:
+    """
+    Обработчик записи, выбранной в поиске ближайшего свободного времени: сообщения вида 'dd.mm.yyyy HH:MM'.
+    Регистрируется раньше обработчика даты, который принял бы такое сообщение за дату. Бронирует запись так же,
+    как выбор даты и времени. Если дата и время некорректны, в прошлом или на них нельзя записаться, либо запись
+    уже заняли, показывает свободные записи заново.
+
+    :param message: Пришедшее сообщение
+    :param state: Состояние диалога
+    :param cutoff: Текущий момент (снимок часов на обновление, см. clock.ClockMiddleware)
+    :return: None
+    """
+    str_date, str_time = message.text.split()
+    replaces = (await state.get_data()).get("reschedule")  # Переносимая запись, если пользователь переносит запись
+    key = parse_slot_key(message.text)
+    # Некорректные или прошедшие дата и время, а также отсутствующая или закрытая запись - ошибка ввода,
+    # а не конфликт броней
+    if key <= cutoff or not await schedule.set_booking_date(message.chat.id, str_date, cutoff):
+        invalid = True
+    elif await schedule.try_book_record(message.chat.id, str_time, cutoff, replaces):
+        await finish_booking(message.chat.id, state, key, replaces, cutoff)
+        return
+    else:
+        invalid = await schedule.get_slot_state(message.chat.id, key) < 0
+    if invalid:
+        metrics.inc("bot_bookings_total", result="invalid")
+        outbox.send(message.chat.id, "Упс... Кажется, на это время записаться нельзя. Выберите другое")
+    else:  # Запись заняли
+        metrics.inc("bot_bookings_total", result="conflict")
+        outbox.send(message.chat.id, "К сожалению, нельзя записаться на данное время. Выберите другое")
+    await schedule.reset_booking_date(message.chat.id)
+    if "time_from" not in await state.get_data():
+        await state.update_data(time_from=0, time_to=MINUTES_IN_DAY)
+    await show_free_slots(message.chat.id, state, cutoff)
 
 
 @dp.message(F.text.regexp(r'\d\d\.\d\d\.\d\d\d\d'))
-async def chosen_date_handler(message: Message) -> None:
+async def chosen_date_handler(message: Message, cutoff: int) -> None:
     """
     Функция обработки сообщения с выбранной датой. Датой считается любое сообщение в формате:
     '[0-9][0-9].[0-9][0-9].[0-9][0-9][0-9][0-9]'.
@@ -132,78 +301,504 @@ async def chosen_date_handler(message: Message) -> None:
     Если дата корректна, перенаправляет на выбор времени.
 
     :param message: Пришедшее сообщение.
+    :param cutoff: Текущий момент (снимок часов на обновление, см. clock.ClockMiddleware)
     :return: None
     """
-    if not schedule.set_booking_date(message.chat.id, message.text):  # Если не удалось установить дату записи
-        await message.answer("Упс... Кажется, на эту дату записаться нельзя.")  # Вывод ошибки
-        await choose_date(message.chat.id)  # Перенаправление на выбор даты
+    # Если не удалось установить дату записи
+    if not await schedule.set_booking_date(message.chat.id, message.text, cutoff):
+        outbox.send(message.chat.id, "Упс... Кажется, на эту дату записаться нельзя.")  # Вывод ошибки
+        await choose_date(message.chat.id, cutoff)  # Перенаправление на выбор даты
         return
-    await choose_time(message.chat.id)  # Перенаправление на выбор времени
+    await choose_time(message.chat.id, cutoff)  # Перенаправление на выбор времени
 
 
-async def choose_time(chat_id: int) -> None:
+async def choose_time(chat_id: int, cutoff: int, wait_slot: str = "") -> None:
     """
     Функция выбора времени. Находит свободные окна в выбранную пользователем дату и выводит их на экран.
     Если свободные окна не найдены, выводит сообщение об ошибке. Перенаправляет на выбор даты.
     Если время успешно выбрано, перенаправляет на функцию бронирования.
 
     :param chat_id: Id чата, где ведется бронирование
+    :param cutoff: Текущий момент, вычисленный для обрабатываемого сообщения
+    :param wait_slot: Занятая запись ("dd.mm.yyyy HH:MM"), в лист ожидания которой можно встать, или пустая строка
     :return: None
     """
-    free_records = schedule.get_date_records(chat_id, schedule.free_record)  # Поиск свободных окон в выбранный день
+    # Поиск свободных окон в выбранный день
+    free_records = await schedule.get_free_records(chat_id, cutoff)
+    if not free_records and wait_slot:  # Свободных окон нет, но можно встать в лист ожидания
+        outbox.send(chat_id, "В этот день нет свободных записей. Можно встать в лист ожидания или выбрать другую дату",
+                    reply_markup=times_keyboard((), wait_slot))
+        return
     if not free_records:  # Окна не найдены
         # Вывод сообщения об ошибке
-        await bot.send_message(chat_id,
-                               "К сожалению, в этот день нет свободных записей. Пожалуйста, выберите другую дату.")
-        await choose_date(chat_id)  # Перенаправление на выбор даты
-        return
-    # Создание клавиатуры со свободными окнами в этот день
-    builder = ReplyKeyboardBuilder()
-    for record_time in free_records:
-        builder.add(types.KeyboardButton(text=record_time))
-    builder.add(types.KeyboardButton(text="Выбрать другую дату"))
-    builder.add(types.KeyboardButton(text="Меню"))
-    builder.adjust(3)
-    # Отправка ответа пользователю
-    await bot.send_message(chat_id,
-                           "Выберите время из предложенных",
-                           reply_markup=builder.as_markup(resize_keyboard=True),
-                           )
+        outbox.send(chat_id, "К сожалению, в этот день нет свободных записей. Пожалуйста, выберите другую дату.")
+        await choose_date(chat_id, cutoff)  # Перенаправление на выбор даты
+        return
+    # Отправка ответа пользователю с клавиатурой свободных окон (из кэша, если набор окон не изменился)
+    outbox.send(chat_id, "Выберите время из предложенных", reply_markup=times_keyboard(tuple(free_records), wait_slot))
 
 
 @dp.message(F.text.regexp(r'\d\d\:\d\d'))
-async def chosen_time_handler(message: Message) -> None:
+async def chosen_time_handler(message: Message, state: FSMContext, cutoff: int) -> None:
     """
     Обработчик выбранного времени. Временем считается любое сообщение вида '[0-9][0-9]:[0-9][0-9]'.
     Проверяет корректность выбранного времени. Если выбранное время находится в будущем и оно свободно, то бронирует его.
-    Иначе выводит сообщение об ошибке, перенаправляет на выбор времени.
+    Иначе выводит сообщение об ошибке, перенаправляет на выбор времени. Если пользователь переносит запись,
+    старая запись освобождается вместе с бронированием новой.
 
     :param message: Пришедшее сообщение
+    :param state: Состояние диалога
+    :param cutoff: Текущий момент (снимок часов на обновление, см. clock.ClockMiddleware)
     :return: None
     """
-    if not schedule.is_booking_date_set(message.chat.id):  # Если не установлена дата записи
+    replaces = (await state.get_data()).get("reschedule")  # Переносимая запись, если пользователь переносит запись
+    if not await schedule.is_booking_date_set(message.chat.id):  # Если не установлена дата записи
         # Вывод сообщения об ошибке, перенаправление на выбор даты
-        await message.answer("Упс... Почему-то не выбрана дата. Попробуйте еще раз")
-        await choose_date(message.chat.id)
+        metrics.inc("bot_bookings_total", result="invalid")
+        outbox.send(message.chat.id, "Упс... Почему-то не выбрана дата. Попробуйте еще раз")
+        await choose_date(message.chat.id, cutoff)
     elif not schedule.is_time_correct(message.text):  # Если выбранное время не существует вообще (например 25:61)
         # Вывод сообщения об ошибке, перенаправление на выбор времени
-        await message.answer("Хмм... Такого времени не существует")
-        await choose_time(message.chat.id)
-    elif not schedule.is_record_free(message.chat.id, message.text):  # Если выбранное окно занято
+        metrics.inc("bot_bookings_total", result="invalid")
+        outbox.send(message.chat.id, "Хмм... Такого времени не существует")
+        await choose_time(message.chat.id, cutoff)
+    # Бронирование окна. Проверка, что окно свободно, и бронирование выполняются атомарно
+    elif not await schedule.try_book_record(message.chat.id, message.text, cutoff, replaces):  # Окно занято
         # Вывод сообщения об ошибке, перенаправление на выбор времени
-        await message.answer("К сожалению, нельзя записаться на данное время. Выберите другое")
-        await choose_time(message.chat.id)
+        metrics.inc("bot_bookings_total", result="conflict")
+        # Если окно занято другим пользователем, можно встать в его лист ожидания
+        key = await schedule.booking_key(message.chat.id, message.text)
+        owner = await schedule.get_slot_state(message.chat.id, key) if key > cutoff else 0
+        wait_slot = format_slot_key(key) if owner > 0 and owner != message.chat.id else ""
+        outbox.send(message.chat.id, "К сожалению, нельзя записаться на данное время. Выберите другое")
+        await choose_time(message.chat.id, cutoff, wait_slot)
     else:  # Иначе все хорошо
-        schedule.book_record(message.chat.id, message.text)  # Бронирование окна
-        schedule.reset_booking_date(message.chat.id)  # Сброс даты бронирования, для следующих броней
-        await message.answer("Поздравляю, вы записаны!")  # Поздравительное сообщение
-        await show_start_menu(message.chat.id)  # Возвращение к начальному меню
+        key = await schedule.booking_key(message.chat.id, message.text)
+        await finish_booking(message.chat.id, state, key, replaces, cutoff)
+
+
+async def finish_booking(chat_id: int, state: FSMContext, key: int, replaces: Optional[int], cutoff: int) -> None:
+    """
+    Завершение успешного бронирования: сброс даты бронирования и состояния диалога, поздравление, возвращение
+    к начальному меню, планирование напоминаний. При переносе освободившаяся старая запись предлагается
+    листу ожидания её мастера (запомнен в состоянии диалога, см. reschedule_handler).
+
+    :param chat_id: Id чата
+    :param state: Состояние диалога
+    :param key: Момент забронированной записи
+    :param replaces: Момент освобожденной записи (при переносе) или None
+    :param cutoff: Текущий момент, вычисленный для обрабатываемого сообщения
+    :return: None
+    """
+    metrics.inc("bot_bookings_total", result="success")
+    await schedule.reset_booking_date(chat_id)  # Сброс даты бронирования, для следующих броней
+    replaced_resource = (await state.get_data()).get("reschedule_resource", "")  # Мастер переносимой записи
+    await state.clear()
+    outbox.send(chat_id, "Поздравляю, вы записаны!" if replaces is None else "Запись перенесена!")
+    await show_start_menu(chat_id)  # Возвращение к начальному меню
+    reminders.add(chat_id, key)
+    if replaces is not None:
+        reminders.cancel(chat_id, replaces)
+        await waitlist.close_offer(replaced_resource, replaces, chat_id)
+        await offer_released_slot(replaced_resource, replaces, cutoff)
+
+
+@dp.message(F.text.lower() == "филиал и мастер")
+async def choose_branch_handler(message: Message) -> None:
+    """
+    Обработчик сообщения "Филиал и мастер". Показывает текущий выбор и предлагает выбрать филиал (если филиал
+    один - сразу мастера).
+
+    :param message: Пришедшее сообщение
+    :return: None
+    """
+    if resources is None:  # Филиалы и мастера не заданы
+        await show_start_menu(message.chat.id)
+        return
+    await schedule.reset_booking_date(message.chat.id)
+    branches = resources.branch_names()
+    if len(branches) == 1:
+        await choose_master(message.chat.id, 0)
+        return
+    outbox.send(message.chat.id, f"Сейчас выбрано: {resources.selection_name(message.chat.id)}. Выберите филиал",
+                reply_markup=branches_keyboard(branches))
+
+
+@dp.message(F.text.startswith("Филиал: "))
+async def chosen_branch_handler(message: Message, state: FSMContext) -> None:
+    """
+    Обработчик выбранного филиала: сообщения вида "Филиал: <название>". Запоминает филиал в состоянии диалога
+    и предлагает выбрать мастера.
+
+    :param message: Пришедшее сообщение
+    :param state: Состояние диалога
+    :return: None
+    """
+    branches = () if resources is None else resources.branch_names()
+    name = message.text[len("Филиал: "):]
+    if name not in branches:
+        outbox.send(message.chat.id, "Такого филиала нет")
+        await show_start_menu(message.chat.id)
+        return
+    await state.set_data({"branch": branches.index(name)})
+    await choose_master(message.chat.id, branches.index(name))
+
+
+async def choose_master(chat_id: int, branch: int) -> None:
+    """
+    Функция выбора мастера филиала.
+
+    :param chat_id: Id чата
+    :param branch: Номер филиала
+    :return: None
+    """
+    outbox.send(chat_id, f"Филиал {resources.branch_names()[branch]}. Выберите мастера",
+                reply_markup=masters_keyboard(resources.master_names(branch)))
+
+
+@dp.message(F.text.startswith("Мастер: ") | (F.text.lower() == "любой мастер"))
+async def chosen_master_handler(message: Message, state: FSMContext) -> None:
+    """
+    Обработчик выбранного мастера: сообщения вида "Мастер: <имя>" или "Любой мастер". Запоминает выбор филиала
+    и мастера: дальше даты и время показываются и бронируются в расписании выбранного мастера или, если подходит
+    любой мастер, в общем расписании филиала.
+
+    :param message: Пришедшее сообщение
+    :param state: Состояние диалога
+    :return: None
+    """
+    if resources is None:
+        await show_start_menu(message.chat.id)
+        return
+    branch = (await state.get_data()).get("branch", resources.selection(message.chat.id)[0])
+    masters = resources.master_names(branch)
+    name = message.text[len("Мастер: "):] if message.text.startswith("Мастер: ") else ""
+    if name and name not in masters:
+        outbox.send(message.chat.id, "Такого мастера нет")
+        await choose_master(message.chat.id, branch)
+        return
+    resources.select(message.chat.id, branch, masters.index(name) if name else -1)
+    await state.clear()
+    outbox.send(message.chat.id, f"Выбрано: {resources.selection_name(message.chat.id)}")
+    await show_start_menu(message.chat.id)
+
+
+@dp.message(F.text.lower() == "мои записи")
+async def my_bookings_handler(message: Message, state: FSMContext, cutoff: int) -> None:
+    """
+    Обработчик сообщения "Мои записи". Выводит записи пользователя в будущем с кнопками переноса и отмены.
+
+    :param message: Пришедшее сообщение
+    :param state: Состояние диалога
+    :param cutoff: Текущий момент (снимок часов на обновление, см. clock.ClockMiddleware)
+    :return: None
+    """
+    await state.clear()  # Прерывание начатого переноса
+    keys = await schedule.get_user_bookings(message.chat.id, cutoff)
+    if not keys:
+        outbox.send(message.chat.id, "У вас нет предстоящих записей")
+        await show_start_menu(message.chat.id)
+        return
+    slots = tuple(format_slot_key(key) for key in keys)
+    outbox.send(message.chat.id, "Ваши записи:\n" + "\n".join(slots), reply_markup=bookings_keyboard(slots))
+
+
+@dp.message(F.text.regexp(r'Отменить \d\d\.\d\d\.\d\d\d\d \d\d:\d\d$'))
+async def cancel_booking_handler(message: Message, cutoff: int) -> None:
+    """
+    Обработчик отмены записи: сообщения вида 'Отменить dd.mm.yyyy HH:MM'. Освободившаяся запись сразу становится
+    свободной для всех и предлагается первому из листа ожидания этой записи у её мастера.
+
+    :param message: Пришедшее сообщение
+    :param cutoff: Текущий момент (снимок часов на обновление, см. clock.ClockMiddleware)
+    :return: None
+    """
+    key = parse_slot_key(message.text[len("Отменить "):])
+    resource = await schedule.cancel_booking(message.chat.id, key, cutoff) if key >= 0 else None
+    if resource is None:
+        outbox.send(message.chat.id, "Не удалось отменить запись: её нет среди ваших предстоящих записей")
+        await show_start_menu(message.chat.id)
+        return
+    await waitlist.close_offer(resource, key, message.chat.id)
+    reminders.cancel(message.chat.id, key)
+    outbox.send(message.chat.id, f"Запись на {format_slot_key(key)} отменена")
+    await show_start_menu(message.chat.id)
+    await offer_released_slot(resource, key, cutoff)
+
+
+@dp.message(F.text.regexp(r'Перенести \d\d\.\d\d\.\d\d\d\d \d\d:\d\d$'))
+async def reschedule_handler(message: Message, state: FSMContext, cutoff: int) -> None:
+    """
+    Обработчик переноса записи: сообщения вида 'Перенести dd.mm.yyyy HH:MM'. Запоминает переносимую запись
+    и её мастера в состоянии диалога и перенаправляет на выбор даты; старая запись освобождается, когда
+    забронирована новая.
+
+    :param message: Пришедшее сообщение
+    :param state: Состояние диалога
+    :param cutoff: Текущий момент (снимок часов на обновление, см. clock.ClockMiddleware)
+    :return: None
+    """
+    key = parse_slot_key(message.text[len("Перенести "):])
+    resource = await schedule.booked_resource(message.chat.id, key) if key > cutoff else None
+    if resource is None:
+        outbox.send(message.chat.id, "Не удалось перенести запись: её нет среди ваших предстоящих записей")
+        await show_start_menu(message.chat.id)
+        return
+    await state.set_data({"reschedule": key, "reschedule_resource": resource})
+    outbox.send(message.chat.id, f"Выберите новое время вместо {format_slot_key(key)}")
+    await choose_date(message.chat.id, cutoff)
+
+
+@dp.message(F.text.regexp(r'Ждать \d\d\.\d\d\.\d\d\d\d \d\d:\d\d$'))
+async def join_waitlist_handler(message: Message, state: FSMContext, cutoff: int) -> None:
+    """
+    Обработчик постановки в лист ожидания: сообщения вида 'Ждать dd.mm.yyyy HH:MM'. Если запись уже освободилась,
+    она сразу бронируется. Иначе пользователь встает в листы ожидания записи у всех мастеров выбранного им
+    расписания, у которых она занята.
+
+    :param message: Пришедшее сообщение
+    :param state: Состояние диалога
+    :param cutoff: Текущий момент (снимок часов на обновление, см. clock.ClockMiddleware)
+    :return: None
+    """
+    key = parse_slot_key(message.text[len("Ждать "):])
+    states = await schedule.slot_states(message.chat.id, key) if key > cutoff else []
+    if any(owner == 0 for _, owner in states) and await schedule.book_slot(message.chat.id, key, cutoff):
+        await finish_booking(message.chat.id, state, key, None, cutoff)
+        return
+    taken = [resource for resource, owner in states if owner > 0]
+    position = await waitlist.join(taken, key, message.chat.id, cutoff) \
+        if all(owner != message.chat.id for _, owner in states) else 0
+    if position:
+        outbox.send(message.chat.id, f"Вы в листе ожидания записи на {format_slot_key(key)}, место {position}. "
+                                     f"Если запись освободится, мы предложим её вам.")
+    else:
+        outbox.send(message.chat.id, "К сожалению, встать в лист ожидания этой записи нельзя")
+    await schedule.reset_booking_date(message.chat.id)
+    await show_start_menu(message.chat.id)
+
+
+async def offer_released_slot(resource: str, key: int, cutoff: int) -> None:
+    """
+    Функция предлагает освободившуюся запись первому пользователю из её листа ожидания у мастера, у которого
+    она освободилась: запись бронируется на него у этого мастера, и он должен подтвердить бронь
+    за settings.waitlist_timeout секунд (см. expire_offer).
+
+    :param resource: Ресурс (мастер), у которого освободилась запись
+    :param key: Момент освободившейся записи
+    :param cutoff: Текущий момент
+    :return: None
+    """
+    user_id = await waitlist.first(resource, key)
+    if user_id is None or not await schedule.book_slot(user_id, key, cutoff, resource=resource):  # Уже заняли
+        return
+    await waitlist.leave(key, user_id)  # И из листов ожидания этого времени у других мастеров
+    deadline = time.time() + settings.waitlist_timeout
+    await waitlist.offer(resource, key, user_id, deadline)
+    reminders.add(user_id, key)
+    slot = format_slot_key(key)
+    outbox.send(user_id, f"Освободилась запись на {slot}, она забронирована за вами. Подтвердите бронь "
+                         f"в течение {settings.waitlist_timeout / 60:g} мин., иначе она будет отменена",
+                reply_markup=offer_keyboard(slot))
+    start_offer_timer(resource, key, user_id, deadline)
+
+
+def start_offer_timer(resource: str, key: int, user_id: int, deadline: float) -> None:
+    """
+    Запуск задачи, которая отменит неподтвержденную бронь из листа ожидания (см. expire_offer).
+
+    :param resource: Ресурс (мастер), у которого предложена запись
+    :param key: Момент записи
+    :param user_id: Id пользователя, которому предложена запись
+    :param deadline: Время окончания подтверждения (time.time)
+    :return: None
+    """
+    timer = asyncio.create_task(expire_offer(resource, key, user_id, deadline))
+    offer_timers.add(timer)
+    timer.add_done_callback(offer_timers.discard)
+
+
+async def expire_offer(resource: str, key: int, user_id: int, deadline: float) -> None:
+    """
+    Отмена неподтвержденной брони из листа ожидания по истечении времени подтверждения. Запись предлагается
+    следующему пользователю из листа ожидания того же мастера.
+
+    :param resource: Ресурс (мастер), у которого предложена запись
+    :param key: Момент записи
+    :param user_id: Id пользователя, которому предложена запись
+    :param deadline: Время окончания подтверждения (time.time)
+    :return: None
+    """
+    await asyncio.sleep(max(deadline - time.time(), 0.0))
+    if not await waitlist.close_offer(resource, key, user_id):  # Бронь уже подтверждена или отменена
+        return
+    metrics.inc("bot_waitlist_offers_total", result="expired")
+    cutoff = clock.cutoff()
+    if await schedule.cancel_booking(user_id, key, cutoff, resource) is not None:
+        reminders.cancel(user_id, key)
+        outbox.send(user_id, f"Время подтверждения записи на {format_slot_key(key)} истекло, бронь отменена",
+                    reply_markup=menu_keyboard)
+        await offer_released_slot(resource, key, cutoff)
+
+
+@dp.message(F.text.regexp(r'(Подтвердить|Отказаться) \d\d\.\d\d\.\d\d\d\d \d\d:\d\d$'))
+async def offer_answer_handler(message: Message, cutoff: int) -> None:
+    """
+    Обработчик ответа на предложение записи из листа ожидания: сообщения вида 'Подтвердить dd.mm.yyyy HH:MM'
+    или 'Отказаться dd.mm.yyyy HH:MM'. При отказе бронь отменяется, запись предлагается следующему. Если
+    предложение уже завершено (подтверждено, отклонено или истекло), бронь не меняется.
+
+    :param message: Пришедшее сообщение
+    :param cutoff: Текущий момент (снимок часов на обновление, см. clock.ClockMiddleware)
+    :return: None
+    """
+    answer, str_slot = message.text.split(" ", 1)
+    key = parse_slot_key(str_slot)
+    resource = await schedule.booked_resource(message.chat.id, key)  # Мастер, у которого предложена запись
+    # Ответ действует, только пока предложение открыто: после подтверждения, отказа или истечения времени
+    # бронь уже не относится к листу ожидания и этим сообщением не отменяется
+    if resource is None or not await waitlist.close_offer(resource, key, message.chat.id):
+        outbox.send(message.chat.id, "Это предложение уже недействительно")
+        await show_start_menu(message.chat.id)
+        return
+    if answer == "Подтвердить":
+        metrics.inc("bot_waitlist_offers_total", result="confirmed")
+        outbox.send(message.chat.id, "Поздравляю, вы записаны!")
+        await show_start_menu(message.chat.id)
+        return
+    metrics.inc("bot_waitlist_offers_total", result="declined")
+    if await schedule.cancel_booking(message.chat.id, key, cutoff, resource) is None:
+        outbox.send(message.chat.id, "Это предложение уже недействительно")
+        await show_start_menu(message.chat.id)
+        return
+    reminders.cancel(message.chat.id, key)
+    outbox.send(message.chat.id, "Бронь отменена")
+    await show_start_menu(message.chat.id)
+    await offer_released_slot(resource, key, cutoff)
+
+
+@dp.message(Command("export"), F.chat.id.in_(admin_ids))
+async def export_handler(message: Message, command: CommandObject) -> None:
+    """
+    Команда менеджера "/export dd.mm.yyyy dd.mm.yyyy [csv|jsonl]": выгрузка броней за промежуток дней
+    (включительно) в филиале или у мастера, выбранных менеджером. Файл пишется в отдельном потоке, чтобы большая
+    выгрузка не задерживала ответы клиентам, и отправляется документом.
+
+    :param message: Пришедшее сообщение
+    :param command: Команда с аргументами
+    :return: None
+    """
+    args = (command.args or "").split()
+    export_format = args.pop() if args and args[-1] in EXPORT_FORMATS else "csv"
+    period = parse_period(args) if len(args) == 2 else None
+    if period is None:
+        outbox.send(message.chat.id, "Использование: /export dd.mm.yyyy dd.mm.yyyy [csv|jsonl]",
+                    reply_markup=menu_keyboard)
+        return
+    outbox.send(message.chat.id, "Выгрузка началась, файл придет отдельным сообщением", reply_markup=menu_keyboard)
+    resource = schedule.schedule.for_user(message.chat.id)  # Филиал или мастер, выбранные менеджером
+    path, count = await asyncio.get_running_loop().run_in_executor(None, export_to_file, resource, period[0],
+                                                                   period[1], export_format)
+    try:
+        await bot.send_document(message.chat.id, FSInputFile(path, f"bookings_{args[0]}_{args[1]}.{export_format}"),
+                                caption=f"Броней: {count}")
+    finally:
+        os.remove(path)
+
+
+@dp.message(Command("close", "open"), F.chat.id.in_(admin_ids))
+async def slots_availability_handler(message: Message, command: CommandObject, cutoff: int) -> None:
+    """
+    Команды менеджера "/close dd.mm.yyyy dd.mm.yyyy [HH:MM HH:MM]" и "/open ...": закрытие свободных записей
+    (отпуск, праздники) или открытие закрытых за промежуток дней (включительно), если указано - только
+    в промежутке времени, в филиале или у мастера, выбранных менеджером. Забронированные записи не изменяются;
+    изменения записываются одной операцией.
+
+    :param message: Пришедшее сообщение
+    :param command: Команда с аргументами
+    :param cutoff: Текущий момент (снимок часов на обновление, см. clock.ClockMiddleware)
+    :return: None
+    """
+    period = parse_period((command.args or "").split())
+    if period is None:
+        outbox.send(message.chat.id, f"Использование: /{command.command} dd.mm.yyyy dd.mm.yyyy [HH:MM HH:MM]",
+                    reply_markup=menu_keyboard)
+        return
+    is_open = command.command == "open"
+    count = await schedule.set_slots_availability(message.chat.id, *period[:2], is_open, *period[2:], ALL_WEEKDAYS,
+                                                  cutoff)
+    outbox.send(message.chat.id, f"{'Открыто' if is_open else 'Закрыто'} записей: {count}",
+                reply_markup=menu_keyboard)
+
+
+async def start_reminders() -> None:
+    """
+    Запуск напоминаний при старте бота: напоминания планируются заново по сохраненным броням
+    (напоминания, время которых прошло, пока бот не работал, не отправляются).
+
+    :return: None
+    """
+    if not reminders.enabled:
+        return
+    reminders.rebuild(await schedule.get_all_bookings(clock.cutoff()))
+    reminders.start()
+
+
+async def restore_offers() -> None:
+    """
+    Запуск таймеров подтверждения предложений из листов ожидания, сделанных до перезапуска бота (см. SqliteWaitlist).
+    Предложения, время подтверждения которых истекло, пока бот не работал, отменяются сразу. Если процессов
+    несколько, таймеры запускает каждый из них, а предложение завершает только один (см. Waitlist.close_offer).
+
+    :return: None
+    """
+    for resource, key, user_id, deadline in await waitlist.pending_offers():
+        start_offer_timer(resource, key, user_id, deadline)
+
+
+async def stop_offer_timers() -> None:
+    """
+    Остановка таймеров подтверждения. Открытые предложения остаются в базе данных листов ожидания
+    и восстанавливаются при следующем запуске (см. restore_offers).
+
+    :return: None
+    """
+    for timer in list(offer_timers):
+        timer.cancel()
+
+
+dp.startup.register(start_reminders)
+dp.startup.register(restore_offers)
+dp.shutdown.register(reminders.stop)
+dp.shutdown.register(stop_offer_timers)
+
+
+def close_storage() -> None:
+    """
+    Закрытие расписания (сохранение журнала броней, закрытие соединений с базой данных) и листов ожидания.
+
+    :return: None
+    """
+    schedule.close()
+    waitlist.close()
 
 
 async def main() -> None:
-    await dp.start_polling(bot)  # Запуск бота
+    try:
+        await dp.start_polling(bot)  # Запуск бота
+    finally:
+        close_storage()
 
 
 if __name__ == "__main__":
-    logging.basicConfig(level=logging.INFO, stream=sys.stdout)  # Настройка бота
-    asyncio.run(main())  # Запуск бота
+    log_listener = setup_logging(settings)  # Настройка логов: записи выводит фоновый поток
+    try:
+        if settings.workers > 1:
+            close_storage()  # Главный процесс только распределяет обновления, с расписанием работают рабочие процессы
+            run_cluster(bot, settings)  # Запуск бота в нескольких процессах
+        elif settings.mode == "webhook":
+            run_webhook(dp, bot, settings, on_cleanup=close_storage)  # Запуск бота в режиме webhook
+        else:
+            asyncio.run(main())  # Запуск бота
+    finally:
+        log_listener.stop()  # Вывод оставшихся записей
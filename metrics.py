@@ -0,0 +1,345 @@
+import asyncio
+import bisect
+import logging
+import time
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from aiohttp import web
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import Response, TelegramMethod
+from aiogram.types import TelegramObject
+
+from settings import Settings
+
+# Границы корзин гистограмм времени, секунды
+TIME_BUCKETS: tuple[float, ...] = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Описание метрик: имя -> (тип, описание)
+METRICS: dict[str, tuple[str, str]] = {
+    "bot_update_seconds": ("histogram", "Время обработки обновления диспетчером"),
+    "bot_handler_seconds": ("histogram", "Время работы обработчика сообщения"),
+    "bot_api_seconds": ("histogram", "Время запроса к Telegram Bot API"),
+    "bot_api_errors_total": ("counter", "Запросы к Telegram Bot API, завершившиеся ошибкой"),
+    "bot_schedule_seconds": ("histogram", "Время операции с расписанием (с ожиданием пула потоков хранилища)"),
+    "bot_bookings_total": ("counter", "Попытки бронирования по результату: success, conflict, invalid"),
+    "bot_waitlist_offers_total": ("counter", "Предложения записей из листа ожидания по результату: confirmed, "
+                                             "declined, expired"),
+    "bot_event_loop_lag_seconds": ("histogram", "Опоздание цикла событий относительно запланированного пробуждения"),
+}
+# Описание счетчиков хранилищ сессий (session_store.SessionStore.stats): ключ -> описание
+SESSION_STORE_METRICS: dict[str, str] = {
+    "size": "Записи в хранилище сессий (включая устаревшие, еще не удаленные очисткой)",
+    "hits": "Найденные записи хранилища сессий",
+    "misses": "Не найденные записи хранилища сессий (в том числе устаревшие)",
+    "evictions": "Записи хранилища сессий, удаленные из-за превышения размера",
+    "expirations": "Устаревшие записи хранилища сессий, удаленные по времени",
+}
+# Описание метрик очереди исходящих сообщений (outbox.Outbox.stats): ключ -> описание
+OUTBOX_METRICS: dict[str, str] = {
+    "depth": "Сообщения в очереди на отправку",
+    "sent": "Запросы на отправку сообщений (в том числе неудачные)",
+    "merged": "Сообщения, объединенные с предыдущими сообщениями того же чата",
+    "retries": "Повторные отправки после ошибок 429, ошибок сети и сервера Telegram",
+    "failed": "Сообщения, которые не удалось отправить",
+    "latency_avg": "Средняя задержка доставки по последним сообщениям, секунды",
+    "latency_p99": "99-я перцентиль задержки доставки по последним сообщениям, секунды",
+    "latency_max": "Наибольшая задержка доставки по последним сообщениям, секунды",
+}
+
+
+class Histogram:
+    """
+    Гистограмма значений с фиксированными границами корзин.
+    """
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self) -> None:
+        self.counts: list[int] = [0] * (len(TIME_BUCKETS) + 1)  # Последняя корзина - больше всех границ
+        self.total: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+        """
+        Учет значения.
+
+        :param value: Значение
+        :return: None
+        """
+        self.counts[bisect.bisect_left(TIME_BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Metrics:
+    """
+    Метрики бота в памяти процесса. Пока метрики не включены (enable), методы учета сразу возвращаются,
+    а промежуточные обработчики и сервер метрик не регистрируются (см. setup_metrics), поэтому выключенные
+    метрики почти не влияют на скорость работы.
+    """
+
+    def __init__(self) -> None:
+        """
+        Конструктор.
+        """
+        self.enabled: bool = False
+        self._counters: dict[tuple[str, tuple[tuple[str, str], ...]], float] = {}
+        self._histograms: dict[tuple[str, tuple[tuple[str, str], ...]], Histogram] = {}
+        self._gauges: dict[str, tuple[str, Callable[[], float]]] = {}  # Имя -> (описание, функция значения)
+        # Группы показателей: (префикс имени, описания значений, функция значений, имена счетчиков, метки)
+        self._groups: list[tuple[str, dict[str, str], Callable[[], dict[str, float]], frozenset[str],
+                                 tuple[tuple[str, str], ...]]] = []
+
+    def enable(self) -> None:
+        """
+        Включение учета метрик.
+
+        :return: None
+        """
+        self.enabled = True
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        """
+        Увеличение счетчика.
+
+        :param name: Имя метрики
+        :param value: На сколько увеличить
+        :param labels: Метки
+        :return: None
+        """
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """
+        Учет значения в гистограмме.
+
+        :param name: Имя метрики
+        :param value: Значение (для времени - в секундах)
+        :param labels: Метки
+        :return: None
+        """
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def gauge(self, name: str, description: str, function: Callable[[], float]) -> None:
+        """
+        Регистрация показателя, значение которого вычисляется при каждом запросе метрик.
+
+        :param name: Имя метрики
+        :param description: Описание
+        :param function: Функция, возвращающая значение
+        :return: None
+        """
+        self._gauges[name] = (description, function)
+
+    def group(self, prefix: str, descriptions: dict[str, str], function: Callable[[], dict[str, float]],
+              counters: Iterable[str] = (), **labels: str) -> None:
+        """
+        Регистрация группы показателей, которые вычисляются одним вызовом function при каждом запросе метрик
+        (например, stats() хранилища). Значение с ключом key выводится метрикой prefix_key типа gauge, а если key
+        есть в counters (значение только растет) - метрикой prefix_key_total типа counter.
+
+        :param prefix: Префикс имен метрик
+        :param descriptions: Описания значений: ключ -> описание (без описания выводится ключ)
+        :param function: Функция, возвращающая словарь {ключ: значение}
+        :param counters: Ключи значений-счетчиков
+        :param labels: Метки (например, имя хранилища, если групп с одним префиксом несколько)
+        :return: None
+        """
+        self._groups.append((prefix, descriptions, function, frozenset(counters), tuple(sorted(labels.items()))))
+
+    def render(self) -> str:
+        """
+        Метрики в текстовом формате Prometheus.
+
+        :return: Текст
+        """
+        lines: list[str] = []
+        described: set[str] = set()
+
+        def describe(name: str, kind: str, description: str) -> None:
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in sorted(self._counters.items()):
+            describe(name, *METRICS.get(name, ("counter", name)))
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        for (name, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0]):
+            describe(name, *METRICS.get(name, ("histogram", name)))
+            cumulative = 0
+            for bound, count in zip(TIME_BUCKETS + (float("inf"),), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram.total:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        for name, (description, function) in sorted(self._gauges.items()):
+            describe(name, "gauge", description)
+            try:
+                lines.append(f"{name} {function():g}")
+            except Exception:  # Показатель не должен ломать остальные метрики
+                logging.exception("Не удалось вычислить метрику %s", name)
+        # Строки одной метрики должны идти подряд, поэтому значения групп с одним префиксом сортируются по имени
+        samples: list[tuple[str, tuple[tuple[str, str], ...], str, str, float]] = []
+        for prefix, descriptions, function, counters, labels in self._groups:
+            try:
+                values = function()
+            except Exception:
+                logging.exception("Не удалось вычислить метрики %s", prefix)
+                continue
+            for key, value in values.items():
+                if key in counters:
+                    samples.append((f"{prefix}_{key}_total", labels, "counter", descriptions.get(key, key), value))
+                else:
+                    samples.append((f"{prefix}_{key}", labels, "gauge", descriptions.get(key, key), value))
+        for name, labels, kind, description, value in sorted(samples, key=lambda sample: sample[:2]):
+            describe(name, kind, description)
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    """
+    Метки в формате Prometheus: {name="value",...}.
+
+    :param labels: Пары (имя, значение)
+    :return: Текст меток или пустая строка
+    """
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+metrics = Metrics()  # Метрики процесса
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """
+    Время обработки обновления целиком (внешний промежуточный обработчик диспетчера).
+    """
+
+    async def __call__(self, handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: dict[str, Any]) -> Any:
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            metrics.observe("bot_update_seconds", time.perf_counter() - started)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Время работы обработчика сообщения, по имени функции обработчика.
+    """
+
+    async def __call__(self, handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: dict[str, Any]) -> Any:
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            metrics.observe("bot_handler_seconds", time.perf_counter() - started,
+                            handler=data["handler"].callback.__name__)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """
+    Время запросов к Bot API и количество ошибок, по методу Bot API.
+    """
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot,
+                       method: TelegramMethod) -> Response:
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            metrics.inc("bot_api_errors_total", method=type(method).__name__)
+            raise
+        finally:
+            metrics.observe("bot_api_seconds", time.perf_counter() - started, method=type(method).__name__)
+
+
+async def watch_event_loop_lag(interval: float = 0.5) -> None:
+    """
+    Измерение опоздания цикла событий: насколько позже запланированного просыпается задача. Большое опоздание
+    означает, что цикл событий заблокирован (например, долгим поиском по расписанию).
+
+    :param interval: Период измерения в секундах
+    :return: None
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        metrics.observe("bot_event_loop_lag_seconds", max(0.0, loop.time() - started - interval))
+
+
+def setup_metrics(dispatcher: Dispatcher, bot: Bot, settings: Settings,
+                  gauges: Optional[dict[str, tuple[str, Callable[[], float]]]] = None,
+                  session_stores: Optional[dict[str, Any]] = None,
+                  outbox_stats: Optional[Callable[[], dict[str, float]]] = None) -> None:
+    """
+    Включение метрик: регистрация промежуточных обработчиков диспетчера и сессии бота, а также запуск
+    сервера метрик (GET /metrics на settings.metrics_host:settings.metrics_port) и измерения опоздания цикла
+    событий при запуске диспетчера. Адрес читается при запуске, поэтому рабочие процессы (см. cluster.py)
+    могут изменить порт после импорта main.py.
+
+    :param dispatcher: Диспетчер бота
+    :param bot: Объект бота
+    :param settings: Настройки
+    :param gauges: Показатели: имя -> (описание, функция значения)
+    :param session_stores: Хранилища сессий (session_store.SessionStore или sqlite_schedule.SqliteSessionStore):
+        имя (метка store) -> хранилище. Экспортируются их счетчики stats()
+    :param outbox_stats: Метрики очереди исходящих сообщений (outbox.Outbox.stats): глубина, счетчики отправленных,
+        объединенных, повторных и неотправленных сообщений и задержка доставки
+    :return: None
+    """
+    metrics.enable()
+    for name, (description, function) in (gauges or {}).items():
+        metrics.gauge(name, description, function)
+    for name, store in (session_stores or {}).items():
+        metrics.group("bot_session_store", SESSION_STORE_METRICS, store.stats,
+                      counters=("hits", "misses", "evictions", "expirations"), store=name)
+    if outbox_stats is not None:
+        metrics.group("bot_outbox", OUTBOX_METRICS, outbox_stats, counters=("sent", "merged", "retries", "failed"))
+    dispatcher.update.outer_middleware(UpdateMetricsMiddleware())
+    dispatcher.message.middleware(HandlerMetricsMiddleware())
+    bot.session.middleware(ApiMetricsMiddleware())
+
+    state: dict[str, Any] = {}
+
+    async def handle_metrics(_: web.Request) -> web.Response:
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    async def start() -> None:
+        app = web.Application()
+        app.router.add_get("/metrics", handle_metrics)
+        runner = state["runner"] = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, settings.metrics_host, settings.metrics_port).start()
+        state["lag"] = asyncio.create_task(watch_event_loop_lag())
+        logging.info("Метрики доступны по адресу http://%s:%d/metrics", settings.metrics_host, settings.metrics_port)
+
+    async def stop() -> None:
+        if "lag" in state:
+            state["lag"].cancel()
+        if "runner" in state:
+            await state["runner"].cleanup()
+
+    dispatcher.startup.register(start)
+    dispatcher.shutdown.register(stop)
@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import (TelegramAPIError, TelegramEntityTooLarge, TelegramNetworkError,
+                                TelegramRetryAfter, TelegramServerError)
+from aiogram.types import Message
+
+from session_store import SessionStore
+
+MAX_MESSAGE_LENGTH = 4096  # Наибольшая длина текста сообщения в Telegram
+
+
+class TokenBucket:
+    """
+    Ограничение частоты отправки: в среднем rate сообщений в секунду, не больше capacity сообщений подряд.
+    """
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float) -> None:
+        """
+        Конструктор.
+
+        :param rate: Сколько сообщений в секунду разрешено
+        :param capacity: Сколько сообщений можно отправить подряд без ожидания
+        :param now: Текущий момент
+        """
+        self.rate: float = rate
+        self.capacity: float = capacity
+        self.tokens: float = capacity
+        self.updated: float = now
+
+    def reserve(self, now: float) -> float:
+        """
+        Резервирование отправки одного сообщения.
+
+        :param now: Текущий момент
+        :return: Сколько секунд нужно подождать перед отправкой
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class _Outgoing:
+    """
+    Сообщение в очереди на отправку.
+    """
+    __slots__ = ("text", "reply_markup", "queued_at", "future")
+
+    def __init__(self, text: str, reply_markup: Any, queued_at: float, future: asyncio.Future) -> None:
+        self.text = text
+        self.reply_markup = reply_markup
+        self.queued_at = queued_at
+        self.future = future
+
+
+class Outbox:
+    """
+    Очередь исходящих сообщений. Обработчики ставят сообщения в очередь и не ждут их доставки.
+
+    Сообщения каждого чата отправляются по порядку. Идущие подряд сообщения одного чата, которые еще не отправлены,
+    объединяются в одно (например, ответ и следующее за ним меню), если у предыдущих сообщений нет клавиатуры.
+    Частота отправки ограничена общим ограничением и ограничением для каждого чата (TokenBucket). При ответе
+    Telegram 429 отправка повторяется через указанное время, при сетевых ошибках - с нарастающей паузой.
+    """
+
+    def __init__(self, bot: Bot, global_rate: float = 30.0, chat_rate: float = 1.0, chat_burst: int = 3,
+                 max_retries: int = 5, clock: Callable[[], float] = time.monotonic) -> None:
+        """
+        Конструктор.
+
+        :param bot: Объект бота
+        :param global_rate: Сколько сообщений в секунду отправляется во все чаты
+        :param chat_rate: Сколько сообщений в секунду отправляется в один чат
+        :param chat_burst: Сколько сообщений подряд можно отправить в один чат без ожидания
+        :param max_retries: Сколько раз повторять отправку после ошибки
+        :param clock: Источник времени в секундах
+        """
+        self.bot: Bot = bot
+        self.chat_rate: float = chat_rate
+        self.chat_burst: int = chat_burst
+        self.max_retries: int = max_retries
+        self.clock: Callable[[], float] = clock
+        self._global_bucket: TokenBucket = TokenBucket(global_rate, global_rate, clock())
+        # Ограничения частоты чатов. Корзина, которой не пользовались chat_burst / chat_rate секунд, снова полна,
+        # поэтому ее можно удалить: хранятся только корзины чатов, недавно получавших сообщения
+        self._chat_buckets: SessionStore[int, TokenBucket] = SessionStore(ttl=chat_burst / chat_rate, clock=clock)
+        self._queues: dict[int, deque[_Outgoing]] = {}  # Очереди чатов, в которых есть неотправленные сообщения
+        self._senders: dict[int, asyncio.Task] = {}  # Задачи отправки (одна на чат)
+
+        self.depth: int = 0  # Сообщений в очереди
+        self.sent: int = 0  # Отправлено запросов
+        self.merged: int = 0  # Сообщений, объединенных с предыдущими
+        self.retries: int = 0  # Повторных отправок
+        self.failed: int = 0  # Сообщений, которые не удалось отправить
+        self.latencies: deque[float] = deque(maxlen=1000)  # Время от постановки в очередь до доставки (последние)
+
+    def send(self, chat_id: int, text: str, reply_markup: Any = None) -> asyncio.Future:
+        """
+        Постановка сообщения в очередь. Вызывается из цикла событий.
+
+        :param chat_id: Id чата
+        :param text: Текст сообщения
+        :param reply_markup: Клавиатура
+        :return: Future с отправленным сообщением (None, если отправить не удалось). Ждать его не обязательно
+        """
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = deque()
+            self._senders[chat_id] = asyncio.create_task(self._deliver(chat_id, queue))
+        queue.append(_Outgoing(text, reply_markup, self.clock(), future))
+        self.depth += 1
+        return future
+
+    def _take(self, queue: deque[_Outgoing]) -> list[_Outgoing]:
+        """
+        Извлечение из очереди чата следующего сообщения вместе с сообщениями, которые можно к нему присоединить.
+
+        :param queue: Очередь чата
+        :return: Сообщения, отправляемые одним запросом
+        """
+        batch = [queue.popleft()]
+        length = len(batch[0].text)
+        while queue and batch[-1].reply_markup is None and length + 2 + len(queue[0].text) <= MAX_MESSAGE_LENGTH:
+            batch.append(queue.popleft())
+            length += 2 + len(batch[-1].text)
+        self.depth -= len(batch)
+        self.merged += len(batch) - 1
+        return batch
+
+    async def _deliver(self, chat_id: int, queue: deque[_Outgoing]) -> None:
+        """
+        Отправка сообщений одного чата, пока его очередь не опустеет.
+
+        :param chat_id: Id чата
+        :param queue: Очередь чата
+        :return: None
+        """
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst, self.clock())
+        try:
+            while queue:
+                await asyncio.sleep(0)  # Даем обработчику поставить в очередь следующие сообщения для объединения
+                batch = self._take(queue)
+                message = await self._send_with_retries(chat_id, bucket, "\n\n".join(item.text for item in batch),
+                                                        batch[-1].reply_markup)
+                now = self.clock()
+                for item in batch:
+                    self.latencies.append(now - item.queued_at)
+                    if not item.future.done():
+                        item.future.set_result(message)
+        finally:
+            del self._queues[chat_id]
+            del self._senders[chat_id]
+            self._chat_buckets[chat_id] = bucket
+
+    async def _send_with_retries(self, chat_id: int, bucket: TokenBucket, text: str,
+                                 reply_markup: Any) -> Optional[Message]:
+        """
+        Отправка одного сообщения с соблюдением ограничений частоты и повторами после ошибок.
+
+        :param chat_id: Id чата
+        :param bucket: Ограничение частоты для чата
+        :param text: Текст
+        :param reply_markup: Клавиатура
+        :return: Отправленное сообщение или None, если отправить не удалось
+        """
+        for attempt in range(self.max_retries + 1):
+            now = self.clock()
+            delay = max(self._global_bucket.reserve(now), bucket.reserve(now))
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                self.sent += 1
+                return await self.bot.send_message(chat_id, text, reply_markup=reply_markup)
+            except TelegramRetryAfter as e:
+                pause = e.retry_after
+            except TelegramEntityTooLarge:
+                break
+            except (TelegramNetworkError, TelegramServerError):
+                pause = 0.5 * 2 ** attempt
+            except TelegramAPIError as e:  # Например, пользователь заблокировал бота: повтор не поможет
+                logging.warning("Не удалось отправить сообщение в чат %d: %s", chat_id, e)
+                break
+            if attempt < self.max_retries:
+                self.retries += 1
+                await asyncio.sleep(pause)
+        else:
+            logging.warning("Не удалось отправить сообщение в чат %d за %d попыток", chat_id, self.max_retries + 1)
+        self.failed += 1
+        return None
+
+    async def close(self) -> None:
+        """
+        Ожидание отправки всех сообщений из очереди.
+
+        :return: None
+        """
+        while self._senders:
+            await asyncio.wait(list(self._senders.values()))
+
+    def stats(self) -> dict[str, float]:
+        """
+        Метрики очереди: глубина, количество отправленных, объединенных, повторных и неотправленных сообщений,
+        задержка доставки (среднее, 99-й перцентиль и максимум по последним сообщениям, в секундах).
+
+        :return: Словарь {название метрики: значение}
+        """
+        latencies = sorted(self.latencies)
+        return {"depth": self.depth, "sent": self.sent, "merged": self.merged, "retries": self.retries,
+                "failed": self.failed,
+                "latency_avg": sum(latencies) / len(latencies) if latencies else 0.0,
+                "latency_p99": latencies[int(len(latencies) * 0.99)] if latencies else 0.0,
+                "latency_max": latencies[-1] if latencies else 0.0}
@@ -0,0 +1,268 @@
+import asyncio
+import logging
+from collections.abc import Hashable
+from typing import Any, Awaitable, Callable, Generic, Iterable, Optional, TypeVar
+
+from schedule_index import MINUTES_IN_DAY, format_slot_key
+
+T = TypeVar("T")
+
+# Напоминания о записи: (за сколько минут до записи, текст). В тексте подставляются {date} и {time} записи
+REMINDERS: tuple[tuple[int, str], ...] = (
+    (MINUTES_IN_DAY, "Напоминаем: завтра, {date}, в {time} вы записаны в парикмахерскую N."),
+    (2 * 60, "Напоминаем: через 2 часа, в {time}, вы записаны в парикмахерскую N."),
+)
+
+
+class TimerWheel(Generic[T]):
+    """
+    Иерархическое колесо таймеров. Время измеряется целыми тактами. Колесо уровня level состоит из size ячеек
+    по size ** level тактов: таймер кладется в ячейку самого нижнего уровня, в горизонт которого он попадает.
+    Каждый такт обрабатывается одна ячейка нижнего уровня; когда нижнее колесо проходит полный оборот, ячейка
+    следующего уровня раскладывается по нижним. Поэтому добавление и отмена таймера стоят O(1), а такт - O(1)
+    плюс количество сработавших и переложенных таймеров, независимо от общего количества таймеров.
+    """
+
+    def __init__(self, now: int = 0, size: int = 64, levels: int = 4) -> None:
+        """
+        Конструктор.
+
+        :param now: Текущий такт (уже обработан)
+        :param size: Количество ячеек в колесе одного уровня
+        :param levels: Количество уровней. Таймеры дальше size ** levels тактов хранятся отдельно
+            и раскладываются по колесам, когда приблизятся
+        """
+        self.size: int = size
+        self.levels: int = levels
+        self.current: int = now  # Последний обработанный такт
+        self._wheels: list[list[dict[Hashable, tuple[int, T]]]] = [[{} for _ in range(size)] for _ in range(levels)]
+        self._overflow: dict[Hashable, tuple[int, T]] = {}  # Таймеры дальше горизонта колес
+        self._location: dict[Hashable, dict[Hashable, tuple[int, T]]] = {}  # Ключ таймера -> ячейка с ним
+
+    def __len__(self) -> int:
+        return len(self._location)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._location
+
+    def add(self, key: Hashable, deadline: int, item: T) -> None:
+        """
+        Добавление таймера. Таймер с тем же ключом заменяется. Таймер с прошедшим сроком срабатывает
+        на следующем такте.
+
+        :param key: Ключ таймера (для отмены)
+        :param deadline: Такт срабатывания
+        :param item: Значение, которое возвращается при срабатывании
+        :return: None
+        """
+        self.cancel(key)
+        self._place(key, max(deadline, self.current + 1), item)
+
+    def cancel(self, key: Hashable) -> bool:
+        """
+        Отмена таймера.
+
+        :param key: Ключ таймера
+        :return: Был ли таймер
+        """
+        bucket = self._location.pop(key, None)
+        if bucket is None:
+            return False
+        del bucket[key]
+        return True
+
+    def _place(self, key: Hashable, deadline: int, item: T) -> None:
+        """
+        Размещение таймера в ячейке уровня, соответствующего его удаленности.
+
+        :param key: Ключ таймера
+        :param deadline: Такт срабатывания, не раньше текущего
+        :param item: Значение
+        :return: None
+        """
+        delta = deadline - self.current
+        span = 1  # Тактов в ячейке уровня
+        for wheel in self._wheels:
+            if delta < span * self.size:
+                bucket = wheel[deadline // span % self.size]
+                break
+            span *= self.size
+        else:
+            bucket = self._overflow
+        bucket[key] = (deadline, item)
+        self._location[key] = bucket
+
+    def advance(self, now: int) -> list[T]:
+        """
+        Обработка тактов до now включительно.
+
+        :param now: Текущий такт
+        :return: Значения сработавших таймеров, по порядку срабатывания
+        """
+        expired: list[T] = []
+        if not self._location:  # Таймеров нет: обрабатывать такты незачем
+            self.current = max(self.current, now)
+            return expired
+        while self.current < now:
+            self.current += 1
+            self._cascade()
+            bucket = self._wheels[0][self.current % self.size]
+            for key, (_, item) in bucket.items():
+                del self._location[key]
+                expired.append(item)
+            bucket.clear()
+        return expired
+
+    def _cascade(self) -> None:
+        """
+        Раскладка ячеек верхних уровней, срок которых наступил, по нижним уровням (в начале такта self.current).
+        Уровни раскладываются сверху вниз: таймер из верхней ячейки может попасть в ячейку нижнего уровня,
+        которая раскладывается в этот же такт.
+
+        :return: None
+        """
+        reached = 0  # Сколько верхних уровней начинают в этот такт новую ячейку
+        while reached + 1 < self.levels and self.current % self.size ** (reached + 1) == 0:
+            reached += 1
+        if reached == self.levels - 1:  # Новая ячейка верхнего колеса: приблизившиеся далекие таймеры
+            self._replace(self._overflow)
+        for level in range(reached, 0, -1):
+            self._replace(self._wheels[level][self.current // self.size ** level % self.size])
+
+    def _replace(self, bucket: dict[Hashable, tuple[int, T]]) -> None:
+        """
+        Перекладка таймеров ячейки заново, с учетом текущего такта.
+
+        :param bucket: Ячейка
+        :return: None
+        """
+        entries = list(bucket.items())
+        bucket.clear()
+        for key, (deadline, item) in entries:
+            self._place(key, deadline, item)
+
+
+class ReminderScheduler:
+    """
+    Напоминания о записях (см. REMINDERS). Для каждой брони заводятся таймеры в колесе таймеров с тактом в одну
+    минуту; время - в минутах, как момент записи (см. schedule.BaseSchedule). Сработавшие напоминания
+    отправляются пачками: следующая пачка ставится в очередь отправки после доставки предыдущей, поэтому
+    одновременно наступившие напоминания не переполняют очередь, а частоту отправки ограничивает очередь.
+
+    Текущий момент берется из clock, поэтому в проверках время можно подменить, а такты обрабатывать вызовом tick.
+    """
+
+    def __init__(self, send: Callable[[int, str], Awaitable[Any]], clock: Callable[[], int],
+                 is_booked: Optional[Callable[[int, int], Awaitable[bool]]] = None, batch_size: int = 100,
+                 interval: float = 15.0, enabled: bool = True) -> None:
+        """
+        Конструктор.
+
+        :param send: Отправка сообщения (id чата, текст)
+        :param clock: Текущий момент в минутах (см. clock.Clock.cutoff)
+        :param is_booked: Проверка перед отправкой, что запись (момент) все еще забронирована пользователем
+        :param batch_size: Сколько напоминаний отправляется одной пачкой
+        :param interval: Как часто проверять сработавшие напоминания, секунды
+        :param enabled: Включены ли напоминания (выключенные не планируются и не отправляются)
+        """
+        self.send: Callable[[int, str], Awaitable[Any]] = send
+        self.clock: Callable[[], int] = clock
+        self.is_booked: Optional[Callable[[int, int], Awaitable[bool]]] = is_booked
+        self.batch_size: int = batch_size
+        self.interval: float = interval
+        self.enabled: bool = enabled
+        self.owns: Callable[[int], bool] = lambda user_id: True  # Напоминает ли этот процесс пользователю
+        self.wheel: TimerWheel[tuple[int, int, str]] = TimerWheel(clock())
+        self.sent: int = 0  # Отправлено напоминаний
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, user_id: int, key: int) -> None:
+        """
+        Добавление напоминаний о записи. Напоминания, время которых уже прошло, пропускаются.
+
+        :param user_id: Id пользователя
+        :param key: Момент записи
+        :return: None
+        """
+        if not self.enabled or not self.owns(user_id):
+            return
+        now = self.clock()
+        date, time = format_slot_key(key).split()
+        for minutes_before, text in REMINDERS:
+            if key - minutes_before > now:
+                self.wheel.add((user_id, key, minutes_before), key - minutes_before,
+                               (user_id, key, text.format(date=date, time=time)))
+
+    def cancel(self, user_id: int, key: int) -> None:
+        """
+        Отмена напоминаний о записи (при отмене или переносе брони).
+
+        :param user_id: Id пользователя
+        :param key: Момент записи
+        :return: None
+        """
+        for minutes_before, _ in REMINDERS:
+            self.wheel.cancel((user_id, key, minutes_before))
+
+    def rebuild(self, bookings: Iterable[tuple[int, int]]) -> None:
+        """
+        Заполнение напоминаний по сохраненным броням (при запуске).
+
+        :param bookings: Брони: (id пользователя, момент записи)
+        :return: None
+        """
+        self.wheel = TimerWheel(self.clock())
+        for user_id, key in bookings:
+            self.add(user_id, key)
+        logging.info("Напоминаний запланировано: %d", len(self.wheel))
+
+    async def tick(self) -> int:
+        """
+        Отправка напоминаний, время которых наступило.
+
+        :return: Сколько напоминаний отправлено
+        """
+        due = self.wheel.advance(self.clock())
+        sent = 0
+        for start in range(0, len(due), self.batch_size):
+            batch = []
+            for user_id, key, text in due[start:start + self.batch_size]:
+                if self.is_booked is None or await self.is_booked(user_id, key):
+                    batch.append(self.send(user_id, text))
+            await asyncio.gather(*batch)  # Следующая пачка - после доставки этой
+            sent += len(batch)
+        self.sent += sent
+        return sent
+
+    async def run(self) -> None:
+        """
+        Цикл проверки напоминаний.
+
+        :return: None
+        """
+        while True:
+            try:
+                await self.tick()
+            except Exception:
+                logging.exception("Ошибка при отправке напоминаний")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """
+        Запуск цикла проверки напоминаний в цикле событий (если напоминания включены).
+
+        :return: None
+        """
+        if not self.enabled:
+            return
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """
+        Остановка цикла проверки напоминаний.
+
+        :return: None
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,118 @@
+import argparse
+import asyncio
+import json
+import sys
+from typing import Any, Optional
+
+from aiohttp import ClientSession, web
+
+from bot_mock import MockSession, make_update
+
+
+def read_updates(filename: str) -> list[dict[str, Any]]:
+    """
+    Чтение обновлений из файла. Каждая строка - обновление Telegram в формате json ({"update_id": ..., ...})
+    или сокращенная запись сообщения пользователя {"chat_id": ..., "text": ...}. Пустые строки пропускаются.
+
+    :param filename: Имя файла
+    :return: Обновления в формате json Bot API
+    """
+    updates: list[dict[str, Any]] = []
+    with open(filename, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            if "update_id" not in data:
+                data = make_update(len(updates) + 1, data["chat_id"], data["text"])
+            updates.append(data)
+    return updates
+
+
+async def post_updates(url: str, updates: list[dict[str, Any]], secret: str, concurrency: int) -> list[int]:
+    """
+    Отправка обновлений на webhook. Одновременно отправляется не больше concurrency запросов.
+
+    :param url: Адрес webhook
+    :param updates: Обновления
+    :param secret: Секретный токен (заголовок X-Telegram-Bot-Api-Secret-Token)
+    :param concurrency: Количество одновременных запросов
+    :return: HTTP-статусы ответов, в порядке обновлений
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+
+    async def post(session: ClientSession, update: dict[str, Any]) -> int:
+        async with semaphore:
+            async with session.post(url, json=update, headers=headers) as response:
+                return response.status
+
+    async with ClientSession() as session:
+        return list(await asyncio.gather(*(post(session, update) for update in updates)))
+
+
+async def replay_locally(updates: list[dict[str, Any]], concurrency: int) -> None:
+    """
+    Запуск webhook-сервера бота (main.py) с имитацией Bot API и отправка на него обновлений.
+    После остановки сервера выводятся сообщения, которые бот отправил бы пользователям.
+
+    :param updates: Обновления
+    :param concurrency: Количество одновременных запросов
+    :return: None
+    """
+    import main  # Импортируется здесь: при импорте читается config.txt и загружается расписание
+    from webhook import create_webhook_app
+
+    session = MockSession(keep_requests=len(updates) * 4)
+    main.bot.session = session
+    app = create_webhook_app(main.dp, main.bot, main.settings, on_cleanup=main.schedule.close)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    try:
+        statuses = await post_updates(f"http://127.0.0.1:{port}{main.settings.webhook_path}", updates,
+                                      main.settings.webhook_secret, concurrency)
+    finally:
+        await runner.cleanup()  # Дожидается обработки всех принятых обновлений
+    print_summary(statuses)
+    for method in session.requests:
+        print(f"-> {getattr(method, 'chat_id', '')}: {getattr(method, 'text', type(method).__name__)!r}")
+
+
+def print_summary(statuses: list[int]) -> None:
+    """
+    Вывод количества ответов с каждым HTTP-статусом.
+
+    :param statuses: HTTP-статусы
+    :return: None
+    """
+    for status in sorted(set(statuses)):
+        print(f"HTTP {status}: {statuses.count(status)}")
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """
+    Точка входа: python replay_updates.py updates.jsonl [--url URL] [--secret SECRET] [--concurrency N]
+
+    :param argv: Аргументы командной строки
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description="Отправка записанных обновлений Telegram на webhook бота")
+    parser.add_argument("updates", help="Файл с обновлениями, по одному json на строку")
+    parser.add_argument("--url", help="Адрес запущенного webhook. Если не указан, бот запускается локально "
+                                      "с имитацией Bot API")
+    parser.add_argument("--secret", default="", help="Секретный токен webhook (для --url)")
+    parser.add_argument("--concurrency", type=int, default=10, help="Количество одновременных запросов")
+    args = parser.parse_args(argv)
+
+    updates = read_updates(args.updates)
+    if args.url:
+        print_summary(asyncio.run(post_updates(args.url, updates, args.secret, args.concurrency)))
+    else:
+        asyncio.run(replay_locally(updates, args.concurrency))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,526 @@
+import bisect
+import datetime
+import heapq
+import json
+from array import array
+from collections.abc import MutableMapping
+from typing import Callable, Iterator, Optional
+
+from clock import Clock
+from journal import BookingJournal
+from schedule import BaseSchedule, Schedule
+from schedule_index import ALL_WEEKDAYS, MAX_SLOTS, MINUTES_IN_DAY, NO_RECORD, FreeSlotMasks, ScheduleIndex
+from session_store import SessionStore
+
+
+class BranchIndex(FreeSlotMasks):
+    """
+    Общий индекс свободных записей мастеров филиала: маска свободных записей дня - объединение (OR) масок мастеров,
+    список дней со свободными записями - дни, в которых запись свободна хотя бы у одного мастера. Столбцы индекса -
+    объединение времени записей мастеров. Маска дня пересчитывается по маскам мастеров при каждом изменении записи
+    в этом дне (update), поэтому поиск свободных дней и записей филиала не опрашивает расписания мастеров.
+    """
+    __slots__ = ("first_ordinal", "slot_minutes", "free_masks", "free_days", "_indexes", "_columns")
+
+    def __init__(self, indexes: list[ScheduleIndex], slot_minutes: tuple[int, ...]) -> None:
+        """
+        Конструктор. Строит маски всех дней по индексам мастеров.
+
+        :param indexes: Индексы расписаний мастеров
+        :param slot_minutes: Время записей всех мастеров в минутах, по возрастанию (не больше MAX_SLOTS)
+        """
+        self.slot_minutes: tuple[int, ...] = slot_minutes
+        self._indexes: list[ScheduleIndex] = indexes
+        # Номера столбцов общего индекса для столбцов мастера или None, если время записей мастера совпадает с общим
+        self._columns: list[Optional[tuple[int, ...]]] = [
+            None if index.slot_minutes == slot_minutes else
+            tuple(slot_minutes.index(minutes) for minutes in index.slot_minutes) for index in indexes]
+        days = [index for index in indexes if index.days_count]
+        self.first_ordinal: int = min((index.first_ordinal for index in days), default=0)
+        last_ordinal = max((index.first_ordinal + index.days_count for index in days), default=0)
+        self.free_masks: array = array("Q", (self._day_mask(ordinal)
+                                             for ordinal in range(self.first_ordinal, last_ordinal)))
+        self.free_days: list[int] = [self.first_ordinal + offset for offset, mask in enumerate(self.free_masks) if mask]
+
+    def _day_mask(self, ordinal: int) -> int:
+        """
+        Объединение масок свободных записей мастеров в дне.
+
+        :param ordinal: Порядковый номер дня
+        :return: Маска столбцов общего индекса
+        """
+        result = 0
+        for index, columns in zip(self._indexes, self._columns):
+            offset = index.day_offset(ordinal)
+            if offset < 0:
+                continue
+            mask = index.free_masks[offset]
+            if columns is None:
+                result |= mask
+                continue
+            while mask:
+                lowest = mask & -mask
+                result |= 1 << columns[lowest.bit_length() - 1]
+                mask ^= lowest
+        return result
+
+    def update(self, ordinal: int) -> None:
+        """
+        Пересчет маски дня после изменения записи мастера (см. Schedule.listeners).
+
+        :param ordinal: Порядковый номер дня
+        :return: None
+        """
+        offset = ordinal - self.first_ordinal
+        mask = self._day_mask(ordinal)
+        was_free = self.free_masks[offset] != 0
+        self.free_masks[offset] = mask
+        if mask and not was_free:
+            bisect.insort(self.free_days, ordinal)
+        elif not mask and was_free:
+            del self.free_days[bisect.bisect_left(self.free_days, ordinal)]
+
+    def last_free_minutes(self, ordinal: int) -> int:
+        """
+        Возвращает время последней записи дня, свободной хотя бы у одного мастера, или -1, если таких записей нет.
+
+        :param ordinal: Порядковый номер дня
+        :return: Минуты от начала дня
+        """
+        offset = ordinal - self.first_ordinal
+        if not 0 <= offset < len(self.free_masks) or not self.free_masks[offset]:
+            return -1
+        return self.slot_minutes[self.free_masks[offset].bit_length() - 1]
+
+
+class BranchSchedule(BaseSchedule):
+    """
+    Общее расписание нескольких ресурсов (мастеров филиала): у каждого мастера свое расписание со своим индексом,
+    а выбор даты и времени показывает их объединение. Запись свободна, если она свободна хотя бы у одного мастера,
+    и бронируется у первого мастера, у которого она свободна.
+
+    Расписания мастеров используют общее хранилище дат, выбранных во время брони (booking_dates), поэтому дата,
+    выбранная в общем расписании, видна в расписании каждого мастера. Если расписания всех мастеров хранятся
+    в памяти (Schedule), свободные дни и записи ищутся по общему индексу (BranchIndex), который обновляется при
+    каждом изменении записи мастера. Иначе запросы выполняются по расписаниям мастеров и объединяются, поэтому
+    их время растет с количеством мастеров, а не с длиной расписания.
+    """
+
+    def __init__(self, masters: list[tuple[str, BaseSchedule]], booking_dates: MutableMapping,
+                 clock: Optional[Clock] = None) -> None:
+        """
+        Конструктор.
+
+        :param masters: Мастера: (имя, расписание мастера). Расписания созданы с хранилищем booking_dates
+        :param booking_dates: Общее хранилище дат, выбранных пользователями во время брони
+        :param clock: Часы парикмахерской (см. BaseSchedule)
+        """
+        super().__init__(booking_dates, clock)
+        self.masters: list[tuple[str, BaseSchedule]] = masters
+        self._schedules: list[BaseSchedule] = [schedule for _, schedule in masters]
+        self._index: Optional[BranchIndex] = None  # Общий индекс свободных записей (см. _free_index)
+        self._index_checked: bool = False  # Проверено ли, можно ли построить общий индекс
+
+    def _free_index(self) -> Optional[BranchIndex]:
+        """
+        Общий индекс свободных записей мастеров. Строится при первом обращении, если расписания всех мастеров
+        хранятся в памяти, а время записей мастеров вместе не превышает MAX_SLOTS столбцов.
+
+        :return: Индекс или None, если запросы выполняются по расписаниям мастеров
+        """
+        if not self._index_checked:
+            self._index_checked = True
+            if all(isinstance(schedule, Schedule) for schedule in self._schedules):
+                indexes = [schedule.index for schedule in self._schedules]
+                slot_minutes = tuple(sorted({minutes for index in indexes for minutes in index.slot_minutes}))
+                if len(slot_minutes) <= MAX_SLOTS:
+                    self._index = BranchIndex(indexes, slot_minutes)
+                    for schedule in self._schedules:
+                        schedule.listeners.append(self._index.update)
+        return self._index
+
+    def resources(self) -> list[tuple[str, BaseSchedule]]:
+        """
+        Расписания мастеров.
+
+        :return: Пары (имя мастера, расписание)
+        """
+        return self.masters
+
+    def close(self) -> None:
+        """
+        Завершение работы с расписаниями мастеров.
+
+        :return: None
+        """
+        for schedule in self._schedules:
+            schedule.close()
+
+    def has_day(self, ordinal: int) -> bool:
+        """
+        Проверяет, есть ли день в расписании хотя бы одного мастера.
+
+        :param ordinal: Порядковый номер дня
+        :return: Результат проверки
+        """
+        return any(schedule.has_day(ordinal) for schedule in self._schedules)
+
+    def get_date_records(self, user_id: int, sort_filter: Callable[[int, int, int], bool],
+                         cutoff: Optional[int] = None) -> tuple[str, ...]:
+        """
+        Записи в дату, выбранную пользователем, которые удовлетворяют фильтру хотя бы у одного мастера.
+
+        :param user_id: Id пользователя
+        :param sort_filter: Функция-фильтр (см. BaseSchedule.get_date_records)
+        :param cutoff: Текущий момент
+        :return: Время записей, по возрастанию
+        """
+        records: set[str] = set()
+        for schedule in self._schedules:
+            records.update(schedule.get_date_records(user_id, sort_filter, cutoff))
+        return tuple(sorted(records))
+
+    def book_slot(self, user_id: int, key: int, cutoff: Optional[int] = None, replaces: Optional[int] = None) -> bool:
+        """
+        Бронирует запись у первого мастера, у которого она свободна (см. BaseSchedule.book_slot). При переносе
+        сначала пробуется мастер старой записи (перенос одной операцией), иначе новая запись бронируется у другого
+        мастера, а старая после этого отменяется.
+
+        :param user_id: Id пользователя
+        :param key: Момент записи
+        :param cutoff: Текущий момент
+        :param replaces: Момент освобождаемой записи пользователя или None
+        :return: Успешность бронирования
+        """
+        if cutoff is None:
+            cutoff = self.now_cutoff()
+        owner: Optional[BaseSchedule] = None  # Расписание мастера, у которого записана старая запись
+        if replaces is not None:
+            owner = next((schedule for schedule in self._schedules if schedule.is_booked_by(user_id, replaces)), None)
+            if owner is None or replaces <= cutoff:
+                return False
+            if owner.book_slot(user_id, key, cutoff, replaces):
+                return True
+        for schedule in self._schedules:
+            if schedule is not owner and schedule.book_slot(user_id, key, cutoff):
+                if owner is not None:
+                    owner.cancel_booking(user_id, replaces, cutoff)
+                return True
+        return False
+
+    def cancel_booking(self, user_id: int, key: int, cutoff: Optional[int] = None) -> bool:
+        """
+        Отменяет бронь у мастера, у которого записан пользователь (см. BaseSchedule.cancel_booking).
+
+        :param user_id: Id пользователя
+        :param key: Момент записи
+        :param cutoff: Текущий момент
+        :return: Успешность отмены
+        """
+        return any(schedule.cancel_booking(user_id, key, cutoff) for schedule in self._schedules)
+
+    def get_user_bookings(self, user_id: int, cutoff: Optional[int] = None) -> list[int]:
+        """
+        Записи пользователя в будущем у всех мастеров.
+
+        :param user_id: Id пользователя
+        :param cutoff: Текущий момент
+        :return: Моменты записей, по возрастанию
+        """
+        return sorted({key for schedule in self._schedules for key in schedule.get_user_bookings(user_id, cutoff)})
+
+    def get_all_bookings(self, cutoff: Optional[int] = None) -> list[tuple[int, int]]:
+        """
+        Все брони в будущем у всех мастеров.
+
+        :param cutoff: Текущий момент
+        :return: Пары (id пользователя, момент записи)
+        """
+        return [booking for schedule in self._schedules for booking in schedule.get_all_bookings(cutoff)]
+
+    def is_booked_by(self, user_id: int, key: int) -> bool:
+        """
+        Проверяет, записан ли пользователь на момент key хотя бы к одному мастеру.
+
+        :param user_id: Id пользователя
+        :param key: Момент записи
+        :return: Результат проверки
+        """
+        return any(schedule.is_booked_by(user_id, key) for schedule in self._schedules)
+
+    def get_slot_state(self, key: int) -> int:
+        """
+        Общее состояние записи: 0, если она свободна хотя бы у одного мастера; иначе id пользователя, если
+        она забронирована; иначе состояние недоступной записи.
+
+        :param key: Момент записи
+        :return: Состояние записи или NO_RECORD, если записи нет ни у одного мастера
+        """
+        result = NO_RECORD
+        for schedule in self._schedules:
+            state = schedule.get_slot_state(key)
+            if state == 0:
+                return 0
+            if state > 0 and result <= 0 or state != NO_RECORD and result == NO_RECORD:
+                result = state
+        return result
+
+    def get_closest_free_dates(self, days_range: int, cutoff: Optional[int] = None) -> tuple[datetime.date, ...]:
+        """
+        Ближайшие дни, в которых есть свободные записи в будущем хотя бы у одного мастера.
+
+        :param days_range: Сколько дней просмотреть
+        :param cutoff: Текущий момент
+        :return: Дни со свободными записями, по возрастанию
+        """
+        if cutoff is None:
+            cutoff = self.now_cutoff()
+        index = self._free_index()
+        if index is not None:
+            today = cutoff // MINUTES_IN_DAY
+            free_days = index.free_days_between(today, today + days_range)
+            # Сегодняшний день подходит, пока не прошло время его последней свободной записи
+            if free_days and free_days[0] == today and \
+                    today * MINUTES_IN_DAY + index.last_free_minutes(today) <= cutoff:
+                free_days.pop(0)
+            return tuple(datetime.date.fromordinal(ordinal) for ordinal in free_days)
+        days: set[datetime.date] = set()
+        for schedule in self._schedules:
+            days.update(schedule.get_closest_free_dates(days_range, cutoff))
+        return tuple(sorted(days))
+
+    def find_free_slots(self, first_ordinal: int, last_ordinal: int, time_from: int = 0,
+                        time_to: int = MINUTES_IN_DAY, weekdays: int = ALL_WEEKDAYS, limit: int = 10,
+                        after: Optional[int] = None, cutoff: Optional[int] = None) -> list[int]:
+        """
+        Поиск свободных записей (см. BaseSchedule.find_free_slots) по общему индексу мастеров или, если его нет,
+        у каждого мастера ищутся первые limit записей по его индексу, и списки сливаются без повторов.
+
+        :param first_ordinal: Порядковый номер первого дня
+        :param last_ordinal: Порядковый номер дня, следующего за последним
+        :param time_from: Записи не раньше этого времени, минуты от начала дня
+        :param time_to: Записи раньше этого времени, минуты от начала дня
+        :param weekdays: Маска дней недели: бит 0 - понедельник, бит 6 - воскресенье
+        :param limit: Сколько записей найти
+        :param after: Записи позже этого момента (продолжение поиска) или None
+        :param cutoff: Текущий момент
+        :return: Моменты найденных записей, по возрастанию
+        """
+        if cutoff is None:
+            cutoff = self.now_cutoff()
+        index = self._free_index()
+        if index is not None:
+            after_key = cutoff if after is None else max(after, cutoff)
+            return index.find_free(first_ordinal, last_ordinal, after_key, index.window_mask(time_from, time_to),
+                                   weekdays, limit)
+        result: list[int] = []
+        for key in heapq.merge(*(schedule.find_free_slots(first_ordinal, last_ordinal, time_from, time_to, weekdays,
+                                                          limit, after, cutoff) for schedule in self._schedules)):
+            if not result or result[-1] != key:
+                result.append(key)
+                if len(result) == limit:
+                    break
+        return result
+
+    def iter_bookings(self, first_ordinal: int, last_ordinal: int) -> Iterator[tuple[int, int]]:
+        """
+        Перебор броней всех мастеров по возрастанию момента (переборы мастеров сливаются по мере чтения).
+
+        :param first_ordinal: Порядковый номер первого дня
+        :param last_ordinal: Порядковый номер дня, следующего за последним
+        :return: Пары (момент записи, id пользователя)
+        """
+        return heapq.merge(*(schedule.iter_bookings(first_ordinal, last_ordinal) for schedule in self._schedules))
+
+    def set_slots_availability(self, first_ordinal: int, last_ordinal: int, is_open: bool, time_from: int = 0,
+                               time_to: int = MINUTES_IN_DAY, weekdays: int = ALL_WEEKDAYS,
+                               cutoff: Optional[int] = None) -> list[int]:
+        """
+        Массовое открытие или закрытие записей у всех мастеров (см. BaseSchedule.set_slots_availability).
+
+        :param first_ordinal: Порядковый номер первого дня
+        :param last_ordinal: Порядковый номер дня, следующего за последним
+        :param is_open: True - открыть записи, False - закрыть
+        :param time_from: Записи не раньше этого времени, минуты от начала дня
+        :param time_to: Записи раньше этого времени, минуты от начала дня
+        :param weekdays: Маска дней недели: бит 0 - понедельник, бит 6 - воскресенье
+        :param cutoff: Текущий момент
+        :return: Моменты измененных записей (у разных мастеров моменты могут совпадать)
+        """
+        return [key for schedule in self._schedules for key in schedule.set_slots_availability(
+            first_ordinal, last_ordinal, is_open, time_from, time_to, weekdays, cutoff)]
+
+
+class ResourceSchedule(BranchSchedule):
+    """
+    Расписание нескольких филиалов с несколькими мастерами: филиал -> мастер -> записи. Каждый пользователь
+    выбирает филиал и, если хочет, мастера (select); выбор хранится так же, как даты, выбранные во время брони.
+    Выбор даты, времени и бронирование выполняются в расписании выбранного мастера или в общем расписании филиала
+    (любой свободный мастер, см. BranchSchedule). Записи пользователя, отмена брони и остальные операции без
+    пользователя относятся ко всем филиалам.
+    """
+
+    def __init__(self, branches: list[tuple[str, BranchSchedule]], booking_dates: MutableMapping,
+                 selections: Optional[MutableMapping] = None, clock: Optional[Clock] = None) -> None:
+        """
+        Конструктор.
+
+        :param branches: Филиалы: (название, общее расписание мастеров филиала)
+        :param booking_dates: Общее хранилище дат, выбранных пользователями во время брони
+        :param selections: Хранилище выбора пользователей: id пользователя -> (номер филиала, номер мастера или -1,
+            если подходит любой мастер). По умолчанию - SessionStore в памяти процесса
+        :param clock: Часы парикмахерской (см. BaseSchedule)
+        """
+        super().__init__([(f"{branch_name} / {master_name}", schedule)
+                          for branch_name, branch in branches for master_name, schedule in branch.masters],
+                         booking_dates, clock)
+        self.branches: list[tuple[str, BranchSchedule]] = branches
+        self.selections: MutableMapping[int, tuple[int, int]] = SessionStore() if selections is None else selections
+        self.journal: Optional[BookingJournal] = None  # Общий журнал мастеров, закрывается после их расписаний
+
+    def close(self) -> None:
+        """
+        Завершение работы с расписаниями мастеров и их общим журналом.
+
+        :return: None
+        """
+        super().close()
+        if self.journal is not None:
+            self.journal.close()
+
+    def branch_names(self) -> tuple[str, ...]:
+        """
+        Названия филиалов.
+
+        :return: Названия, по номерам филиалов
+        """
+        return tuple(name for name, _ in self.branches)
+
+    def master_names(self, branch: int) -> tuple[str, ...]:
+        """
+        Имена мастеров филиала.
+
+        :param branch: Номер филиала
+        :return: Имена, по номерам мастеров
+        """
+        return tuple(name for name, _ in self.branches[branch][1].masters)
+
+    def select(self, user_id: int, branch: int, master: int = -1) -> bool:
+        """
+        Выбор филиала и мастера пользователем. Дата, выбранная ранее, сбрасывается.
+
+        :param user_id: Id пользователя
+        :param branch: Номер филиала
+        :param master: Номер мастера в филиале или -1, если подходит любой мастер
+        :return: Успешность выбора (False, если такого филиала или мастера нет)
+        """
+        if not 0 <= branch < len(self.branches) or not -1 <= master < len(self.branches[branch][1].masters):
+            return False
+        self.selections[user_id] = (branch, master)
+        self.reset_booking_date(user_id)
+        return True
+
+    def selection(self, user_id: int) -> tuple[int, int]:
+        """
+        Филиал и мастер, выбранные пользователем. По умолчанию - первый филиал, любой мастер.
+
+        :param user_id: Id пользователя
+        :return: (номер филиала, номер мастера или -1)
+        """
+        return self.selections.get(user_id, (0, -1))
+
+    def selection_name(self, user_id: int) -> str:
+        """
+        Название филиала и имя мастера, выбранных пользователем.
+
+        :param user_id: Id пользователя
+        :return: Название
+        """
+        branch, master = self.selection(user_id)
+        branch_name, schedule = self.branches[branch]
+        return f"{branch_name}, {'любой мастер' if master < 0 else 'мастер ' + schedule.masters[master][0]}"
+
+    def for_user(self, user_id: int) -> BaseSchedule:
+        """
+        Расписание, выбранное пользователем: расписание мастера или общее расписание филиала.
+
+        :param user_id: Id пользователя
+        :return: Расписание
+        """
+        branch, master = self.selection(user_id)
+        schedule = self.branches[branch][1]
+        return schedule if master < 0 else schedule.masters[master][1]
+
+    def set_booking_date(self, user_id: int, str_date: str, cutoff: Optional[int] = None) -> bool:
+        """
+        Установка даты бронирования: дата должна быть в расписании, выбранном пользователем.
+
+        :param user_id: Id пользователя
+        :param str_date: Дата бронирования в формате строки
+        :param cutoff: Текущий момент
+        :return: Успешность установки даты
+        """
+        return self.for_user(user_id).set_booking_date(user_id, str_date, cutoff)
+
+    def get_date_records(self, user_id: int, sort_filter: Callable[[int, int, int], bool],
+                         cutoff: Optional[int] = None) -> tuple[str, ...]:
+        """
+        Записи в дату, выбранную пользователем, в выбранном им расписании.
+
+        :param user_id: Id пользователя
+        :param sort_filter: Функция-фильтр (см. BaseSchedule.get_date_records)
+        :param cutoff: Текущий момент
+        :return: Время записей, по возрастанию
+        """
+        return self.for_user(user_id).get_date_records(user_id, sort_filter, cutoff)
+
+    def book_slot(self, user_id: int, key: int, cutoff: Optional[int] = None, replaces: Optional[int] = None) -> bool:
+        """
+        Бронирует запись в расписании, выбранном пользователем. Если переносимая запись находится в другом
+        филиале (или у другого мастера), новая запись бронируется, а старая после этого отменяется.
+
+        :param user_id: Id пользователя
+        :param key: Момент записи
+        :param cutoff: Текущий момент
+        :param replaces: Момент освобождаемой записи пользователя или None
+        :return: Успешность бронирования
+        """
+        if cutoff is None:
+            cutoff = self.now_cutoff()
+        schedule = self.for_user(user_id)
+        if replaces is None or schedule.is_booked_by(user_id, replaces):
+            return schedule.book_slot(user_id, key, cutoff, replaces)
+        if replaces <= cutoff or not self.is_booked_by(user_id, replaces) or \
+                not schedule.book_slot(user_id, key, cutoff):
+            return False
+        self.cancel_booking(user_id, replaces, cutoff)
+        return True
+
+
+def load_resources(filename: str, open_master: Callable[[dict, str], BaseSchedule],
+                   booking_dates: MutableMapping, selections: Optional[MutableMapping] = None,
+                   clock: Optional[Clock] = None) -> ResourceSchedule:
+    """
+    Загрузка филиалов и мастеров из файла:
+    {"branches": [{"name": "...", "masters": [{"name": "...", "schedule": "...", "database": "..."}, ...]}, ...]}.
+
+    :param filename: Имя файла
+    :param open_master: Функция, которая открывает расписание мастера по его описанию из файла и номеру
+        ("номер_филиала.номер_мастера", с 1)
+    :param booking_dates: Общее хранилище дат, выбранных пользователями во время брони
+    :param selections: Хранилище выбора пользователей (см. ResourceSchedule)
+    :param clock: Часы парикмахерской (см. BaseSchedule)
+    :return: Расписание филиалов
+    """
+    with open(filename, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    branches: list[tuple[str, BranchSchedule]] = []
+    for branch_number, branch in enumerate(data["branches"], start=1):
+        masters = [(master["name"], open_master(master, f"{branch_number}.{master_number}"))
+                   for master_number, master in enumerate(branch["masters"], start=1)]
+        if not masters:
+            raise ValueError(f"В филиале {branch['name']} нет мастеров")
+        branches.append((branch["name"], BranchSchedule(masters, booking_dates, clock)))
+    if not branches:
+        raise ValueError(f"В файле {filename} нет филиалов")
+    return ResourceSchedule(branches, booking_dates, selections, clock)
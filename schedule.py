@@ -1,27 +1,57 @@
+import bisect
 import datetime
-import json
-from typing import Callable, Any
+import os
+from abc import ABC, abstractmethod
+from collections.abc import MutableMapping
+from typing import Callable, Iterator, Optional
 
+from clock import Clock
+from journal import BookingJournal
+from session_store import SessionStore
+from schedule_index import (ALL_WEEKDAYS, MINUTES_IN_DAY, NO_RECORD, UNAVAILABLE, ScheduleIndex, format_minutes,
+                            load_binary, load_index, parse_date, parse_time)
 
-class Schedule:
+INDEX_SNAPSHOT_NAME: str = "snapshot.bin"  # Файл снимка индекса в каталоге журнала
+
+
+class BaseSchedule(ABC):
     """
-    Класс для работы с расписанием.
+    Общая часть классов для работы с расписанием: даты, выбранные пользователями во время брони,
+    проверка введенных дат и времени, фильтры записей.
+
+    Время в фильтрах представлено целым числом минут от начала эпохи datetime.date.toordinal:
+    номер_дня * MINUTES_IN_DAY + минуты_от_начала_дня. Текущий момент (cutoff) вычисляется один раз на запрос
+    по часам парикмахерской (clock, в её часовом поясе), запись находится в будущем, если её момент больше
+    cutoff. Этим же числом (моментом записи) запись указывается в операциях бронирования, отмены и переноса.
+
+    Операции с хранилищем записей - абстрактные методы: их реализует каждое хранилище (Schedule, SqliteSchedule,
+    resources.BranchSchedule).
     """
 
-    def __init__(self, filename: str) -> None:
+    def __init__(self, booking_dates: Optional[MutableMapping] = None, clock: Optional[Clock] = None) -> None:
         """
-        Конструктор. Принимает имя файла, содержащего расписание в формате json.
+        Конструктор.
 
-        :param filename: Имя файла
+        :param booking_dates: Хранилище дат, выбранных пользователями во время брони. По умолчанию - SessionStore
+            в памяти процесса (брошенные брони удаляются по времени и по размеру хранилища); для нескольких
+            процессов передается общее хранилище (см. sqlite_schedule.SqliteSessionStore)
+        :param clock: Часы парикмахерской (по умолчанию - в часовом поясе сервера)
         """
-        self.booking_dates: dict[int: datetime.date] = {}  # Словарь дат броней (Id_пользователя: дата брони)
+        self.clock: Clock = Clock() if clock is None else clock
+        # Словарь дат броней (Id_пользователя: дата брони)
+        self.booking_dates: MutableMapping[int, datetime.date] = \
+            SessionStore() if booking_dates is None else booking_dates
         # Этот словарь используется для хранения выбранной даты во время брони
         # После бронирования пользователем, информация о выбранной дате пользователем должна очищаться
 
-        # Информация, о пользователях, которые недавно сделали бронь (чтобы менеджер смог с ними связаться)
-        self.booked_users_id: set[int] = set()
-        with open(filename, "r") as f:
-            self.schedule: dict[str, Any] = json.load(f)  # Расписание
+    def now_cutoff(self) -> int:
+        """
+        Текущий момент в минутах по часам парикмахерской. Вычисляется один раз на запрос и передается
+        во все фильтры.
+
+        :return: Текущий момент
+        """
+        return self.clock.cutoff()
 
     def reset_booking_date(self, user_id: int) -> None:
         """
@@ -30,22 +60,22 @@ class Schedule:
         :param user_id: Id пользователя
         :return: None
         """
-        if user_id in self.booking_dates:
-            self.booking_dates.pop(user_id)
+        self.booking_dates.pop(user_id, None)
 
-    def set_booking_date(self, user_id: int, str_date: str) -> bool:
+    def set_booking_date(self, user_id: int, str_date: str, cutoff: Optional[int] = None) -> bool:
         """
         Установка даты бронирования для пользователя.
 
         :param user_id: Id пользователя
         :param str_date: Дата бронирования в формате строки
+        :param cutoff: Текущий момент
         :return: Успешность установки даты
         """
-        if not self.is_date_correct(str_date):
+        ordinal = parse_date(str_date)
+        if ordinal < 0:
             return False
-        self.booking_dates[user_id] = datetime.date(day=int(str_date[:2]), month=int(str_date[3:5]),
-                                                    year=int(str_date[6:]))
-        if not self.is_user_date_exist(user_id):
+        self.booking_dates[user_id] = datetime.date.fromordinal(ordinal)
+        if not self.is_user_date_exist(user_id, cutoff):
             self.reset_booking_date(user_id)
             return False
         return True
@@ -67,28 +97,22 @@ class Schedule:
         :param str_date: Дата
         :return: Результат проверки
         """
-        try:
-            datetime.datetime.strptime(str_date, "%d.%m.%Y")
-        except ValueError:
-            return False
-        else:
-            return True
+        return parse_date(str_date) >= 0
 
-    def is_user_date_exist(self, user_id: int) -> bool:
+    def is_user_date_exist(self, user_id: int, cutoff: Optional[int] = None) -> bool:
         """
         Функция проверяет, есть ли дата, выбранная пользователем, в расписании.
 
         :type user_id: Id пользователя
+        :param cutoff: Текущий момент
         :return: None
         """
-        try:
-            # Переменные для доступа к записи, используются для лучшей читабельности
-            year_data = self.schedule[str(self.booking_dates[user_id].year)]
-            month_data = year_data["months"][self.booking_dates[user_id].month - 1]
-            day_data = month_data["days"][self.booking_dates[user_id].day - 1]
-            return self.booking_dates[user_id] >= datetime.date.today()
-        except (ValueError, KeyError):
+        if user_id not in self.booking_dates:
             return False
+        if cutoff is None:
+            cutoff = self.now_cutoff()
+        ordinal = self.booking_dates[user_id].toordinal()
+        return self.has_day(ordinal) and ordinal >= cutoff // MINUTES_IN_DAY
 
     @staticmethod
     def is_time_correct(str_time: str) -> bool:
@@ -98,153 +122,694 @@ class Schedule:
         :param str_time: Время
         :return: Результат проверки
         """
-        try:
-            datetime.datetime.strptime(str_time, "%H:%M")
-        except ValueError:
-            return False
+        return parse_time(str_time) >= 0
+
+    @staticmethod
+    def any_record(record_key: int, record_state: int, cutoff: int) -> bool:
+        """
+        Функция фильтр. Любая запись подходит.
+
+        :param record_key: Момент записи
+        :param record_state: Состояние записи
+        :param cutoff: Текущий момент
+        :return: True всегда
+        """
+        return True
+
+    @staticmethod
+    def free_record(record_key: int, record_state: int, cutoff: int) -> bool:
+        """
+        Функция фильтр. Запись должна быть свободна. Запись должна быть в будущем.
+
+        :param record_key: Момент записи
+        :param record_state: Состояние записи
+        :param cutoff: Текущий момент
+        :return: Результат проверки
+        """
+        return record_state == 0 and record_key > cutoff
+
+    @abstractmethod
+    def has_day(self, ordinal: int) -> bool:
+        """
+        Проверяет, есть ли день в расписании. Реализуется хранилищем расписания.
+
+        :param ordinal: Порядковый номер дня
+        :return: Результат проверки
+        """
+
+    def booking_key(self, user_id: int, str_time: str) -> int:
+        """
+        Момент записи на время str_time в дату, выбранную пользователем.
+
+        :param user_id: Id пользователя
+        :param str_time: Время записи
+        :return: Момент записи или -1, если дата не выбрана или время некорректно
+        """
+        minutes = parse_time(str_time)
+        if minutes < 0 or user_id not in self.booking_dates:
+            return -1
+        return self.booking_dates[user_id].toordinal() * MINUTES_IN_DAY + minutes
+
+    def try_book_record(self, user_id: int, str_time: str, cutoff: Optional[int] = None,
+                        replaces: Optional[int] = None) -> bool:
+        """
+        Бронирует запись, если она свободна и находится в будущем. Проверка и бронирование выполняются атомарно.
+        Дата брони хранится в self.booking_dates.
+
+        :param user_id: Id пользователя
+        :param str_time: Время брони
+        :param cutoff: Текущий момент
+        :param replaces: Момент записи пользователя, которая освобождается вместе с бронированием (перенос записи)
+        :return: Успешность бронирования
+        """
+        key = self.booking_key(user_id, str_time)
+        return key >= 0 and self.book_slot(user_id, key, cutoff, replaces)
+
+    @abstractmethod
+    def book_slot(self, user_id: int, key: int, cutoff: Optional[int] = None, replaces: Optional[int] = None) -> bool:
+        """
+        Бронирует запись с моментом key, если она свободна и находится в будущем. Если задан replaces, запись
+        пользователя с этим моментом освобождается в той же операции (перенос): перенос выполняется, только если
+        новая запись свободна, а старая принадлежит пользователю и находится в будущем. Реализуется хранилищем
+        расписания.
+
+        :param user_id: Id пользователя
+        :param key: Момент записи
+        :param cutoff: Текущий момент
+        :param replaces: Момент освобождаемой записи пользователя или None
+        :return: Успешность бронирования
+        """
+
+    @abstractmethod
+    def cancel_booking(self, user_id: int, key: int, cutoff: Optional[int] = None) -> bool:
+        """
+        Отменяет бронь: запись освобождается, если она принадлежит пользователю и находится в будущем.
+        Реализуется хранилищем расписания.
+
+        :param user_id: Id пользователя
+        :param key: Момент записи
+        :param cutoff: Текущий момент
+        :return: Успешность отмены
+        """
+
+    @abstractmethod
+    def get_user_bookings(self, user_id: int, cutoff: Optional[int] = None) -> list[int]:
+        """
+        Записи пользователя в будущем. Реализуется хранилищем расписания.
+
+        :param user_id: Id пользователя
+        :param cutoff: Текущий момент
+        :return: Моменты записей, по возрастанию
+        """
+
+    @abstractmethod
+    def get_all_bookings(self, cutoff: Optional[int] = None) -> list[tuple[int, int]]:
+        """
+        Все брони в будущем (например, для напоминаний). Реализуется хранилищем расписания.
+
+        :param cutoff: Текущий момент
+        :return: Пары (id пользователя, момент записи)
+        """
+
+    @abstractmethod
+    def iter_bookings(self, first_ordinal: int, last_ordinal: int) -> Iterator[tuple[int, int]]:
+        """
+        Перебор броней в промежутке дней [first_ordinal, last_ordinal) по возрастанию момента (например, для выгрузки).
+        Брони читаются по частям, промежуток не загружается в память целиком. Реализуется хранилищем расписания.
+
+        :param first_ordinal: Порядковый номер первого дня
+        :param last_ordinal: Порядковый номер дня, следующего за последним
+        :return: Пары (момент записи, id пользователя)
+        """
+
+    @abstractmethod
+    def set_slots_availability(self, first_ordinal: int, last_ordinal: int, is_open: bool, time_from: int = 0,
+                               time_to: int = MINUTES_IN_DAY, weekdays: int = ALL_WEEKDAYS,
+                               cutoff: Optional[int] = None) -> list[int]:
+        """
+        Массовое открытие или закрытие записей в будущем (отпуск, праздники, новые часы работы): в промежутке дней
+        [first_ordinal, last_ordinal) с фильтром по дням недели и времени свободные записи закрываются (состояние
+        UNAVAILABLE) или закрытые записи открываются. Забронированные записи не изменяются. Все изменения
+        записываются одной операцией. Реализуется хранилищем расписания.
+
+        :param first_ordinal: Порядковый номер первого дня
+        :param last_ordinal: Порядковый номер дня, следующего за последним
+        :param is_open: True - открыть записи, False - закрыть
+        :param time_from: Записи не раньше этого времени, минуты от начала дня
+        :param time_to: Записи раньше этого времени, минуты от начала дня
+        :param weekdays: Маска дней недели: бит 0 - понедельник, бит 6 - воскресенье
+        :param cutoff: Текущий момент
+        :return: Моменты измененных записей (для журнала аудита)
+        """
+
+    def is_booked_by(self, user_id: int, key: int) -> bool:
+        """
+        Проверяет, записан ли пользователь на момент key.
+
+        :param user_id: Id пользователя
+        :param key: Момент записи
+        :return: Результат проверки
+        """
+        return self.get_slot_state(key) == user_id
+
+    def for_user(self, user_id: int) -> "BaseSchedule":
+        """
+        Расписание, в котором пользователь выбирает дату и время. Для расписания с несколькими ресурсами
+        (см. resources.ResourceSchedule) - расписание ресурса, выбранного пользователем.
+
+        :param user_id: Id пользователя
+        :return: Расписание
+        """
+        return self
+
+    def resources(self) -> list[tuple[str, "BaseSchedule"]]:
+        """
+        Расписания ресурсов (мастеров), из которых состоит расписание. Обычное расписание - один ресурс без имени.
+
+        :return: Пары (имя ресурса, расписание)
+        """
+        return [("", self)]
+
+    @abstractmethod
+    def get_slot_state(self, key: int) -> int:
+        """
+        Состояние записи. Реализуется хранилищем расписания. Занятые записи нерабочих дней - не брони:
+        для них возвращается UNAVAILABLE (см. schedule_index.ScheduleIndex.booking_state).
+
+        :param key: Момент записи
+        :return: Состояние записи или NO_RECORD, если записи нет в расписании
+        """
+
+    @abstractmethod
+    def get_closest_free_dates(self, days_range: int, cutoff: Optional[int] = None) -> tuple[datetime.date, ...]:
+        """
+        Возвращает ближайшие days_range дней, включая сегодняшний день, в которых есть свободные записи в будущем.
+        Реализуется хранилищем расписания.
+
+        :param days_range: Сколько дней просмотреть
+        :param cutoff: Текущий момент
+        :return: Дни со свободными записями
+        """
+
+    @abstractmethod
+    def find_free_slots(self, first_ordinal: int, last_ordinal: int, time_from: int = 0,
+                        time_to: int = MINUTES_IN_DAY, weekdays: int = ALL_WEEKDAYS, limit: int = 10,
+                        after: Optional[int] = None, cutoff: Optional[int] = None) -> list[int]:
+        """
+        Поиск свободных записей в будущем в промежутке дней [first_ordinal, last_ordinal) с фильтром по дням недели
+        и времени. Возвращает первые limit записей; следующая страница запрашивается с after, равным последней
+        записи предыдущей страницы. Реализуется хранилищем расписания.
+
+        :param first_ordinal: Порядковый номер первого дня
+        :param last_ordinal: Порядковый номер дня, следующего за последним
+        :param time_from: Записи не раньше этого времени, минуты от начала дня
+        :param time_to: Записи раньше этого времени, минуты от начала дня
+        :param weekdays: Маска дней недели: бит 0 - понедельник, бит 6 - воскресенье
+        :param limit: Сколько записей найти
+        :param after: Записи позже этого момента (продолжение поиска) или None
+        :param cutoff: Текущий момент
+        :return: Моменты найденных записей (номер_дня * MINUTES_IN_DAY + минуты), по возрастанию
+        """
+
+    def close(self) -> None:
+        """
+        Завершение работы с расписанием.
+
+        :return: None
+        """
+
+
+class Schedule(BaseSchedule):
+    """
+    Класс для работы с расписанием, загруженным из json файла в память.
+    """
+
+    def __init__(self, filename: str, journal_dir: Optional[str] = None,
+                 booking_dates: Optional[MutableMapping] = None,
+                 booked_users_id: Optional[MutableMapping] = None, clock: Optional[Clock] = None,
+                 journal: Optional[BookingJournal] = None, resource: str = "") -> None:
+        """
+        Конструктор. Принимает имя файла, содержащего расписание в формате json.
+        Расписание один раз переводится в плоский индекс, все запросы выполняются по нему.
+        Если указан каталог журнала, расписание восстанавливается из последнего снимка и журнала изменений,
+        а все последующие изменения записываются в журнал (см. BookingJournal). Вместо каталога можно передать
+        журнал, общий для расписаний нескольких ресурсов: тогда журнал открывает и закрывает его владелец
+        (после создания всех расписаний).
+
+        :param filename: Имя файла
+        :param journal_dir: Каталог журнала бронирований
+        :param booking_dates: Хранилище дат, выбранных пользователями во время брони (см. BaseSchedule)
+        :param booked_users_id: Хранилище пользователей, которые недавно сделали бронь
+            (по умолчанию - SessionStore, пользователи хранятся 30 дней)
+        :param clock: Часы парикмахерской (см. BaseSchedule)
+        :param journal: Общий журнал бронирований (вместо journal_dir)
+        :param resource: Имя ресурса, под которым изменения расписания пишутся в общий журнал
+        """
+        super().__init__(booking_dates, clock)
+        # Информация, о пользователях, которые недавно сделали бронь (чтобы менеджер смог с ними связаться).
+        # Ключ - id пользователя, значение - True
+        self.booked_users_id: MutableMapping[int, bool] = \
+            SessionStore(ttl=30 * 24 * 3600) if booked_users_id is None else booked_users_id
+        self.journal: Optional[BookingJournal] = None  # Журнал изменений расписания
+        self.resource: str = resource  # Ресурс расписания в журнале
+        self._owns_journal: bool = journal is None  # Журнал открывается и закрывается этим расписанием
+        if journal_dir is not None and journal is None:
+            journal = BookingJournal(journal_dir)
+        if journal is None:
+            self.index: ScheduleIndex = load_index(filename)  # Расписание
+        else:
+            self._restore(filename, journal)
+        # Записи пользователей в будущем: id пользователя -> моменты записей. Заполняется при первом обращении
+        # (см. _bookings), чтобы запуск не читал весь индекс; обновляется в set_record_state, прошедшие записи
+        # удаляются при чтении (см. get_user_bookings)
+        self._user_bookings: Optional[dict[int, set[int]]] = None
+
+        # Кэш ближайших дней со свободными записями (см. get_closest_free_dates)
+        self._closest_days: Optional[list[int]] = None  # Порядковые номера дней
+        self._closest_range: int = 0  # Сколько дней просмотрено
+        self._closest_since: int = 0  # Момент, с которого кэш действителен
+        self._closest_expiry: int = 0  # Момент, начиная с которого кэш устаревает
+        # Функции, которые вызываются с порядковым номером дня после изменения записи в нем (например, общий
+        # индекс мастеров филиала, см. resources.BranchIndex)
+        self.listeners: list[Callable[[int], None]] = []
+
+    def _restore(self, filename: str, journal: BookingJournal) -> None:
+        """
+        Восстановление расписания из снимка и журнала изменений. Если в снимке нет расписания ресурса, расписание
+        загружается из файла.
+
+        :param filename: Имя файла с расписанием
+        :param journal: Журнал изменений
+        :return: None
+        """
+        snapshot_state, changes = journal.restore(self.resource)
+        if snapshot_state is None:
+            self.index = load_index(filename)
         else:
-            return True
+            if "index_file" in snapshot_state:  # Индекс хранится в двоичном файле и отображается в память
+                self.index = load_binary(os.path.join(journal.directory, snapshot_state["index_file"]))
+            else:
+                self.index = ScheduleIndex.from_dict(snapshot_state["index"])
+            self.booked_users_id.update(dict.fromkeys(snapshot_state["booked_users_id"], True))
+        for ordinal, minutes, state, user_id in changes:
+            self.index.set_state(ordinal, self.index.slot_minutes.index(minutes), state)
+            if user_id and state == user_id:
+                self.booked_users_id[user_id] = True
+        self.journal = journal
+        journal.register(self.resource, self._snapshot)
+        if self._owns_journal:
+            journal.open(compact=journal.replayed > 0)
+
+    def _snapshot(self) -> Callable[[], dict]:
+        """
+        Снятие копии расписания для снимка журнала. Индекс не копируется: снимок индекса сохраняет только дни,
+        измененные до его записи (см. ScheduleIndex.freeze).
+
+        :return: Функция, переводящая копию в json-совместимый словарь
+        """
+        index = self.index.freeze()
+        booked_users_id = list(self.booked_users_id)
+        directory = self.journal.directory
+        index_file = f"index.{self.resource}.bin" if self.resource else INDEX_SNAPSHOT_NAME
+
+        def serialize() -> dict:
+            # Индекс пишется в двоичный файл рядом со снимком: при запуске он отображается в память, а не разбирается
+            index.save(os.path.join(directory, index_file))
+            return {"index_file": index_file, "booked_users_id": booked_users_id}
+        return serialize
+
+    def close(self) -> None:
+        """
+        Завершение работы с расписанием: журнал дописывается на диск и закрывается (общий журнал закрывает
+        его владелец).
+
+        :return: None
+        """
+        if self.journal is not None and self._owns_journal:
+            self.journal.close()
+
+    def has_day(self, ordinal: int) -> bool:
+        """
+        Проверяет, есть ли день в расписании.
+
+        :param ordinal: Порядковый номер дня
+        :return: Результат проверки
+        """
+        return self.index.has_day(ordinal)
+
+    def _bookings(self) -> dict[int, set[int]]:
+        """
+        Записи пользователей. При первом обращении заполняются по индексу, начиная с сегодняшнего дня: читаются
+        только рабочие дни, в которых есть занятые записи (см. ScheduleIndex.day_bookings).
+
+        :return: Id пользователя -> моменты записей
+        """
+        if self._user_bookings is None:
+            index = self.index
+            user_bookings: dict[int, set[int]] = {}
+            for ordinal in range(max(self.now_cutoff() // MINUTES_IN_DAY, index.first_ordinal),
+                                 index.first_ordinal + index.days_count):
+                day_key = ordinal * MINUTES_IN_DAY
+                for slot, user_id in index.day_bookings(ordinal):
+                    user_bookings.setdefault(user_id, set()).add(day_key + index.slot_minutes[slot])
+            self._user_bookings = user_bookings
+        return self._user_bookings
+
+    def _future_bookings(self, user_id: int, keys: set[int], cutoff: int) -> set[int]:
+        """
+        Удаление прошедших записей пользователя из записей пользователей.
+
+        :param user_id: Id пользователя
+        :param keys: Моменты записей пользователя (из self._user_bookings)
+        :param cutoff: Текущий момент
+        :return: Оставшиеся записи (те же keys)
+        """
+        past = [key for key in keys if key <= cutoff]
+        if past:
+            keys.difference_update(past)
+            if not keys:
+                del self._user_bookings[user_id]
+        return keys
+
+    def _slot_of(self, key: int) -> tuple[int, int]:
+        """
+        Порядковый номер дня и номер столбца записи по её моменту.
 
-    def get_date_records(self, user_id: int, sort_filter: Callable[[str, datetime.date, int], bool]) -> tuple[str, ...]:
+        :param key: Момент записи
+        :return: (порядковый номер дня, номер столбца или -1, если такого времени нет в расписании)
+        """
+        ordinal, minutes = divmod(key, MINUTES_IN_DAY)
+        return ordinal, self.index.slot_index(format_minutes(minutes))
+
+    def get_slot_state(self, key: int) -> int:
+        """
+        Состояние записи.
+
+        :param key: Момент записи
+        :return: Состояние записи или NO_RECORD, если записи нет в расписании
+        """
+        return self.index.booking_state(*self._slot_of(key))
+
+    def get_date_records(self, user_id: int, sort_filter: Callable[[int, int, int], bool],
+                         cutoff: Optional[int] = None) -> tuple[str, ...]:
         """
         Функция возвращает кортеж записей, которые удовлетворяют фильтру sort_filter, а также их дата - дата
         бронирования. Выбранная пользователем дата передается в словаре self.booking_dates.
+        Фильтру передается момент записи, её состояние и текущий момент.
 
         :param user_id: Id пользователя
         :param sort_filter: Функция-фильтр
+        :param cutoff: Текущий момент
         :return: Выбранные записи
         """
         if user_id not in self.booking_dates:
             return tuple()
+        if cutoff is None:
+            cutoff = self.now_cutoff()
         result: list[str] = []  # Список для сбора подходящих записей
-        # Переменные для доступа к записи, используются для лучшей читабельности
-        year_data = self.schedule[str(self.booking_dates[user_id].year)]
-        month_data = year_data["months"][self.booking_dates[user_id].month - 1]
-        day_data = month_data["days"][self.booking_dates[user_id].day - 1]
-        for record_time, record_state in day_data["records"].items():  # Перебор записей
-            if sort_filter(record_time, self.booking_dates[user_id], record_state):  # Если запись соответсвует фильтру
-                result.append(record_time)  # Добавить её
+        day_key = self.booking_dates[user_id].toordinal() * MINUTES_IN_DAY
+        slot_minutes = self.index.slot_minutes
+        for slot, record_state in self.index.day_records(self.booking_dates[user_id].toordinal()):  # Перебор записей
+            if sort_filter(day_key + slot_minutes[slot], record_state, cutoff):  # Если запись соответсвует фильтру
+                result.append(self.index.slot_times[slot])  # Добавить её
         return tuple(result)
 
-    def book_record(self, user_id: int, str_time: str) -> bool:
+    def book_slot(self, user_id: int, key: int, cutoff: Optional[int] = None, replaces: Optional[int] = None) -> bool:
         """
-        Функция бронирует запись. Время брони передается. Дата брони хранится в self.booking_dates.
+        Бронирует запись, если она свободна и находится в будущем, и освобождает запись replaces при переносе
+        (см. BaseSchedule.book_slot). Расписание находится в памяти и изменяется только из одного потока, поэтому
+        проверка и изменения не могут быть разделены другим изменением.
 
         :param user_id: Id пользователя
-        :param str_time: Время брони
+        :param key: Момент записи
+        :param cutoff: Текущий момент
+        :param replaces: Момент освобождаемой записи пользователя или None
         :return: Успешность бронирования
         """
-        if not self.is_time_correct(str_time):
+        if cutoff is None:
+            cutoff = self.now_cutoff()
+        if key <= cutoff or self.get_slot_state(key) != 0:
             return False
-        try:
-            # Переменные для доступа к записи, используются для лучшей читабельности
-            year_data = self.schedule[str(self.booking_dates[user_id].year)]
-            month_data = year_data["months"][self.booking_dates[user_id].month - 1]
-            day_data = month_data["days"][self.booking_dates[user_id].day - 1]
-            day_data["records"][str_time] = user_id  # Бронирование записи
-            self.booked_users_id.add(user_id)  # Добавление id клиента в множество недавно бронировавших
-            return True
-        except (ValueError, KeyError):
+        if replaces is not None and (replaces <= cutoff or self.get_slot_state(replaces) != user_id):
             return False
+        # Сначала бронируется новая запись: если работа прервется между изменениями, после восстановления
+        # из журнала у пользователя останутся обе записи, а не ни одной
+        self.set_record_state(*self._slot_of(key), user_id, user_id)
+        self.booked_users_id[user_id] = True
+        if replaces is not None:
+            self.set_record_state(*self._slot_of(replaces), 0, user_id)
+        return True
 
-    def is_record_free(self, user_id: int, str_time: str) -> bool:
+    def cancel_booking(self, user_id: int, key: int, cutoff: Optional[int] = None) -> bool:
         """
-        Проверяет, можно ли записаться на данное время. Дата хранится в словаре self.booking_dates.
+        Отменяет бронь: запись освобождается, если она принадлежит пользователю и находится в будущем.
+        Освободившаяся запись сразу появляется среди свободных (индекс и кэш обновляются в set_record_state).
 
         :param user_id: Id пользователя
-        :param str_time: Время
-        :return: Свободно ли окно
+        :param key: Момент записи
+        :param cutoff: Текущий момент
+        :return: Успешность отмены
         """
-        try:
-            # Переменные для доступа к записи, используются для лучшей читабельности
-            year_data = self.schedule[str(self.booking_dates[user_id].year)]
-            month_data = year_data["months"][self.booking_dates[user_id].month - 1]
-            day_data = month_data["days"][self.booking_dates[user_id].day - 1]
-            # Бронируемое время - в будущем или нет? Если нет - то забронировать его будет невозможно
-            is_future = self.booking_dates[user_id] > datetime.date.today() or \
-                        (self.booking_dates[user_id] == datetime.date.today() and \
-                         datetime.datetime.strptime(str_time, "%H:%M").time() > datetime.datetime.now().time())
-            if is_future and day_data["records"][str_time] == 0:
-                return True
-            else:
-                return False
-        except (ValueError, KeyError):
+        if cutoff is None:
+            cutoff = self.now_cutoff()
+        if key <= cutoff or self.get_slot_state(key) != user_id:
             return False
+        self.set_record_state(*self._slot_of(key), 0, user_id)
+        return True
 
-    def get_closest_dates(self, days_range: int, sort_filter: Callable[[dict[str, Any]], bool]):
+    def get_user_bookings(self, user_id: int, cutoff: Optional[int] = None) -> list[int]:
         """
-        Возвращает ближайшие days_range дней, включая сегодняшний день, которые удовлетворяют функции фильтру.
+        Записи пользователя в будущем.
 
-        :param days_range: Сколько дней просмотреть
-        :param sort_filter: Функция-фильтр
-        :return: Дни, удовлетворяющие условиям
-        """
-        today: datetime.date = datetime.date.today()
-        result: list[dict[str, Any]] = []
-        for i in range(days_range):
-            cur_date: datetime.date = today + datetime.timedelta(days=i)
-            year_data = self.schedule[str(cur_date.year)]
-            month_data = year_data["months"][cur_date.month - 1]
-            day_data = month_data["days"][cur_date.day - 1]
-            if sort_filter(day_data):
-                result.append(day_data)
-        return tuple(result)
+        :param user_id: Id пользователя
+        :param cutoff: Текущий момент
+        :return: Моменты записей, по возрастанию
+        """
+        if cutoff is None:
+            cutoff = self.now_cutoff()
+        keys = self._bookings().get(user_id)
+        return [] if keys is None else sorted(self._future_bookings(user_id, keys, cutoff))
 
-    @staticmethod
-    def any_record(record) -> bool:
+    def get_all_bookings(self, cutoff: Optional[int] = None) -> list[tuple[int, int]]:
         """
-        Функция фильтр. Любая запись подходит.
+        Все брони в будущем (по записям пользователей).
 
-        :param record: Запись
-        :return: True всегда
+        :param cutoff: Текущий момент
+        :return: Пары (id пользователя, момент записи)
         """
-        return True
+        if cutoff is None:
+            cutoff = self.now_cutoff()
+        return [(user_id, key) for user_id, keys in list(self._bookings().items())
+                for key in self._future_bookings(user_id, keys, cutoff)]
 
-    @staticmethod
-    def free_record(str_time: str, date: datetime.date, str_state: int) -> bool:
+    def iter_bookings(self, first_ordinal: int, last_ordinal: int) -> Iterator[tuple[int, int]]:
         """
-        Функция фильтр. Запись должна быть свободна. Запись должна быть в будущем.
+        Перебор броней в промежутке дней по возрастанию момента. Состояния каждого дня копируются одной операцией
+        (см. ScheduleIndex.day_bookings), поэтому перебор можно выполнять в другом потоке, пока обработчики изменяют
+        расписание. Нерабочие дни пропускаются: их занятые записи - не брони.
 
-        :param str_time: Время записи
-        :param str_state: Состояние записи
-        :return: Результат проверки
+        :param first_ordinal: Порядковый номер первого дня
+        :param last_ordinal: Порядковый номер дня, следующего за последним
+        :return: Пары (момент записи, id пользователя)
         """
-        # В будущем ли бронируемое время
-        is_future = date > datetime.date.today() or \
-                    (date == datetime.date.today() and \
-                     datetime.datetime.strptime(str_time, "%H:%M").time() > datetime.datetime.now().time())
-        return is_future and str_state == 0
+        index = self.index
+        for ordinal in range(max(first_ordinal, index.first_ordinal),
+                             min(last_ordinal, index.first_ordinal + index.days_count)):
+            day_key = ordinal * MINUTES_IN_DAY
+            for slot, state in index.day_bookings(ordinal):
+                yield day_key + index.slot_minutes[slot], state
+
+    def set_slots_availability(self, first_ordinal: int, last_ordinal: int, is_open: bool, time_from: int = 0,
+                               time_to: int = MINUTES_IN_DAY, weekdays: int = ALL_WEEKDAYS,
+                               cutoff: Optional[int] = None) -> list[int]:
+        """
+        Массовое открытие или закрытие записей (см. BaseSchedule.set_slots_availability). Изменения записываются
+        в журнал одним вызовом (см. set_records_states).
+
+        :param first_ordinal: Порядковый номер первого дня
+        :param last_ordinal: Порядковый номер дня, следующего за последним
+        :param is_open: True - открыть записи, False - закрыть
+        :param time_from: Записи не раньше этого времени, минуты от начала дня
+        :param time_to: Записи раньше этого времени, минуты от начала дня
+        :param weekdays: Маска дней недели: бит 0 - понедельник, бит 6 - воскресенье
+        :param cutoff: Текущий момент
+        :return: Моменты измененных записей
+        """
+        if cutoff is None:
+            cutoff = self.now_cutoff()
+        index = self.index
+        old_state, new_state = (UNAVAILABLE, 0) if is_open else (0, UNAVAILABLE)
+        window = index.window_mask(time_from, time_to)
+        changes: list[tuple[int, int]] = []
+        for ordinal in range(max(first_ordinal, cutoff // MINUTES_IN_DAY, index.first_ordinal),
+                             min(last_ordinal, index.first_ordinal + index.days_count)):
+            if not index.has_day(ordinal) or not weekdays >> (ordinal - 1) % 7 & 1:
+                continue
+            day_key = ordinal * MINUTES_IN_DAY
+            changes.extend((ordinal, slot) for slot, state in enumerate(index.day_states(ordinal))
+                           if state == old_state and window >> slot & 1 and day_key + index.slot_minutes[slot] > cutoff)
+        self.set_records_states(changes, new_state)
+        return [ordinal * MINUTES_IN_DAY + index.slot_minutes[slot] for ordinal, slot in changes]
+
+    def set_record_state(self, ordinal: int, slot: int, state: int, user_id: int = 0) -> None:
+        """
+        Изменение состояния записи. Все изменения расписания (бронирование, отмена, перенос) должны проходить через
+        эту функцию (или set_records_states): она записывает изменение в журнал, обновляет индекс, кэш ближайших
+        свободных дней и записи пользователей.
+
+        :param ordinal: Порядковый номер дня
+        :param slot: Номер столбца записи
+        :param state: Новое состояние
+        :param user_id: Id пользователя, совершившего изменение
+        :return: None
+        """
+        if self.journal is not None:
+            self.journal.append(ordinal, self.index.slot_minutes[slot], state, user_id, self.resource)
+        self._apply_state(ordinal, slot, state)
 
-    @staticmethod
-    def date_have_free_records(date_info: dict[str, Any]) -> bool:
+    def set_records_states(self, records: list[tuple[int, int]], state: int) -> None:
         """
-        Функция фильтр. Возвращает True, если переданная дата содержит свободные окна.
+        Изменение состояния нескольких записей: изменения записываются в журнал одной пачкой, затем применяются
+        так же, как в set_record_state.
 
-        :param date_info: Информация о дате
-        :return: Результат фильтрации
+        :param records: Записи: (порядковый номер дня, номер столбца)
+        :param state: Новое состояние
+        :return: None
         """
-        for record_time, record_state in date_info["records"].items():
-            is_future = datetime.datetime.strptime(date_info["date"],
-                                                   "%d.%m.%Y").date() > datetime.datetime.now().date() or \
-                        (datetime.datetime.strptime(date_info["date"],
-                                                    "%d.%m.%Y").date() == datetime.datetime.now().date() and
-                         datetime.datetime.strptime(record_time, "%H:%M").time() > datetime.datetime.now().time())
-            if record_state == 0 and is_future:
-                return True
-        return False
+        if self.journal is not None:
+            self.journal.append_many([(ordinal, self.index.slot_minutes[slot], state, 0) for ordinal, slot in records],
+                                     self.resource)
+        for ordinal, slot in records:
+            self._apply_state(ordinal, slot, state)
 
-    @staticmethod
-    def date_dont_have_free_records(date_info: dict[str, Any]) -> bool:
+    def _apply_state(self, ordinal: int, slot: int, state: int) -> None:
         """
-        Функция фильтр. Возвращает False, если переданная дата содержит свободные окна.
+        Применение изменения состояния записи к индексу, кэшу ближайших свободных дней и записям пользователей;
+        после этого вызываются функции из listeners.
 
-        :param date_info: Информация о дате
-        :return: Результат фильтрации
+        :param ordinal: Порядковый номер дня
+        :param slot: Номер столбца записи
+        :param state: Новое состояние
+        :return: None
         """
-        for record_state in date_info["records"].values():
-            if record_state == 0:
-                return False
-        return True
+        old_state = self.index.booking_state(ordinal, slot)
+        self.index.set_state(ordinal, slot, state)
+        self._update_closest_days(ordinal)
+        for listener in self.listeners:
+            listener(ordinal)
+        if self._user_bookings is None:  # Записи пользователей еще не заполнены: заполнятся по индексу
+            return
+        key = ordinal * MINUTES_IN_DAY + self.index.slot_minutes[slot]
+        if old_state > 0 and old_state in self._user_bookings:
+            self._user_bookings[old_state].discard(key)
+            if not self._user_bookings[old_state]:
+                del self._user_bookings[old_state]
+        if state > 0 and self.index.is_workday(ordinal):
+            self._user_bookings.setdefault(state, set()).add(key)
+
+    def is_record_free(self, user_id: int, str_time: str, cutoff: Optional[int] = None) -> bool:
+        """
+        Проверяет, можно ли записаться на данное время. Дата хранится в словаре self.booking_dates.
+
+        :param user_id: Id пользователя
+        :param str_time: Время
+        :param cutoff: Текущий момент
+        :return: Свободно ли окно
+        """
+        if user_id not in self.booking_dates:
+            return False
+        slot = self.index.slot_index(str_time)
+        if slot < 0:
+            return False
+        if cutoff is None:
+            cutoff = self.now_cutoff()
+        ordinal = self.booking_dates[user_id].toordinal()
+        # Бронируемое время - в будущем или нет? Если нет - то забронировать его будет невозможно
+        return self.free_record(ordinal * MINUTES_IN_DAY + self.index.slot_minutes[slot],
+                                self.index.get_state(ordinal, slot), cutoff)
+
+    def get_closest_free_dates(self, days_range: int, cutoff: Optional[int] = None) -> tuple[datetime.date, ...]:
+        """
+        Возвращает ближайшие days_range дней, включая сегодняшний день, в которых есть свободные записи в будущем.
+        Результат берется из кэша, который обновляется при изменении записей и устаревает, когда время проходит
+        последнюю свободную запись сегодняшнего дня или наступает следующий день.
+
+        :param days_range: Сколько дней просмотреть
+        :param cutoff: Текущий момент
+        :return: Дни со свободными записями
+        """
+        if cutoff is None:
+            cutoff = self.now_cutoff()
+        if self._closest_days is None or days_range != self._closest_range or \
+                not self._closest_since <= cutoff < self._closest_expiry:
+            self._build_closest_days(days_range, cutoff)
+        return tuple(datetime.date.fromordinal(ordinal) for ordinal in self._closest_days)
+
+    def _build_closest_days(self, days_range: int, cutoff: int) -> None:
+        """
+        Заполнение кэша ближайших дней со свободными записями по списку дней индекса.
+
+        :param days_range: Сколько дней просмотреть
+        :param cutoff: Текущий момент
+        :return: None
+        """
+        today = cutoff // MINUTES_IN_DAY
+        self._closest_days = self.index.free_days_between(today, today + days_range)
+        self._closest_range = days_range
+        self._closest_since = cutoff
+        self._closest_expiry = (today + 1) * MINUTES_IN_DAY
+        if self._closest_days and self._closest_days[0] == today:
+            # Сегодняшний день подходит, пока не прошло время его последней свободной записи
+            last_free_key = today * MINUTES_IN_DAY + self.index.last_free_minutes(today)
+            if last_free_key > cutoff:
+                self._closest_expiry = last_free_key
+            else:
+                self._closest_days.pop(0)
+
+    def _update_closest_days(self, ordinal: int) -> None:
+        """
+        Обновление кэша ближайших свободных дней после изменения записи в дне ordinal.
+
+        :param ordinal: Порядковый номер дня
+        :return: None
+        """
+        if self._closest_days is None:
+            return
+        today = self._closest_since // MINUTES_IN_DAY
+        if ordinal == today:  # Изменилась последняя свободная запись сегодняшнего дня - кэш строится заново
+            self._closest_days = None
+        elif today < ordinal < today + self._closest_range:
+            position = bisect.bisect_left(self._closest_days, ordinal)
+            is_cached = position < len(self._closest_days) and self._closest_days[position] == ordinal
+            is_free = self.index.free_counts[self.index.day_offset(ordinal)] > 0
+            if is_free and not is_cached:
+                self._closest_days.insert(position, ordinal)
+            elif not is_free and is_cached:
+                self._closest_days.pop(position)
+
+    def find_free_slots(self, first_ordinal: int, last_ordinal: int, time_from: int = 0,
+                        time_to: int = MINUTES_IN_DAY, weekdays: int = ALL_WEEKDAYS, limit: int = 10,
+                        after: Optional[int] = None, cutoff: Optional[int] = None) -> list[int]:
+        """
+        Поиск свободных записей в будущем (см. BaseSchedule.find_free_slots) по маскам свободных записей индекса:
+        дни без свободных записей пропускаются, день проверяется одной битовой операцией (см. ScheduleIndex.find_free).
+
+        :param first_ordinal: Порядковый номер первого дня
+        :param last_ordinal: Порядковый номер дня, следующего за последним
+        :param time_from: Записи не раньше этого времени, минуты от начала дня
+        :param time_to: Записи раньше этого времени, минуты от начала дня
+        :param weekdays: Маска дней недели: бит 0 - понедельник, бит 6 - воскресенье
+        :param limit: Сколько записей найти
+        :param after: Записи позже этого момента (продолжение поиска) или None
+        :param cutoff: Текущий момент
+        :return: Моменты найденных записей, по возрастанию
+        """
+        if cutoff is None:
+            cutoff = self.now_cutoff()
+        after_key = cutoff if after is None else max(after, cutoff)
+        return self.index.find_free(first_ordinal, last_ordinal, after_key, self.index.window_mask(time_from, time_to),
+                                    weekdays, limit)
+
 
 
 if __name__ == "__main__":
@@ -0,0 +1,635 @@
+import bisect
+import datetime
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from typing import Any, Iterator, Optional
+
+
+NO_RECORD: int = -2 ** 63  # Состояние ячейки, для которой в расписании нет записи
+UNAVAILABLE: int = -1  # Состояние записи, на которую нельзя записаться (например, закрытой менеджером)
+MINUTES_IN_DAY: int = 24 * 60
+MAX_SLOTS: int = 64  # Наибольшее количество записей в дне: свободные записи дня хранятся битами одного uint64
+ALL_WEEKDAYS: int = 0b1111111  # Маска дней недели (бит 0 - понедельник), в которую входят все дни
+
+BINARY_MAGIC: bytes = b"TGSCHED2"  # Начало файла расписания в двоичном формате (см. save_binary)
+_BINARY_HEADER = struct.Struct("<8siII")  # Сигнатура, первый день, количество дней, количество записей в дне
+
+
+def parse_date(str_date: str) -> int:
+    """
+    Разбор даты в формате "dd.mm.yyyy" без strptime.
+
+    :param str_date: Дата
+    :return: Порядковый номер дня (datetime.date.toordinal) или -1, если дата некорректна
+    """
+    if len(str_date) != 10 or str_date[2] != "." or str_date[5] != "." or \
+            not (str_date[:2] + str_date[3:5] + str_date[6:]).isdecimal():
+        return -1
+    try:
+        return datetime.date(int(str_date[6:]), int(str_date[3:5]), int(str_date[:2])).toordinal()
+    except ValueError:
+        return -1
+
+
+def parse_time(str_time: str) -> int:
+    """
+    Разбор времени в формате "HH:MM" без strptime.
+
+    :param str_time: Время
+    :return: Минуты от начала дня или -1, если время некорректно
+    """
+    if len(str_time) != 5 or str_time[2] != ":" or not (str_time[:2] + str_time[3:]).isdecimal():
+        return -1
+    hours, minutes = int(str_time[:2]), int(str_time[3:])
+    if hours >= 24 or minutes >= 60:
+        return -1
+    return hours * 60 + minutes
+
+
+def parse_minutes(str_time: str) -> int:
+    """
+    Перевод времени из строки вида "HH:MM" в количество минут от начала дня. Используется при загрузке расписания,
+    допускает время без ведущего нуля.
+
+    :param str_time: Время
+    :return: Минуты от начала дня
+    """
+    hours, _, minutes = str_time.partition(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def format_minutes(minutes: int) -> str:
+    """
+    Перевод количества минут от начала дня в строку вида "HH:MM".
+
+    :param minutes: Минуты от начала дня
+    :return: Время
+    """
+    return f"{minutes // 60:02}:{minutes % 60:02}"
+
+
+def format_slot_key(key: int) -> str:
+    """
+    Перевод момента записи (номер_дня * MINUTES_IN_DAY + минуты) в строку вида "dd.mm.yyyy HH:MM".
+
+    :param key: Момент записи
+    :return: Дата и время
+    """
+    return f"{datetime.date.fromordinal(key // MINUTES_IN_DAY):%d.%m.%Y} {format_minutes(key % MINUTES_IN_DAY)}"
+
+
+def parse_slot_key(str_slot: str) -> int:
+    """
+    Разбор даты и времени записи в формате "dd.mm.yyyy HH:MM" (см. format_slot_key).
+
+    :param str_slot: Дата и время
+    :return: Момент записи или -1, если дата или время некорректны
+    """
+    ordinal, minutes = parse_date(str_slot[:10]), parse_time(str_slot[11:])
+    if len(str_slot) != 16 or str_slot[10] != " " or ordinal < 0 or minutes < 0:
+        return -1
+    return ordinal * MINUTES_IN_DAY + minutes
+
+
+class FreeSlotMasks:
+    """
+    Маски свободных записей по дням (бит на столбец) и отсортированный список дней со свободными записями.
+    Поиск свободных записей по ним общий для индекса расписания (ScheduleIndex) и общего индекса мастеров филиала
+    (resources.BranchIndex). Наследник хранит first_ordinal, slot_minutes, free_masks и free_days.
+    """
+    __slots__ = ()
+
+    first_ordinal: int
+    slot_minutes: tuple[int, ...]
+    free_masks: Any
+    free_days: list[int]
+
+    def free_days_between(self, first_ordinal: int, last_ordinal: int) -> list[int]:
+        """
+        Возвращает дни со свободными записями в промежутке [first_ordinal, last_ordinal).
+
+        :param first_ordinal: Порядковый номер первого дня
+        :param last_ordinal: Порядковый номер дня, следующего за последним
+        :return: Порядковые номера дней, по возрастанию
+        """
+        return self.free_days[bisect.bisect_left(self.free_days, first_ordinal):
+                              bisect.bisect_left(self.free_days, last_ordinal)]
+
+    def window_mask(self, time_from: int, time_to: int) -> int:
+        """
+        Маска столбцов, время которых попадает в промежуток [time_from, time_to).
+
+        :param time_from: Начало промежутка, минуты от начала дня
+        :param time_to: Конец промежутка, минуты от начала дня
+        :return: Маска столбцов
+        """
+        first = bisect.bisect_left(self.slot_minutes, time_from)
+        last = bisect.bisect_left(self.slot_minutes, time_to)
+        return (1 << last) - (1 << first) if first < last else 0
+
+    def find_free(self, first_ordinal: int, last_ordinal: int, after_key: int, window: int,
+                  weekdays: int = ALL_WEEKDAYS, limit: int = 10) -> list[int]:
+        """
+        Поиск свободных записей в промежутке дней [first_ordinal, last_ordinal). Перебираются только дни из списка
+        дней со свободными записями, маска дня пересекается с маской столбцов одной операцией, поэтому время поиска
+        зависит от количества найденных записей, а не от длины промежутка.
+
+        :param first_ordinal: Порядковый номер первого дня
+        :param last_ordinal: Порядковый номер дня, следующего за последним
+        :param after_key: Записи должны быть позже этого момента (текущий момент или последняя найденная запись)
+        :param window: Маска подходящих столбцов (см. window_mask)
+        :param weekdays: Маска подходящих дней недели: бит 0 - понедельник, бит 6 - воскресенье
+        :param limit: Сколько записей найти
+        :return: Моменты найденных записей, по возрастанию
+        """
+        result: list[int] = []
+        after_day, after_minutes = divmod(after_key, MINUTES_IN_DAY)
+        first_ordinal = max(first_ordinal, after_day)
+        free_days = self.free_days
+        position = bisect.bisect_left(free_days, first_ordinal)
+        while position < len(free_days) and free_days[position] < last_ordinal and len(result) < limit:
+            ordinal = free_days[position]
+            position += 1
+            if not weekdays >> (ordinal - 1) % 7 & 1:  # datetime.date.fromordinal(1) - понедельник
+                continue
+            mask = self.free_masks[ordinal - self.first_ordinal] & window
+            if ordinal == after_day:  # Записи в день after_key должны быть позже него
+                mask &= -1 << bisect.bisect_right(self.slot_minutes, after_minutes)
+            day_key = ordinal * MINUTES_IN_DAY
+            while mask and len(result) < limit:
+                lowest = mask & -mask
+                result.append(day_key + self.slot_minutes[lowest.bit_length() - 1])
+                mask ^= lowest
+        return result
+
+
+class ScheduleIndex(FreeSlotMasks):
+    """
+    Плоский индекс расписания. Каждому дню (по порядковому номеру даты) соответствует строка фиксированной ширины
+    в общем массиве состояний, каждому столбцу - время записи. Время записей разбирается один раз при загрузке.
+    Для каждого дня поддерживается количество свободных записей и маска свободных записей (бит на столбец),
+    а также отсортированный список дней, в которых есть свободные записи. Все они обновляются при каждом изменении
+    состояния записи. По маскам поиск свободных записей (find_free) проверяет день одной битовой операцией.
+    Индекс, загруженный из двоичного файла (load_binary), вместо массивов хранит memoryview отображенного файла.
+    """
+    __slots__ = ("first_ordinal", "days_count", "slot_times", "slot_minutes", "slot_by_time",
+                 "states", "present", "workdays", "free_counts", "free_masks", "free_days", "snapshot")
+
+    def __init__(self, first_ordinal: int, days_count: int, slot_minutes: tuple[int, ...]) -> None:
+        """
+        Конструктор. Создает пустой индекс: все дни отсутствуют, все записи имеют состояние NO_RECORD.
+
+        :param first_ordinal: Порядковый номер первого дня индекса (datetime.date.toordinal)
+        :param days_count: Количество дней в индексе
+        :param slot_minutes: Время записей в минутах от начала дня, по возрастанию
+        """
+        if len(slot_minutes) > MAX_SLOTS:
+            raise ValueError(f"В дне расписания может быть не больше {MAX_SLOTS} записей")
+        self.first_ordinal: int = first_ordinal
+        self.days_count: int = days_count
+        self.slot_minutes: tuple[int, ...] = slot_minutes  # Время записей в минутах
+        self.slot_times: tuple[str, ...] = tuple(format_minutes(minutes) for minutes in slot_minutes)
+        self.slot_by_time: dict[str, int] = {str_time: i for i, str_time in enumerate(self.slot_times)}
+        self.states: array = array("q", [NO_RECORD]) * (days_count * len(slot_minutes))  # Состояния записей
+        self.present: bytearray = bytearray(days_count)  # Есть ли день в расписании
+        self.workdays: bytearray = bytearray(days_count)  # Является ли день рабочим
+        self.free_counts: array = array("H", [0]) * days_count  # Количество свободных записей в дне
+        self.free_masks: array = array("Q", [0]) * days_count  # Свободные записи дня: бит i - столбец i
+        self.free_days: list[int] = []  # Порядковые номера дней со свободными записями, по возрастанию
+        self.snapshot: Optional[IndexSnapshot] = None  # Снимок, который еще не записан (см. freeze)
+
+    @property
+    def width(self) -> int:
+        """
+        Количество записей в строке одного дня.
+
+        :return: Ширина строки
+        """
+        return len(self.slot_minutes)
+
+    def day_offset(self, ordinal: int) -> int:
+        """
+        Возвращает номер строки дня в индексе или -1, если дня нет в расписании.
+
+        :param ordinal: Порядковый номер дня
+        :return: Номер строки
+        """
+        offset = ordinal - self.first_ordinal
+        if 0 <= offset < self.days_count and self.present[offset]:
+            return offset
+        return -1
+
+    def has_day(self, ordinal: int) -> bool:
+        """
+        Проверяет, есть ли день в расписании.
+
+        :param ordinal: Порядковый номер дня
+        :return: Результат проверки
+        """
+        return self.day_offset(ordinal) >= 0
+
+    def slot_index(self, str_time: str) -> int:
+        """
+        Возвращает номер столбца записи по её времени или -1, если такого времени нет в расписании.
+
+        :param str_time: Время записи
+        :return: Номер столбца
+        """
+        return self.slot_by_time.get(str_time, -1)
+
+    def get_state(self, ordinal: int, slot: int) -> int:
+        """
+        Возвращает состояние записи. Для отсутствующих дней и записей возвращает NO_RECORD.
+
+        :param ordinal: Порядковый номер дня
+        :param slot: Номер столбца записи
+        :return: Состояние записи
+        """
+        offset = self.day_offset(ordinal)
+        if offset < 0 or not 0 <= slot < self.width:
+            return NO_RECORD
+        return self.states[offset * self.width + slot]
+
+    def set_state(self, ordinal: int, slot: int, state: int) -> None:
+        """
+        Устанавливает состояние записи. День должен присутствовать в расписании.
+        Обновляет количество свободных записей дня и список дней со свободными записями.
+
+        :param ordinal: Порядковый номер дня
+        :param slot: Номер столбца записи
+        :param state: Новое состояние
+        :return: None
+        :raises ValueError: Дня или записи нет в расписании
+        """
+        offset = self.day_offset(ordinal)
+        if offset < 0 or not 0 <= slot < self.width:
+            raise ValueError(f"Записи {slot} дня {ordinal} нет в расписании")
+        if self.snapshot is not None:
+            self.snapshot.preserve(offset)
+        position = offset * self.width + slot
+        old_state = self.states[position]
+        self.states[position] = state
+        if (old_state == 0) == (state == 0):  # Свободность записи не изменилась
+            return
+        if state == 0:
+            self.free_masks[offset] |= 1 << slot
+            self.free_counts[offset] += 1
+            if self.free_counts[offset] == 1:
+                bisect.insort(self.free_days, ordinal)
+        else:
+            self.free_masks[offset] &= ~(1 << slot)
+            self.free_counts[offset] -= 1
+            if self.free_counts[offset] == 0:
+                del self.free_days[bisect.bisect_left(self.free_days, ordinal)]
+
+    def last_free_minutes(self, ordinal: int) -> int:
+        """
+        Возвращает время последней свободной записи дня или -1, если свободных записей нет.
+
+        :param ordinal: Порядковый номер дня
+        :return: Минуты от начала дня
+        """
+        states = self.day_states(ordinal)
+        for slot in range(len(states) - 1, -1, -1):
+            if states[slot] == 0:
+                return self.slot_minutes[slot]
+        return -1
+
+    def is_workday(self, ordinal: int) -> bool:
+        """
+        Проверяет, есть ли день в расписании и является ли он рабочим.
+
+        :param ordinal: Порядковый номер дня
+        :return: Результат проверки
+        """
+        offset = self.day_offset(ordinal)
+        return offset >= 0 and bool(self.workdays[offset])
+
+    def booking_state(self, ordinal: int, slot: int) -> int:
+        """
+        Состояние записи для бронирования. В нерабочие дни занятые записи означают, что день закрыт
+        (gen_schedule.py записывает в них состояние 2), а не брони: для них возвращается UNAVAILABLE.
+
+        :param ordinal: Порядковый номер дня
+        :param slot: Номер столбца записи
+        :return: Состояние записи: 0 - свободна, id пользователя - забронирована, UNAVAILABLE, NO_RECORD
+        """
+        state = self.get_state(ordinal, slot)
+        if state > 0 and not self.is_workday(ordinal):
+            return UNAVAILABLE
+        return state
+
+    def day_bookings(self, ordinal: int) -> list[tuple[int, int]]:
+        """
+        Брони дня. В нерабочие дни броней нет (см. booking_state). Строка состояний дня, в котором все записи
+        свободны, не читается: достаточно количества свободных записей, поэтому перебор дней не обращается
+        к страницам отображенного файла (см. load_binary) дней без броней.
+
+        :param ordinal: Порядковый номер дня
+        :return: Пары (номер столбца, id пользователя)
+        """
+        offset = self.day_offset(ordinal)
+        if offset < 0 or not self.workdays[offset] or self.free_counts[offset] == self.width:
+            return []
+        row = offset * self.width
+        # Состояния копируются одной операцией: перебор можно выполнять в другом потоке, пока индекс изменяется
+        return [(slot, state) for slot, state in enumerate(tuple(self.states[row:row + self.width])) if state > 0]
+
+    def day_states(self, ordinal: int) -> memoryview:
+        """
+        Возвращает строку состояний дня (без копирования). Для отсутствующего дня возвращает пустую строку.
+
+        :param ordinal: Порядковый номер дня
+        :return: Состояния записей дня, по столбцам
+        """
+        offset = self.day_offset(ordinal)
+        if offset < 0:
+            return memoryview(self.states)[0:0]
+        return memoryview(self.states)[offset * self.width:(offset + 1) * self.width]
+
+    def day_records(self, ordinal: int) -> Iterator[tuple[int, int]]:
+        """
+        Перебирает существующие записи дня.
+
+        :param ordinal: Порядковый номер дня
+        :return: Пары (номер столбца, состояние)
+        """
+        for slot, state in enumerate(self.day_states(ordinal)):
+            if state != NO_RECORD:
+                yield slot, state
+
+    def freeze(self) -> "IndexSnapshot":
+        """
+        Снятие снимка индекса с копированием при записи (см. IndexSnapshot): массивы не копируются. Одновременно
+        у индекса может быть один незаписанный снимок.
+
+        :return: Снимок
+        :raises RuntimeError: Предыдущий снимок еще не записан
+        """
+        if self.snapshot is not None:
+            raise RuntimeError("Предыдущий снимок индекса еще не записан")
+        self.snapshot = IndexSnapshot(self)
+        return self.snapshot
+
+    def _count_free(self, offset: int) -> None:
+        """
+        Подсчет количества и маски свободных записей дня по его строке состояний (при загрузке индекса).
+
+        :param offset: Номер строки дня
+        :return: None
+        """
+        row = offset * self.width
+        mask = 0
+        for slot, state in enumerate(self.states[row:row + self.width]):
+            if state == 0:
+                mask |= 1 << slot
+        self.free_masks[offset] = mask
+        self.free_counts[offset] = bin(mask).count("1")
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        Перевод индекса в json-совместимый словарь (для снимков).
+
+        :return: Словарь
+        """
+        return {
+            "first_ordinal": self.first_ordinal,
+            "slot_minutes": list(self.slot_minutes),
+            "present": self.present.hex(),
+            "workdays": self.workdays.hex(),
+            "states": self.states.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "ScheduleIndex":
+        """
+        Восстановление индекса из словаря, полученного методом to_dict.
+
+        :param data: Словарь
+        :return: Индекс
+        """
+        present = bytearray.fromhex(data["present"])
+        index = cls(data["first_ordinal"], len(present), tuple(data["slot_minutes"]))
+        index.present = present
+        index.workdays = bytearray.fromhex(data["workdays"])
+        index.states = array("q", data["states"])
+        for offset in range(index.days_count):
+            if present[offset]:
+                index._count_free(offset)
+        index.free_days = [index.first_ordinal + offset for offset in range(index.days_count)
+                           if index.free_counts[offset]]
+        return index
+
+    @classmethod
+    def from_json_data(cls, data: dict[str, Any]) -> "ScheduleIndex":
+        """
+        Построение индекса по расписанию в формате json (годы -> месяцы -> дни -> записи).
+        День определяется по полю "date", а не по положению в списке.
+
+        :param data: Расписание, прочитанное из json
+        :return: Индекс
+        """
+        days: list[tuple[int, dict[str, Any]]] = []
+        slot_minutes: set[int] = set()
+        for year_data in data.values():
+            for month_data in year_data["months"]:
+                for day_data in month_data["days"]:
+                    str_date: str = day_data["date"]
+                    date = datetime.date(day=int(str_date[:2]), month=int(str_date[3:5]), year=int(str_date[6:]))
+                    days.append((date.toordinal(), day_data))
+                    slot_minutes.update(parse_minutes(str_time) for str_time in day_data["records"])
+        if not days:
+            return cls(0, 0, ())
+        first_ordinal = min(ordinal for ordinal, _ in days)
+        last_ordinal = max(ordinal for ordinal, _ in days)
+        index = cls(first_ordinal, last_ordinal - first_ordinal + 1, tuple(sorted(slot_minutes)))
+        # Время, записанное в файле, может отличаться от канонического вида ("9:00" и "09:00")
+        slot_by_minutes = {minutes: i for i, minutes in enumerate(index.slot_minutes)}
+        for ordinal, day_data in days:
+            offset = ordinal - first_ordinal
+            index.present[offset] = 1
+            index.workdays[offset] = bool(day_data.get("is_workday", True))
+            row = offset * index.width
+            for str_time, state in day_data["records"].items():
+                index.states[row + slot_by_minutes[parse_minutes(str_time)]] = state
+            index._count_free(offset)
+        index.free_days = [index.first_ordinal + offset for offset in range(index.days_count)
+                           if index.free_counts[offset]]
+        return index
+
+
+class IndexSnapshot:
+    """
+    Снимок индекса с копированием при записи. Перед первым изменением дня после снятия снимка (ScheduleIndex.set_state)
+    сохраняется прежнее содержимое строки дня, поэтому поток, который изменяет расписание, копирует только
+    изменяемые дни. Снимок записывается в фоновом потоке (save): массивы индекса пишутся в файл как есть, затем
+    поверх записываются сохраненные строки измененных дней.
+    """
+
+    def __init__(self, index: ScheduleIndex) -> None:
+        """
+        Конструктор.
+
+        :param index: Индекс
+        """
+        self.index: ScheduleIndex = index
+        # Номер строки дня -> состояния записей, количество свободных записей и маска свободных записей на момент снимка
+        self._rows: dict[int, tuple[bytes, int, int]] = {}
+        # Блокировка между потоком, который изменяет индекс, и потоком записи снимка
+        self._lock = threading.Lock()
+        self._released: bool = False
+
+    def preserve(self, offset: int) -> None:
+        """
+        Сохранение строки дня перед её изменением, если она еще не сохранена и снимок еще не записан.
+
+        :param offset: Номер строки дня
+        :return: None
+        """
+        with self._lock:
+            if self._released or offset in self._rows:
+                return
+            index = self.index
+            self._rows[offset] = (bytes(memoryview(index.states)[offset * index.width:(offset + 1) * index.width]),
+                                  index.free_counts[offset], index.free_masks[offset])
+
+    def release(self) -> dict[int, tuple[bytes, int, int]]:
+        """
+        Завершение снимка: дальнейшие изменения индекса не сохраняются.
+
+        :return: Сохраненные строки измененных дней (см. _rows)
+        """
+        with self._lock:
+            self._released = True
+            if self.index.snapshot is self:
+                self.index.snapshot = None
+            return self._rows
+
+    def save(self, filename: str) -> None:
+        """
+        Запись снимка в двоичном формате (см. save_binary). Снимок завершается, даже если запись не удалась.
+
+        :param filename: Имя файла
+        :return: None
+        """
+        try:
+            save_binary(self.index, filename, self)
+        finally:
+            self.release()
+
+
+def _aligned(position: int) -> int:
+    """
+    Выравнивание смещения в двоичном файле на 8 байт.
+
+    :param position: Смещение
+    :return: Ближайшее смещение, кратное 8, не меньше данного
+    """
+    return (position + 7) & ~7
+
+
+def save_binary(index: ScheduleIndex, filename: str, snapshot: Optional[IndexSnapshot] = None) -> None:
+    """
+    Запись индекса в двоичном формате. Файл записывается во временный файл и атомарно заменяет прежний.
+    Если передан снимок, индекс может изменяться во время записи: строки дней, измененных после снятия снимка,
+    записываются из снимка.
+
+    Формат (little-endian, разделы выровнены на 8 байт): заголовок (сигнатура BINARY_MAGIC, порядковый номер первого
+    дня, количество дней, количество записей в дне), время записей (int16, минуты), индекс дат - наличие дня
+    и признак рабочего дня (по байту на день), количество свободных записей (uint16 на день) и маски свободных
+    записей (uint64 на день), затем состояния записей (int64 на запись, строка фиксированной ширины на день).
+
+    :param index: Индекс
+    :param filename: Имя файла
+    :param snapshot: Снимок индекса (см. ScheduleIndex.freeze) или None
+    :return: None
+    """
+    if sys.byteorder != "little":
+        raise OSError("Двоичный формат расписания поддерживается только на little-endian платформах")
+    # Массивы пишутся из памяти индекса, без копирования
+    sections = [
+        _BINARY_HEADER.pack(BINARY_MAGIC, index.first_ordinal, index.days_count, index.width),
+        array("h", index.slot_minutes).tobytes(),
+        bytes(index.present) + bytes(index.workdays),
+        memoryview(index.free_counts).cast("B"),
+        memoryview(index.free_masks).cast("B"),
+        memoryview(index.states).cast("B"),
+    ]
+    positions: list[int] = []  # Смещения разделов в файле
+    with open(filename + ".tmp", "wb") as f:
+        for section in sections:
+            positions.append(f.tell())
+            f.write(section)
+            f.write(bytes(_aligned(f.tell()) - f.tell()))
+        if snapshot is not None:
+            for offset, (states, free_count, free_mask) in snapshot.release().items():
+                f.seek(positions[3] + 2 * offset)
+                f.write(struct.pack("<H", free_count))
+                f.seek(positions[4] + 8 * offset)
+                f.write(struct.pack("<Q", free_mask))
+                f.seek(positions[5] + 8 * index.width * offset)
+                f.write(states)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(filename + ".tmp", filename)
+
+
+def load_binary(filename: str) -> ScheduleIndex:
+    """
+    Загрузка индекса из файла в двоичном формате (см. save_binary). Файл отображается в память, а не читается:
+    массивы индекса ссылаются на страницы файла, и с диска читаются только дни, к которым обращается бот.
+    Поэтому время запуска и занимаемая память почти не зависят от количества лет в расписании. Отображение
+    копируется при записи: изменения индекса не попадают в файл (они сохраняются журналом).
+
+    :param filename: Имя файла
+    :return: Индекс расписания
+    """
+    if sys.byteorder != "little":
+        raise OSError("Двоичный формат расписания поддерживается только на little-endian платформах")
+    with open(filename, "rb") as f:
+        view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY))
+    magic, first_ordinal, days_count, width = _BINARY_HEADER.unpack_from(view)
+    if magic != BINARY_MAGIC:
+        raise ValueError(f"{filename} не является расписанием в двоичном формате")
+    position = _aligned(_BINARY_HEADER.size)
+    index = ScheduleIndex(first_ordinal, 0, tuple(view[position:position + 2 * width].cast("h")))
+    index.days_count = days_count
+    position = _aligned(position + 2 * width)
+    index.present = view[position:position + days_count]
+    index.workdays = view[position + days_count:position + 2 * days_count]
+    position = _aligned(position + 2 * days_count)
+    index.free_counts = view[position:position + 2 * days_count].cast("H")
+    position = _aligned(position + 2 * days_count)
+    index.free_masks = view[position:position + 8 * days_count].cast("Q")
+    position += 8 * days_count
+    index.states = view[position:position + 8 * days_count * width].cast("q")
+    index.free_days = [first_ordinal + offset for offset, count in enumerate(index.free_counts) if count]
+    return index
+
+
+def load_index(filename: str) -> ScheduleIndex:
+    """
+    Загрузка расписания в плоский индекс. Формат файла (json или двоичный, см. save_binary) определяется
+    по его началу.
+
+    :param filename: Имя файла
+    :return: Индекс расписания
+    """
+    with open(filename, "rb") as f:
+        is_binary = f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+    if is_binary:
+        return load_binary(filename)
+    with open(filename, "r") as f:
+        return ScheduleIndex.from_json_data(json.load(f))
+
+
+if __name__ == "__main__":
+    # Перевод расписания из json в двоичный формат: python schedule_index.py schedule.json schedule.bin
+    if len(sys.argv) != 3:
+        sys.exit("Использование: python schedule_index.py schedule.json schedule.bin")
+    save_binary(load_index(sys.argv[1]), sys.argv[2])
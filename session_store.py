@@ -0,0 +1,221 @@
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Callable, Dict, Generic, Iterator, Optional, TypeVar
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+class _Entry:
+    """
+    Запись хранилища: значение и момент, после которого запись считается устаревшей.
+    """
+    __slots__ = ("value", "expires")
+
+    def __init__(self, value: Any, expires: float) -> None:
+        self.value = value
+        self.expires = expires
+
+
+class SessionStore(MutableMapping, Generic[K, V]):
+    """
+    Ограниченное хранилище данных пользователей (например, дат, выбранных во время брони).
+
+    Запись удаляется, если к ней не обращались дольше ttl секунд, а при превышении max_size удаляется запись,
+    к которой дольше всего не обращались (LRU). Устаревшие записи удаляются при обращении к ним и при периодической
+    очистке (не чаще раза в sweep_interval секунд, во время записи), поэтому хранилище не растет, даже если
+    пользователи бросают бронь на середине.
+
+    Взаимозаменяемо со словарем: реализует интерфейс MutableMapping. Счетчики hits, misses, evictions и expirations
+    показывают, сколько было найдено и не найдено записей и сколько записей удалено по размеру и по времени.
+    """
+
+    def __init__(self, max_size: int = 100_000, ttl: float = 3600.0, sweep_interval: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        """
+        Конструктор.
+
+        :param max_size: Наибольшее количество записей
+        :param ttl: Сколько секунд хранится запись, к которой не обращаются
+        :param sweep_interval: Период очистки устаревших записей в секундах (по умолчанию - ttl / 4)
+        :param clock: Источник времени в секундах (подменяется в проверках)
+        """
+        if max_size <= 0 or ttl <= 0:
+            raise ValueError("Размер хранилища и время хранения записей должны быть положительными")
+        self.max_size: int = max_size
+        self.ttl: float = ttl
+        self.sweep_interval: float = ttl / 4 if sweep_interval is None else sweep_interval
+        self.clock: Callable[[], float] = clock
+        self._entries: OrderedDict[K, _Entry] = OrderedDict()  # От давно использованных к недавно использованным
+        self._next_sweep: float = clock() + self.sweep_interval
+        # Хранилище SqliteSchedule используется из потоков пула соединений
+        self._lock: threading.Lock = threading.Lock()
+
+        self.hits: int = 0  # Найдено записей
+        self.misses: int = 0  # Не найдено записей (в том числе устаревших)
+        self.evictions: int = 0  # Удалено записей из-за превышения размера
+        self.expirations: int = 0  # Удалено устаревших записей
+
+    def __getitem__(self, key: K) -> V:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                raise KeyError(key)
+            now = self.clock()
+            if entry.expires <= now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                raise KeyError(key)
+            entry.expires = now + self.ttl
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def __setitem__(self, key: K, value: V) -> None:
+        with self._lock:
+            now = self.clock()
+            if now >= self._next_sweep:
+                self._sweep(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.value = value
+                entry.expires = now + self.ttl
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = _Entry(value, now + self.ttl)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __delitem__(self, key: K) -> None:
+        with self._lock:
+            del self._entries[key]
+
+    def __contains__(self, key: object) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry.expires > self.clock()
+
+    def __iter__(self) -> Iterator[K]:
+        with self._lock:
+            now = self.clock()
+            return iter([key for key, entry in self._entries.items() if entry.expires > now])
+
+    def __len__(self) -> int:
+        """
+        Количество записей, включая устаревшие, которые еще не удалены очисткой.
+        """
+        return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def sweep(self) -> int:
+        """
+        Удаление устаревших записей.
+
+        :return: Количество удаленных записей
+        """
+        with self._lock:
+            return self._sweep(self.clock())
+
+    def _sweep(self, now: float) -> int:
+        """
+        Удаление устаревших записей. Вызывается под self._lock.
+
+        :param now: Текущий момент
+        :return: Количество удаленных записей
+        """
+        self._next_sweep = now + self.sweep_interval
+        expired = [key for key, entry in self._entries.items() if entry.expires <= now]
+        for key in expired:
+            del self._entries[key]
+        self.expirations += len(expired)
+        return len(expired)
+
+    def stats(self) -> dict[str, int]:
+        """
+        Счетчики хранилища.
+
+        :return: Словарь {название счетчика: значение}
+        """
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "expirations": self.expirations}
+
+
+class _FSMRecord:
+    """
+    Состояние и данные конечного автомата aiogram для одного ключа.
+    """
+    __slots__ = ("state", "data")
+
+    def __init__(self) -> None:
+        self.state: Optional[str] = None
+        self.data: Dict[str, Any] = {}
+
+
+class SessionStorage(BaseStorage):
+    """
+    Хранилище состояний конечного автомата aiogram (FSM) поверх SessionStore: состояния брошенных диалогов
+    удаляются так же, как даты броней. Передается в Dispatcher(storage=...).
+    """
+
+    def __init__(self, store: Optional[SessionStore[StorageKey, _FSMRecord]] = None) -> None:
+        """
+        Конструктор.
+
+        :param store: Хранилище записей (по умолчанию - SessionStore с параметрами по умолчанию)
+        """
+        self.store: SessionStore[StorageKey, _FSMRecord] = SessionStore() if store is None else store
+
+    def _record(self, key: StorageKey) -> _FSMRecord:
+        """
+        Запись для ключа. Если записи нет, она создается.
+
+        :param key: Ключ
+        :return: Запись
+        """
+        try:
+            return self.store[key]
+        except KeyError:
+            record = self.store[key] = _FSMRecord()
+            return record
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = self._record(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._drop_if_empty(key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = self.store.get(key)
+        return None if record is None else record.state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = self._record(key)
+        record.data = data.copy()
+        self._drop_if_empty(key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = self.store.get(key)
+        return {} if record is None else record.data.copy()
+
+    def _drop_if_empty(self, key: StorageKey, record: _FSMRecord) -> None:
+        """
+        Удаление записи без состояния и данных (после state.clear()).
+
+        :param key: Ключ
+        :param record: Запись
+        :return: None
+        """
+        if record.state is None and not record.data:
+            self.store.pop(key, None)
+
+    async def close(self) -> None:
+        self.store.clear()
@@ -0,0 +1,84 @@
+from typing import Any
+
+
+class Settings:
+    """
+    Настройки бота. Значения по умолчанию заданы атрибутами класса и переопределяются файлом конфигурации.
+    """
+    token: str = ""  # Токен бота
+    storage: str = "json"  # Хранилище расписания: "json" (файл в памяти + журнал) или "sqlite"
+    schedule_file: str = "schedule.json"  # Файл расписания (для хранилища json)
+    journal_dir: str = "journal"  # Каталог журнала броней (для хранилища json)
+    database: str = "schedule.db"  # Файл базы данных (для хранилища sqlite)
+    resources_file: str = ""  # Файл с филиалами и мастерами (см. resources.py); пусто - одно расписание
+    timezone: str = ""  # Часовой пояс парикмахерской (например, "Europe/Moscow"); пусто - часовой пояс сервера
+    db_pool_size: int = 4  # Количество потоков (и соединений) для запросов к базе данных
+    session_max_size: int = 100_000  # Наибольшее количество незавершенных броней (и состояний диалогов) в памяти
+    session_ttl: float = 3600.0  # Через сколько секунд бездействия незавершенная бронь удаляется
+    booked_users_ttl: float = 30 * 24 * 3600.0  # Сколько секунд помнить пользователей, которые сделали бронь
+    outbox_global_rate: float = 30.0  # Сколько сообщений в секунду бот отправляет во все чаты
+    outbox_chat_rate: float = 1.0  # Сколько сообщений в секунду бот отправляет в один чат
+    outbox_chat_burst: int = 3  # Сколько сообщений подряд можно отправить в один чат без ожидания
+    search_days: int = 92  # На сколько дней вперед ищутся записи в поиске ближайшего свободного времени
+    search_page_size: int = 6  # Сколько записей показывает одна страница поиска
+    waitlist_timeout: float = 900.0  # Сколько секунд пользователь из листа ожидания может подтверждать бронь
+    waitlist_max_size: int = 20  # Сколько пользователей может ждать одну запись
+    # База данных листов ожидания (SQLite): листы и предложения общие для процессов и сохраняются при перезапуске;
+    # пусто - в памяти процесса (только для одного процесса)
+    waitlist_file: str = ""
+    reminders_enabled: bool = True  # Напоминать пользователям о записях (см. reminders.py)
+    reminders_batch_size: int = 100  # Сколько напоминаний отправляется одной пачкой
+    admins: str = ""  # Id менеджеров через запятую: им доступны команды /export, /close и /open
+    log_level: str = "INFO"  # Уровень логов
+    log_format: str = "json"  # Формат логов в стандартном выводе: "json" (строка json на запись) или "text"
+    log_file: str = ""  # Файл логов (json, с ротацией); пусто - только стандартный вывод
+    log_max_bytes: int = 10 * 1024 * 1024  # Размер файла логов, после которого начинается новый файл
+    log_backup_count: int = 5  # Сколько старых файлов логов хранить
+    log_sample_every: int = 100  # Из записей aiogram об обработке каждого обновления в лог попадает каждая N-я
+    audit_file: str = ""  # Журнал аудита изменений броней (см. audit.py); пусто - не вести
+    metrics_host: str = "127.0.0.1"  # Адрес сервера метрик (GET /metrics)
+    metrics_port: int = 0  # Порт сервера метрик; 0 - метрики выключены
+
+    mode: str = "polling"  # Способ получения обновлений: "polling" или "webhook"
+    workers: int = 1  # Количество процессов, обрабатывающих обновления (больше 1 - только с хранилищем sqlite)
+    webhook_host: str = "0.0.0.0"  # Адрес, на котором веб-сервер принимает обновления
+    webhook_port: int = 8080  # Порт веб-сервера
+    webhook_path: str = "/webhook"  # Путь, по которому Telegram отправляет обновления
+    webhook_url: str = ""  # Внешний адрес сервера (https://...); если задан, регистрируется в Telegram при запуске
+    webhook_secret: str = ""  # Секретный токен для проверки запросов от Telegram
+
+
+def load_settings(filename: str) -> Settings:
+    """
+    Загрузка настроек из файла конфигурации. Первая строка файла - токен бота. Остальные строки имеют вид
+    "имя = значение", где имя - атрибут класса Settings. Пустые строки и строки, начинающиеся с "#", пропускаются.
+
+    :param filename: Имя файла конфигурации
+    :return: Настройки
+    """
+    settings = Settings()
+    with open(filename, "r") as f:
+        settings.token = f.readline().strip()
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            name, _, value = line.partition("=")
+            name, value = name.strip(), value.strip()
+            if name.startswith("_") or not hasattr(Settings, name):
+                raise ValueError(f"Неизвестная настройка: {name}")
+            setattr(settings, name, _convert(value, type(getattr(Settings, name))))
+    return settings
+
+
+def _convert(value: str, value_type: type) -> Any:
+    """
+    Перевод значения настройки из строки в тип значения по умолчанию.
+
+    :param value: Значение из файла
+    :param value_type: Тип значения
+    :return: Значение нужного типа
+    """
+    if value_type is bool:
+        return value.lower() in ("1", "true", "yes", "on")
+    return value_type(value)
@@ -0,0 +1,583 @@
+import datetime
+import sqlite3
+import sys
+import threading
+import time
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, Optional
+
+from clock import Clock
+from schedule import BaseSchedule
+from schedule_index import (ALL_WEEKDAYS, MINUTES_IN_DAY, NO_RECORD, UNAVAILABLE, ScheduleIndex, format_minutes,
+                            load_index)
+
+
+SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS days (
+    day INTEGER PRIMARY KEY,            -- Порядковый номер дня (datetime.date.toordinal)
+    is_workday INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS slots (
+    day INTEGER NOT NULL,
+    minute INTEGER NOT NULL,            -- Время записи в минутах от начала дня
+    state INTEGER NOT NULL,             -- 0 - свободна, id пользователя - забронирована, иначе - недоступна
+    version INTEGER NOT NULL DEFAULT 0, -- Увеличивается при каждом изменении state
+    PRIMARY KEY (day, minute)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS slots_state ON slots (state, day, minute);
+CREATE TABLE IF NOT EXISTS booked_users (
+    user_id INTEGER PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS booking_sessions (
+    user_id INTEGER PRIMARY KEY,
+    day INTEGER NOT NULL,               -- Дата, выбранная пользователем во время брони
+    updated_at REAL NOT NULL DEFAULT 0  -- Время последнего обращения (time.time)
+);
+"""
+
+
+class SqlitePool:
+    """
+    Пул потоков, у каждого из которых своё соединение с базой данных SQLite.
+    Запросы выполняются в потоках пула, чтобы цикл событий бота не ждал диск.
+    """
+
+    def __init__(self, database: str, size: int = 4) -> None:
+        """
+        Конструктор. Создает схему базы данных, если её нет.
+
+        :param database: Файл базы данных
+        :param size: Количество потоков
+        """
+        self.database: str = database
+        self._local = threading.local()  # Соединение текущего потока
+        self._connections: list[sqlite3.Connection] = []  # Все открытые соединения (для закрытия)
+        self._lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="sqlite")
+        self.connection().executescript(SCHEMA)
+        # Базы данных, созданные до появления версий записей
+        if "version" not in {column[1] for column in self.connection().execute("PRAGMA table_info(slots)")}:
+            self.connection().execute("ALTER TABLE slots ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        # Базы данных, созданные до удаления устаревших дат (их даты считаются устаревшими)
+        if "updated_at" not in {column[1] for column in self.connection().execute(
+                "PRAGMA table_info(booking_sessions)")}:
+            self.connection().execute("ALTER TABLE booking_sessions ADD COLUMN updated_at REAL NOT NULL DEFAULT 0")
+        self.connection().execute(
+            "CREATE INDEX IF NOT EXISTS booking_sessions_updated ON booking_sessions (updated_at)")
+
+    def connection(self) -> sqlite3.Connection:
+        """
+        Соединение текущего потока. Создается при первом обращении.
+
+        :return: Соединение
+        """
+        connection: Optional[sqlite3.Connection] = getattr(self._local, "connection", None)
+        if connection is None:
+            # isolation_level=None: транзакции открываются явно, одиночные запросы выполняются в автокоммите
+            connection = sqlite3.connect(self.database, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            connection.execute("PRAGMA busy_timeout = 5000")
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def close(self) -> None:
+        """
+        Остановка потоков и закрытие всех соединений.
+
+        :return: None
+        """
+        self.executor.shutdown(wait=True)
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+
+
+class SqliteSessionStore(MutableMapping):
+    """
+    Даты, выбранные пользователями во время брони, в базе данных SQLite. Подставляется вместо словаря
+    BaseSchedule.booking_dates, чтобы несколько процессов бота работали с общими данными.
+
+    Хранилище ограничено так же, как session_store.SessionStore: дата удаляется, если к ней не обращались дольше
+    ttl секунд, а при превышении max_size удаляются даты, к которым дольше всего не обращались. Время обращения
+    хранится в столбце updated_at (time.time: оно общее для процессов). Счетчики hits, misses, evictions
+    и expirations считаются в своем процессе.
+
+    Хранилище взаимозаменяемо с обычным словарем: любое другое общее хранилище (например, сетевое) должно так же
+    реализовать интерфейс MutableMapping[int, datetime.date].
+    """
+
+    def __init__(self, pool: SqlitePool, max_size: int = 100_000, ttl: float = 3600.0,
+                 sweep_interval: Optional[float] = None, clock: Callable[[], float] = time.time) -> None:
+        """
+        Конструктор.
+
+        :param pool: Пул соединений с базой данных
+        :param max_size: Наибольшее количество дат
+        :param ttl: Сколько секунд хранится дата, к которой не обращаются
+        :param sweep_interval: Период очистки устаревших дат в секундах (по умолчанию - ttl / 4)
+        :param clock: Источник времени в секундах (подменяется в проверках)
+        """
+        if max_size <= 0 or ttl <= 0:
+            raise ValueError("Размер хранилища и время хранения записей должны быть положительными")
+        self.pool: SqlitePool = pool
+        self.max_size: int = max_size
+        self.ttl: float = ttl
+        self.sweep_interval: float = ttl / 4 if sweep_interval is None else sweep_interval
+        self.clock: Callable[[], float] = clock
+        self._next_sweep: float = clock() + self.sweep_interval
+        self._lock: threading.Lock = threading.Lock()  # Счетчики изменяются из потоков пула соединений
+
+        self.hits: int = 0  # Найдено дат
+        self.misses: int = 0  # Не найдено дат (в том числе устаревших)
+        self.evictions: int = 0  # Удалено дат из-за превышения размера
+        self.expirations: int = 0  # Удалено устаревших дат
+
+    def __getitem__(self, user_id: int) -> datetime.date:
+        connection = self.pool.connection()
+        now = self.clock()
+        row = connection.execute("SELECT day, updated_at FROM booking_sessions WHERE user_id = ?",
+                                 (user_id,)).fetchone()
+        if row is not None and row[1] <= now - self.ttl:
+            # Условие на updated_at: дату могли обновить в другом процессе после чтения
+            expired = connection.execute("DELETE FROM booking_sessions WHERE user_id = ? AND updated_at <= ?",
+                                         (user_id, now - self.ttl)).rowcount
+            with self._lock:
+                self.expirations += expired
+            row = None
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            raise KeyError(user_id)
+        connection.execute("UPDATE booking_sessions SET updated_at = ? WHERE user_id = ?", (now, user_id))
+        with self._lock:
+            self.hits += 1
+        return datetime.date.fromordinal(row[0])
+
+    def __setitem__(self, user_id: int, date: datetime.date) -> None:
+        connection = self.pool.connection()
+        now = self.clock()
+        if now >= self._next_sweep:
+            self._sweep(now)
+        connection.execute("INSERT OR REPLACE INTO booking_sessions (user_id, day, updated_at) VALUES (?, ?, ?)",
+                           (user_id, date.toordinal(), now))
+        excess = connection.execute("SELECT COUNT(*) FROM booking_sessions").fetchone()[0] - self.max_size
+        if excess > 0:
+            evicted = connection.execute("DELETE FROM booking_sessions WHERE user_id IN "
+                                         "(SELECT user_id FROM booking_sessions ORDER BY updated_at LIMIT ?)",
+                                         (excess,)).rowcount
+            with self._lock:
+                self.evictions += evicted
+
+    def __delitem__(self, user_id: int) -> None:
+        if self.pool.connection().execute("DELETE FROM booking_sessions WHERE user_id = ?",
+                                          (user_id,)).rowcount == 0:
+            raise KeyError(user_id)
+
+    def __contains__(self, user_id: object) -> bool:
+        return self.pool.connection().execute("SELECT 1 FROM booking_sessions WHERE user_id = ? AND updated_at > ?",
+                                              (user_id, self.clock() - self.ttl)).fetchone() is not None
+
+    def __iter__(self) -> Iterator[int]:
+        return iter([user_id for user_id, in self.pool.connection().execute(
+            "SELECT user_id FROM booking_sessions WHERE updated_at > ?", (self.clock() - self.ttl,))])
+
+    def __len__(self) -> int:
+        """
+        Количество дат, включая устаревшие, которые еще не удалены очисткой.
+        """
+        return self.pool.connection().execute("SELECT COUNT(*) FROM booking_sessions").fetchone()[0]
+
+    def sweep(self) -> int:
+        """
+        Удаление устаревших дат.
+
+        :return: Количество удаленных дат
+        """
+        return self._sweep(self.clock())
+
+    def _sweep(self, now: float) -> int:
+        """
+        Удаление устаревших дат.
+
+        :param now: Текущий момент
+        :return: Количество удаленных дат
+        """
+        self._next_sweep = now + self.sweep_interval
+        expired = self.pool.connection().execute("DELETE FROM booking_sessions WHERE updated_at <= ?",
+                                                 (now - self.ttl,)).rowcount
+        with self._lock:
+            self.expirations += expired
+        return expired
+
+    def stats(self) -> dict[str, int]:
+        """
+        Счетчики хранилища (см. session_store.SessionStore.stats).
+
+        :return: Словарь {название счетчика: значение}
+        """
+        return {"size": len(self), "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "expirations": self.expirations}
+
+
+class SqliteSchedule(BaseSchedule):
+    """
+    Класс для работы с расписанием, хранящимся в базе данных SQLite. В память загружаются только
+    запрошенные дни, поэтому в одном файле могут храниться расписания за много лет.
+
+    Методы выполняют запросы в потоке, из которого вызваны. Для вызова из цикла событий используется
+    пул self.pool.executor (см. storage.AsyncSchedule).
+
+    С одной базой данных могут работать несколько процессов бота. Записи изменяются с оптимистичной блокировкой:
+    изменение применяется, только если версия записи не изменилась с момента чтения.
+    """
+
+    def __init__(self, database: str, pool_size: int = 4, shared_sessions: bool = False,
+                 booking_dates: Optional[MutableMapping] = None, clock: Optional[Clock] = None,
+                 session_max_size: int = 100_000, session_ttl: float = 3600.0) -> None:
+        """
+        Конструктор. Принимает имя файла базы данных. Расписание в базу данных переносится функцией import_index.
+
+        :param database: Файл базы данных
+        :param pool_size: Количество потоков для запросов
+        :param shared_sessions: Хранить даты, выбранные пользователями во время брони, в базе данных
+            (нужно, если с базой данных работают несколько процессов бота)
+        :param booking_dates: Хранилище дат, выбранных во время брони, в памяти процесса (если shared_sessions
+            не задан; см. BaseSchedule)
+        :param clock: Часы парикмахерской (см. BaseSchedule)
+        :param session_max_size: Наибольшее количество дат, выбранных во время брони, в базе данных
+            (если shared_sessions задан)
+        :param session_ttl: Сколько секунд хранится дата, выбранная во время брони, в базе данных
+        """
+        pool = SqlitePool(database, pool_size)
+        super().__init__(SqliteSessionStore(pool, session_max_size, session_ttl) if shared_sessions
+                         else booking_dates, clock)
+        self.pool: SqlitePool = pool
+
+    def close(self) -> None:
+        """
+        Завершение работы с расписанием: закрытие соединений с базой данных.
+
+        :return: None
+        """
+        self.pool.close()
+
+    @property
+    def booked_users_id(self) -> set[int]:
+        """
+        Пользователи, которые сделали бронь (чтобы менеджер смог с ними связаться).
+
+        :return: Id пользователей
+        """
+        return {user_id for user_id, in self.pool.connection().execute("SELECT user_id FROM booked_users")}
+
+    def has_day(self, ordinal: int) -> bool:
+        """
+        Проверяет, есть ли день в расписании.
+
+        :param ordinal: Порядковый номер дня
+        :return: Результат проверки
+        """
+        return self.pool.connection().execute("SELECT 1 FROM days WHERE day = ?", (ordinal,)).fetchone() is not None
+
+    def get_date_records(self, user_id: int, sort_filter: Callable[[int, int, int], bool],
+                         cutoff: Optional[int] = None) -> tuple[str, ...]:
+        """
+        Функция возвращает кортеж записей, которые удовлетворяют фильтру sort_filter, а также их дата - дата
+        бронирования. Выбранная пользователем дата передается в словаре self.booking_dates.
+        Фильтру передается момент записи, её состояние и текущий момент.
+
+        :param user_id: Id пользователя
+        :param sort_filter: Функция-фильтр
+        :param cutoff: Текущий момент
+        :return: Выбранные записи
+        """
+        if user_id not in self.booking_dates:
+            return tuple()
+        if cutoff is None:
+            cutoff = self.now_cutoff()
+        ordinal = self.booking_dates[user_id].toordinal()
+        if sort_filter is self.free_record:  # Свободные записи выбираются по индексу
+            rows = self.pool.connection().execute(
+                "SELECT minute, state FROM slots WHERE state = 0 AND day = ? AND minute > ? ORDER BY minute",
+                (ordinal, cutoff - ordinal * MINUTES_IN_DAY))
+        else:
+            rows = self.pool.connection().execute(
+                "SELECT minute, state FROM slots WHERE day = ? ORDER BY minute", (ordinal,))
+        day_key = ordinal * MINUTES_IN_DAY
+        return tuple(format_minutes(minute) for minute, state in rows if sort_filter(day_key + minute, state, cutoff))
+
+    def _read_slot(self, key: int) -> Optional[tuple[int, int]]:
+        """
+        Чтение состояния и версии записи. Занятые записи нерабочих дней читаются как UNAVAILABLE
+        (см. BaseSchedule.get_slot_state).
+
+        :param key: Момент записи
+        :return: (состояние, версия) или None, если записи нет в расписании
+        """
+        return self.pool.connection().execute(
+            "SELECT CASE WHEN state > 0 AND NOT is_workday THEN ? ELSE state END, version "
+            "FROM slots JOIN days USING (day) WHERE day = ? AND minute = ?",
+            (UNAVAILABLE, *divmod(key, MINUTES_IN_DAY))).fetchone()
+
+    def get_slot_state(self, key: int) -> int:
+        """
+        Состояние записи.
+
+        :param key: Момент записи
+        :return: Состояние записи или NO_RECORD, если записи нет в расписании
+        """
+        row = self._read_slot(key)
+        return NO_RECORD if row is None else row[0]
+
+    def book_slot(self, user_id: int, key: int, cutoff: Optional[int] = None, replaces: Optional[int] = None) -> bool:
+        """
+        Бронирует запись, если она свободна и находится в будущем, и освобождает запись replaces при переносе
+        (см. BaseSchedule.book_slot). Записи изменяются в одной транзакции условными UPDATE по версиям,
+        прочитанным вместе с состояниями, поэтому одну запись не смогут забронировать два пользователя
+        (в том числе из разных процессов), а перенос применяется целиком или не применяется.
+
+        :param user_id: Id пользователя
+        :param key: Момент записи
+        :param cutoff: Текущий момент
+        :param replaces: Момент освобождаемой записи пользователя или None
+        :return: Успешность бронирования
+        """
+        if cutoff is None:
+            cutoff = self.now_cutoff()
+        if key <= cutoff or (replaces is not None and replaces <= cutoff):  # Время в прошлом
+            return False
+        row = self._read_slot(key)
+        if row is None or row[0] != 0:
+            return False
+        changes = [(*divmod(key, MINUTES_IN_DAY), row[1], user_id)]
+        if replaces is not None:
+            row = self._read_slot(replaces)
+            if row is None or row[0] != user_id:
+                return False
+            changes.append((*divmod(replaces, MINUTES_IN_DAY), row[1], 0))
+        # Если записи изменились после чтения (например, их забронировал другой процесс), версии не совпадут
+        return self.compare_and_set_records(changes, user_id)
+
+    def cancel_booking(self, user_id: int, key: int, cutoff: Optional[int] = None) -> bool:
+        """
+        Отменяет бронь: запись освобождается, если она принадлежит пользователю и находится в будущем.
+
+        :param user_id: Id пользователя
+        :param key: Момент записи
+        :param cutoff: Текущий момент
+        :return: Успешность отмены
+        """
+        if cutoff is None:
+            cutoff = self.now_cutoff()
+        row = self._read_slot(key)
+        if key <= cutoff or row is None or row[0] != user_id:
+            return False
+        return self.compare_and_set_record(*divmod(key, MINUTES_IN_DAY), row[1], 0, user_id)
+
+    def get_user_bookings(self, user_id: int, cutoff: Optional[int] = None) -> list[int]:
+        """
+        Записи пользователя в будущем (по индексу slots_state), только в рабочие дни.
+
+        :param user_id: Id пользователя
+        :param cutoff: Текущий момент
+        :return: Моменты записей, по возрастанию
+        """
+        if cutoff is None:
+            cutoff = self.now_cutoff()
+        rows = self.pool.connection().execute(
+            "SELECT day * ? + minute FROM slots JOIN days USING (day) "
+            "WHERE state = ? AND day >= ? AND is_workday ORDER BY day, minute",
+            (MINUTES_IN_DAY, user_id, cutoff // MINUTES_IN_DAY))
+        return [key for key, in rows if key > cutoff]
+
+    def get_all_bookings(self, cutoff: Optional[int] = None) -> list[tuple[int, int]]:
+        """
+        Все брони в будущем. Занятые записи нерабочих дней - не брони (см. BaseSchedule.get_slot_state).
+
+        :param cutoff: Текущий момент
+        :return: Пары (id пользователя, момент записи)
+        """
+        if cutoff is None:
+            cutoff = self.now_cutoff()
+        rows = self.pool.connection().execute(
+            "SELECT state, day * ? + minute FROM slots JOIN days USING (day) "
+            "WHERE state > 0 AND day >= ? AND is_workday",
+            (MINUTES_IN_DAY, cutoff // MINUTES_IN_DAY))
+        return [(user_id, key) for user_id, key in rows if key > cutoff]
+
+    def iter_bookings(self, first_ordinal: int, last_ordinal: int) -> Iterator[tuple[int, int]]:
+        """
+        Перебор броней в промежутке дней по возрастанию момента. Строки читаются курсором по мере перебора
+        в соединении потока, из которого вызван перебор. Нерабочие дни пропускаются: их занятые записи - не брони.
+
+        :param first_ordinal: Порядковый номер первого дня
+        :param last_ordinal: Порядковый номер дня, следующего за последним
+        :return: Пары (момент записи, id пользователя)
+        """
+        yield from self.pool.connection().execute(
+            "SELECT day * ? + minute, state FROM slots JOIN days USING (day) "
+            "WHERE day >= ? AND day < ? AND state > 0 AND is_workday ORDER BY day, minute",
+            (MINUTES_IN_DAY, first_ordinal, last_ordinal))
+
+    def set_slots_availability(self, first_ordinal: int, last_ordinal: int, is_open: bool, time_from: int = 0,
+                               time_to: int = MINUTES_IN_DAY, weekdays: int = ALL_WEEKDAYS,
+                               cutoff: Optional[int] = None) -> list[int]:
+        """
+        Массовое открытие или закрытие записей (см. BaseSchedule.set_slots_availability) одним запросом UPDATE
+        в транзакции, которая сначала читает изменяемые записи. Версии измененных записей увеличиваются, поэтому
+        брони, начатые до изменения, не применятся.
+
+        :param first_ordinal: Порядковый номер первого дня
+        :param last_ordinal: Порядковый номер дня, следующего за последним
+        :param is_open: True - открыть записи, False - закрыть
+        :param time_from: Записи не раньше этого времени, минуты от начала дня
+        :param time_to: Записи раньше этого времени, минуты от начала дня
+        :param weekdays: Маска дней недели: бит 0 - понедельник, бит 6 - воскресенье
+        :param cutoff: Текущий момент
+        :return: Моменты измененных записей
+        """
+        if cutoff is None:
+            cutoff = self.now_cutoff()
+        old_state, new_state = (UNAVAILABLE, 0) if is_open else (0, UNAVAILABLE)
+        condition = ("state = ? AND day >= ? AND day < ? AND minute >= ? AND minute < ? "
+                     "AND (? >> ((day - 1) % 7)) & 1 AND day * ? + minute > ?")
+        parameters = (old_state, max(first_ordinal, cutoff // MINUTES_IN_DAY), last_ordinal, time_from, time_to,
+                      weekdays, MINUTES_IN_DAY, cutoff)
+        connection = self.pool.connection()
+        connection.execute("BEGIN IMMEDIATE")  # Записи не изменятся между чтением и UPDATE
+        try:
+            keys = [key for key, in connection.execute(
+                f"SELECT day * ? + minute FROM slots WHERE {condition} ORDER BY day, minute",
+                (MINUTES_IN_DAY, *parameters))]
+            if keys:
+                connection.execute(f"UPDATE slots SET state = ?, version = version + 1 WHERE {condition}",
+                                   (new_state, *parameters))
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return keys
+
+    def compare_and_set_record(self, ordinal: int, minutes: int, version: int, state: int, user_id: int = 0) -> bool:
+        """
+        Изменение состояния записи, если её версия равна version (оптимистичная блокировка).
+
+        :param ordinal: Порядковый номер дня
+        :param minutes: Время записи в минутах от начала дня
+        :param version: Версия записи, прочитанная вместе с состоянием
+        :param state: Новое состояние
+        :param user_id: Id пользователя, совершившего изменение. Если состояние равно ему, пользователь добавляется
+            в список сделавших бронь
+        :return: Применено ли изменение
+        """
+        return self.compare_and_set_records([(ordinal, minutes, version, state)], user_id)
+
+    def compare_and_set_records(self, changes: list[tuple[int, int, int, int]], user_id: int = 0) -> bool:
+        """
+        Изменение состояний нескольких записей в одной транзакции. Изменения применяются, только если версии
+        всех записей не изменились с момента чтения, иначе не применяется ни одно.
+
+        :param changes: Изменения: (порядковый номер дня, время в минутах, прочитанная версия, новое состояние)
+        :param user_id: Id пользователя, совершившего изменения. Если он бронирует запись, он добавляется в список
+            сделавших бронь
+        :return: Применены ли изменения
+        """
+        connection = self.pool.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            changed = all(connection.execute(
+                "UPDATE slots SET state = ?, version = version + 1 WHERE day = ? AND minute = ? AND version = ?",
+                (state, ordinal, minutes, version)).rowcount == 1 for ordinal, minutes, version, state in changes)
+            if changed and user_id and any(state == user_id for *_, state in changes):
+                connection.execute("INSERT OR IGNORE INTO booked_users (user_id) VALUES (?)", (user_id,))
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT" if changed else "ROLLBACK")
+        return changed
+
+    def get_closest_free_dates(self, days_range: int, cutoff: Optional[int] = None) -> tuple[datetime.date, ...]:
+        """
+        Возвращает ближайшие days_range дней, включая сегодняшний день, в которых есть свободные записи в будущем.
+
+        :param days_range: Сколько дней просмотреть
+        :param cutoff: Текущий момент
+        :return: Дни со свободными записями
+        """
+        if cutoff is None:
+            cutoff = self.now_cutoff()
+        today = cutoff // MINUTES_IN_DAY
+        rows = self.pool.connection().execute(
+            "SELECT DISTINCT day FROM slots WHERE state = 0 AND day >= ? AND day < ? "
+            "AND (day > ? OR minute > ?) ORDER BY day",
+            (today, today + days_range, today, cutoff % MINUTES_IN_DAY))
+        return tuple(datetime.date.fromordinal(day) for day, in rows)
+
+    def find_free_slots(self, first_ordinal: int, last_ordinal: int, time_from: int = 0,
+                        time_to: int = MINUTES_IN_DAY, weekdays: int = ALL_WEEKDAYS, limit: int = 10,
+                        after: Optional[int] = None, cutoff: Optional[int] = None) -> list[int]:
+        """
+        Поиск свободных записей в будущем (см. BaseSchedule.find_free_slots). Записи выбираются по индексу
+        slots_state, фильтр по дням недели и времени выполняется базой данных.
+
+        :param first_ordinal: Порядковый номер первого дня
+        :param last_ordinal: Порядковый номер дня, следующего за последним
+        :param time_from: Записи не раньше этого времени, минуты от начала дня
+        :param time_to: Записи раньше этого времени, минуты от начала дня
+        :param weekdays: Маска дней недели: бит 0 - понедельник, бит 6 - воскресенье
+        :param limit: Сколько записей найти
+        :param after: Записи позже этого момента (продолжение поиска) или None
+        :param cutoff: Текущий момент
+        :return: Моменты найденных записей, по возрастанию
+        """
+        if cutoff is None:
+            cutoff = self.now_cutoff()
+        after_key = cutoff if after is None else max(after, cutoff)
+        rows = self.pool.connection().execute(
+            "SELECT day * ? + minute AS key FROM slots WHERE state = 0 AND day >= ? AND day < ? "
+            "AND minute >= ? AND minute < ? AND (? >> ((day - 1) % 7)) & 1 AND day * ? + minute > ? "
+            "ORDER BY day, minute LIMIT ?",
+            (MINUTES_IN_DAY, max(first_ordinal, after_key // MINUTES_IN_DAY), last_ordinal, time_from, time_to,
+             weekdays, MINUTES_IN_DAY, after_key, limit))
+        return [key for key, in rows]
+
+    def import_index(self, index: ScheduleIndex) -> None:
+        """
+        Перенос расписания из индекса в базу данных. Существующие дни и записи заменяются.
+
+        :param index: Индекс расписания
+        :return: None
+        """
+        connection = self.pool.connection()
+        connection.execute("BEGIN")
+        try:
+            for offset in range(index.days_count):
+                if not index.present[offset]:
+                    continue
+                ordinal = index.first_ordinal + offset
+                connection.execute("INSERT OR REPLACE INTO days (day, is_workday) VALUES (?, ?)",
+                                   (ordinal, index.workdays[offset]))
+                connection.executemany("INSERT INTO slots (day, minute, state) VALUES (?, ?, ?) "
+                                       "ON CONFLICT (day, minute) DO UPDATE SET state = excluded.state, "
+                                       "version = version + 1",
+                                       ((ordinal, index.slot_minutes[slot], state)
+                                        for slot, state in index.day_records(ordinal)))
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+
+if __name__ == "__main__":
+    # Перенос расписания из json в базу данных: python sqlite_schedule.py schedule.json schedule.db
+    if len(sys.argv) != 3:
+        print("Использование: python sqlite_schedule.py <schedule.json> <schedule.db>")
+        sys.exit(1)
+    schedule = SqliteSchedule(sys.argv[2], pool_size=1)
+    schedule.import_index(load_index(sys.argv[1]))
+    schedule.close()
@@ -0,0 +1,451 @@
+import asyncio
+import datetime
+import time
+from concurrent.futures import Executor
+from typing import Any, Callable, Optional
+
+from audit import AuditLog
+from clock import Clock
+from journal import BookingJournal
+from metrics import metrics
+from resources import load_resources
+from schedule import BaseSchedule, Schedule
+from schedule_index import ALL_WEEKDAYS
+from session_store import SessionStore
+from settings import Settings
+from sqlite_schedule import SqliteSchedule
+
+
+class AsyncSchedule:
+    """
+    Асинхронный доступ к расписанию для обработчиков бота. Операции с хранилищем выполняются в пуле потоков
+    хранилища (если он есть), поэтому цикл событий не блокируется на диске. Расписание в памяти (Schedule)
+    вызывается напрямую: его операции не ждут диск. Если задан журнал аудита (audit), в него записывается
+    каждое изменение броней, открытие и закрытие записей с ресурсом и временем операции. Изменение записывается
+    в потоке, который его выполнил, сразу после него, поэтому порядок строк журнала совпадает с порядком изменений.
+
+    Ресурсы (мастера) расписания указываются именами из BaseSchedule.resources: по ним листы ожидания
+    отличают записи разных мастеров в одно время.
+    """
+
+    def __init__(self, schedule: BaseSchedule, executor: Optional[Executor] = None) -> None:
+        """
+        Конструктор.
+
+        :param schedule: Расписание
+        :param executor: Пул потоков для операций с хранилищем или None, если операции выполняются в цикле событий
+        """
+        self.schedule: BaseSchedule = schedule
+        self.executor: Optional[Executor] = executor
+        self.resources: dict[str, BaseSchedule] = dict(schedule.resources())  # Имя ресурса -> расписание
+        self._resource_names: dict[int, str] = {id(resource): name for name, resource in self.resources.items()}
+        self.audit: Optional[AuditLog] = None  # Журнал аудита изменений записей
+
+    async def _run(self, function: Callable[..., Any], *args: Any) -> Any:
+        """
+        Выполнение операции с хранилищем.
+
+        :param function: Операция
+        :param args: Аргументы
+        :return: Результат операции
+        """
+        if not metrics.enabled:
+            if self.executor is None:
+                return function(*args)
+            return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+        started = time.perf_counter()
+        try:
+            if self.executor is None:
+                return function(*args)
+            return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+        finally:
+            metrics.observe("bot_schedule_seconds", time.perf_counter() - started, method=function.__name__)
+
+    def now_cutoff(self) -> int:
+        """
+        Текущий момент (см. BaseSchedule.now_cutoff).
+
+        :return: Текущий момент
+        """
+        return self.schedule.now_cutoff()
+
+    async def reset_booking_date(self, user_id: int) -> None:
+        """
+        Очистка даты бронирования для пользователя.
+
+        :param user_id: Id пользователя
+        :return: None
+        """
+        await self._run(self.schedule.reset_booking_date, user_id)
+
+    async def is_booking_date_set(self, user_id: int) -> bool:
+        """
+        Функция проверяет, установлена ли дата бронирования.
+
+        :param user_id: Id пользователя
+        :return: Результат проверки
+        """
+        return await self._run(self.schedule.is_booking_date_set, user_id)
+
+    def is_time_correct(self, str_time: str) -> bool:
+        """
+        Функция проверяет, существует ли переданное в виде строки время.
+
+        :param str_time: Время
+        :return: Результат проверки
+        """
+        return self.schedule.is_time_correct(str_time)
+
+    async def set_booking_date(self, user_id: int, str_date: str, cutoff: int) -> bool:
+        """
+        Установка даты бронирования для пользователя (см. BaseSchedule.set_booking_date).
+
+        :param user_id: Id пользователя
+        :param str_date: Дата бронирования в формате строки
+        :param cutoff: Текущий момент
+        :return: Успешность установки даты
+        """
+        return await self._run(self.schedule.set_booking_date, user_id, str_date, cutoff)
+
+    async def get_free_records(self, user_id: int, cutoff: int) -> tuple[str, ...]:
+        """
+        Свободные записи в будущем в дату, выбранную пользователем.
+
+        :param user_id: Id пользователя
+        :param cutoff: Текущий момент
+        :return: Время свободных записей
+        """
+        return await self._run(self.schedule.get_date_records, user_id, self.schedule.free_record, cutoff)
+
+    async def get_closest_free_dates(self, user_id: int, days_range: int, cutoff: int) -> tuple[datetime.date, ...]:
+        """
+        Ближайшие дни со свободными записями (см. BaseSchedule.get_closest_free_dates) в расписании, выбранном
+        пользователем (см. BaseSchedule.for_user).
+
+        :param user_id: Id пользователя
+        :param days_range: Сколько дней просмотреть
+        :param cutoff: Текущий момент
+        :return: Дни со свободными записями
+        """
+        return await self._run(self.schedule.for_user(user_id).get_closest_free_dates, days_range, cutoff)
+
+    async def find_free_slots(self, user_id: int, first_ordinal: int, last_ordinal: int, time_from: int,
+                              time_to: int, limit: int, after: Optional[int], cutoff: int) -> list[int]:
+        """
+        Поиск свободных записей в промежутке дней (см. BaseSchedule.find_free_slots), все дни недели,
+        в расписании, выбранном пользователем.
+
+        :param user_id: Id пользователя
+        :param first_ordinal: Порядковый номер первого дня
+        :param last_ordinal: Порядковый номер дня, следующего за последним
+        :param time_from: Записи не раньше этого времени, минуты от начала дня
+        :param time_to: Записи раньше этого времени, минуты от начала дня
+        :param limit: Сколько записей найти
+        :param after: Записи позже этого момента (продолжение поиска) или None
+        :param cutoff: Текущий момент
+        :return: Моменты найденных записей, по возрастанию
+        """
+        return await self._run(self.schedule.for_user(user_id).find_free_slots, first_ordinal, last_ordinal,
+                               time_from, time_to, ALL_WEEKDAYS, limit, after, cutoff)
+
+    async def try_book_record(self, user_id: int, str_time: str, cutoff: int, replaces: Optional[int] = None) -> bool:
+        """
+        Атомарное бронирование свободной записи (см. BaseSchedule.try_book_record).
+
+        :param user_id: Id пользователя
+        :param str_time: Время брони
+        :param cutoff: Текущий момент
+        :param replaces: Момент записи пользователя, которая освобождается при переносе, или None
+        :return: Успешность бронирования
+        """
+        if self.audit is None:
+            return await self._run(self.schedule.try_book_record, user_id, str_time, cutoff, replaces)
+        key = await self.booking_key(user_id, str_time)  # Для журнала аудита нужен момент записи
+        return key >= 0 and await self.book_slot(user_id, key, cutoff, replaces)
+
+    async def booking_key(self, user_id: int, str_time: str) -> int:
+        """
+        Момент записи на время str_time в дату, выбранную пользователем (см. BaseSchedule.booking_key).
+
+        :param user_id: Id пользователя
+        :param str_time: Время записи
+        :return: Момент записи или -1
+        """
+        return await self._run(self.schedule.booking_key, user_id, str_time)
+
+    async def book_slot(self, user_id: int, key: int, cutoff: int, replaces: Optional[int] = None,
+                        resource: Optional[str] = None) -> bool:
+        """
+        Атомарное бронирование свободной записи по её моменту (см. BaseSchedule.book_slot).
+
+        :param user_id: Id пользователя
+        :param key: Момент записи
+        :param cutoff: Текущий момент
+        :param replaces: Момент записи пользователя, которая освобождается при переносе, или None
+        :param resource: Ресурс, у которого бронируется запись, или None - в расписании, выбранном пользователем
+        :return: Успешность бронирования
+        """
+        schedule = self.schedule if resource is None else self.resources[resource]
+        if self.audit is None:
+            return await self._run(schedule.book_slot, user_id, key, cutoff, replaces)
+        return await self._run(self._book_slot, schedule, user_id, key, cutoff, replaces, resource)
+
+    def _book_slot(self, schedule: BaseSchedule, user_id: int, key: int, cutoff: int, replaces: Optional[int],
+                   resource: Optional[str]) -> bool:
+        """
+        Бронирование записи с записью в журнал аудита (см. book_slot).
+
+        :param schedule: Расписание, в котором бронируется запись
+        :param user_id: Id пользователя
+        :param key: Момент записи
+        :param cutoff: Текущий момент
+        :param replaces: Момент освобождаемой записи пользователя или None
+        :param resource: Ресурс, у которого бронируется запись, или None
+        :return: Успешность бронирования
+        """
+        started = time.perf_counter()
+        replaced = "" if replaces is None else self._booked_resource(user_id, replaces) or ""
+        if not schedule.book_slot(user_id, key, cutoff, replaces):
+            return False
+        if resource is None:
+            resource = next(iter(self.resources)) if len(self.resources) == 1 else \
+                self._booked_resource(user_id, key) or ""
+        latency = time.perf_counter() - started
+        self.audit.record("book" if replaces is None else "reschedule", user_id, resource, key, 0, user_id, latency)
+        if replaces is not None:
+            self.audit.record("reschedule", user_id, replaced, replaces, user_id, 0, latency)
+        return True
+
+    async def cancel_booking(self, user_id: int, key: int, cutoff: int,
+                             resource: Optional[str] = None) -> Optional[str]:
+        """
+        Отмена брони пользователя (см. BaseSchedule.cancel_booking).
+
+        :param user_id: Id пользователя
+        :param key: Момент записи
+        :param cutoff: Текущий момент
+        :param resource: Ресурс, у которого отменяется бронь, или None - у любого ресурса
+        :return: Ресурс, у которого освободилась запись, или None, если бронь не отменена
+        """
+        return await self._run(self._cancel_booking, user_id, key, cutoff, resource)
+
+    def _cancel_booking(self, user_id: int, key: int, cutoff: int, resource: Optional[str]) -> Optional[str]:
+        """
+        Отмена брони у ресурса resource или у первого ресурса, у которого записан пользователь, с записью в журнал
+        аудита.
+
+        :param user_id: Id пользователя
+        :param key: Момент записи
+        :param cutoff: Текущий момент
+        :param resource: Ресурс или None
+        :return: Ресурс, у которого освободилась запись, или None
+        """
+        started = time.perf_counter()
+        for name in self.resources if resource is None else (resource,):
+            if self.resources[name].cancel_booking(user_id, key, cutoff):
+                if self.audit is not None:
+                    self.audit.record("cancel", user_id, name, key, user_id, 0, time.perf_counter() - started)
+                return name
+        return None
+
+    async def booked_resource(self, user_id: int, key: int) -> Optional[str]:
+        """
+        Ресурс, у которого пользователь записан на момент key.
+
+        :param user_id: Id пользователя
+        :param key: Момент записи
+        :return: Имя ресурса или None, если пользователь не записан на это время
+        """
+        return await self._run(self._booked_resource, user_id, key)
+
+    def _booked_resource(self, user_id: int, key: int) -> Optional[str]:
+        """
+        Ресурс, у которого пользователь записан на момент key (см. booked_resource).
+
+        :param user_id: Id пользователя
+        :param key: Момент записи
+        :return: Имя ресурса или None
+        """
+        return next((name for name, resource in self.resources.items() if resource.is_booked_by(user_id, key)),
+                    None)
+
+    async def slot_states(self, user_id: int, key: int) -> list[tuple[str, int]]:
+        """
+        Состояния записи (см. BaseSchedule.get_slot_state) у каждого ресурса расписания, выбранного пользователем.
+
+        :param user_id: Id пользователя
+        :param key: Момент записи
+        :return: Пары (имя ресурса, состояние записи)
+        """
+        return await self._run(self._slot_states, user_id, key)
+
+    def _slot_states(self, user_id: int, key: int) -> list[tuple[str, int]]:
+        """
+        Состояния записи у каждого ресурса расписания, выбранного пользователем (см. slot_states).
+
+        :param user_id: Id пользователя
+        :param key: Момент записи
+        :return: Пары (имя ресурса, состояние записи)
+        """
+        return [(self._resource_names[id(resource)], resource.get_slot_state(key))
+                for _, resource in self.schedule.for_user(user_id).resources()]
+
+    async def get_user_bookings(self, user_id: int, cutoff: int) -> list[int]:
+        """
+        Записи пользователя в будущем (см. BaseSchedule.get_user_bookings).
+
+        :param user_id: Id пользователя
+        :param cutoff: Текущий момент
+        :return: Моменты записей, по возрастанию
+        """
+        return await self._run(self.schedule.get_user_bookings, user_id, cutoff)
+
+    async def get_all_bookings(self, cutoff: int) -> list[tuple[int, int]]:
+        """
+        Все брони в будущем (см. BaseSchedule.get_all_bookings).
+
+        :param cutoff: Текущий момент
+        :return: Пары (id пользователя, момент записи)
+        """
+        return await self._run(self.schedule.get_all_bookings, cutoff)
+
+    async def set_slots_availability(self, user_id: int, first_ordinal: int, last_ordinal: int, is_open: bool,
+                                     time_from: int, time_to: int, weekdays: int, cutoff: int) -> int:
+        """
+        Массовое открытие или закрытие записей (см. set_resource_availability) в расписании, выбранном
+        пользователем (менеджером).
+
+        :param user_id: Id пользователя
+        :param first_ordinal: Порядковый номер первого дня
+        :param last_ordinal: Порядковый номер дня, следующего за последним
+        :param is_open: True - открыть записи, False - закрыть
+        :param time_from: Записи не раньше этого времени, минуты от начала дня
+        :param time_to: Записи раньше этого времени, минуты от начала дня
+        :param weekdays: Маска дней недели: бит 0 - понедельник, бит 6 - воскресенье
+        :param cutoff: Текущий момент
+        :return: Количество измененных записей
+        """
+        return await self._run(self.set_resource_availability, user_id, self.schedule.for_user(user_id),
+                               first_ordinal, last_ordinal, is_open, time_from, time_to, weekdays, cutoff)
+
+    def set_resource_availability(self, chat_id: int, schedule: BaseSchedule, first_ordinal: int, last_ordinal: int,
+                                  is_open: bool, time_from: int, time_to: int, weekdays: int, cutoff: int) -> int:
+        """
+        Массовое открытие или закрытие записей (см. BaseSchedule.set_slots_availability) у каждого ресурса
+        расписания schedule с записью в журнал аудита по ресурсам. Синхронная: вызывается в пуле потоков
+        хранилища и из командной строки (admin.py).
+
+        :param chat_id: Id чата менеджера (0 - командная строка)
+        :param schedule: Расписание: self.schedule или его часть (филиал, мастер)
+        :param first_ordinal: Порядковый номер первого дня
+        :param last_ordinal: Порядковый номер дня, следующего за последним
+        :param is_open: True - открыть записи, False - закрыть
+        :param time_from: Записи не раньше этого времени, минуты от начала дня
+        :param time_to: Записи раньше этого времени, минуты от начала дня
+        :param weekdays: Маска дней недели: бит 0 - понедельник, бит 6 - воскресенье
+        :param cutoff: Текущий момент
+        :return: Количество измененных записей
+        """
+        count = 0
+        for _, resource in schedule.resources():
+            started = time.perf_counter()
+            keys = resource.set_slots_availability(first_ordinal, last_ordinal, is_open, time_from, time_to,
+                                                   weekdays, cutoff)
+            count += len(keys)
+            if self.audit is not None:
+                self.audit.record_period("open" if is_open else "close", chat_id, self._resource_names[id(resource)],
+                                         first_ordinal, last_ordinal, time_from, time_to, weekdays, keys,
+                                         time.perf_counter() - started)
+        return count
+
+    async def get_slot_state(self, user_id: int, key: int) -> int:
+        """
+        Состояние записи (см. BaseSchedule.get_slot_state) в расписании, выбранном пользователем.
+
+        :param user_id: Id пользователя
+        :param key: Момент записи
+        :return: Состояние записи
+        """
+        return await self._run(self.schedule.for_user(user_id).get_slot_state, key)
+
+    async def is_booked_by(self, user_id: int, key: int) -> bool:
+        """
+        Проверка, записан ли пользователь на момент key (см. BaseSchedule.is_booked_by).
+
+        :param user_id: Id пользователя
+        :param key: Момент записи
+        :return: Результат проверки
+        """
+        return await self._run(self.schedule.is_booked_by, user_id, key)
+
+    def close(self) -> None:
+        """
+        Завершение работы с расписанием.
+
+        :return: None
+        """
+        self.schedule.close()
+        if self.audit is not None:
+            self.audit.close()  # Запись оставшихся изменений
+
+
+def create_schedule(settings: Settings, clock: Optional[Clock] = None) -> AsyncSchedule:
+    """
+    Создание расписания с хранилищем, выбранным в настройках.
+
+    :param settings: Настройки
+    :param clock: Часы парикмахерской (по умолчанию - в часовом поясе settings.timezone)
+    :return: Асинхронный доступ к расписанию
+    """
+    if clock is None:
+        clock = Clock(settings.timezone)
+    booking_dates = SessionStore(settings.session_max_size, settings.session_ttl)
+    if settings.resources_file:
+        return create_resource_schedule(settings, booking_dates, clock)
+    if settings.storage == "json":
+        booked_users_id = SessionStore(settings.session_max_size, settings.booked_users_ttl)
+        return AsyncSchedule(Schedule(settings.schedule_file, settings.journal_dir, booking_dates, booked_users_id,
+                                      clock))
+    if settings.storage == "sqlite":
+        # Если процессов несколько, даты, выбранные пользователями, тоже хранятся в базе данных
+        schedule = SqliteSchedule(settings.database, settings.db_pool_size, shared_sessions=settings.workers > 1,
+                                  booking_dates=booking_dates, clock=clock, session_max_size=settings.session_max_size,
+                                  session_ttl=settings.session_ttl)
+        return AsyncSchedule(schedule, schedule.pool.executor)
+    raise ValueError(f"Неизвестное хранилище расписания: {settings.storage}")
+
+
+def create_resource_schedule(settings: Settings, booking_dates: SessionStore, clock: Clock) -> AsyncSchedule:
+    """
+    Создание расписания филиалов и мастеров (см. resources.ResourceSchedule) из файла settings.resources_file.
+    У каждого мастера своё хранилище: файл расписания (json) или база данных (sqlite). Изменения расписаний json
+    пишутся в один журнал в каталоге journal_dir с ресурсом <филиал>.<мастер>, поэтому у всех мастеров общие
+    поток fsync и снимки. Даты и мастера, выбранные пользователями, хранятся в памяти процесса: обновления
+    одного чата всегда обрабатывает один процесс.
+
+    :param settings: Настройки
+    :param booking_dates: Хранилище дат, выбранных во время брони
+    :param clock: Часы парикмахерской
+    :return: Асинхронный доступ к расписанию
+    """
+    journal = BookingJournal(settings.journal_dir) if settings.storage == "json" else None
+
+    def open_master(master: dict, number: str) -> BaseSchedule:
+        if settings.storage == "json":
+            # Пользователи, которые недавно сделали бронь, у каждого мастера свои
+            booked_users_id = SessionStore(settings.session_max_size, settings.booked_users_ttl)
+            return Schedule(master["schedule"], None, booking_dates, booked_users_id, clock, journal, number)
+        if settings.storage == "sqlite":
+            return SqliteSchedule(master["database"], settings.db_pool_size, booking_dates=booking_dates,
+                                  clock=clock)
+        raise ValueError(f"Неизвестное хранилище расписания: {settings.storage}")
+
+    schedule = load_resources(settings.resources_file, open_master, booking_dates,
+                              SessionStore(settings.session_max_size, settings.booked_users_ttl), clock)
+    if journal is not None:
+        # Журнал открывается после восстановления всех мастеров: снимок содержит расписания всех мастеров
+        journal.open(compact=journal.replayed > 0)
+        schedule.journal = journal
+    first_master = schedule.masters[0][1]
+    # Запросы ко всем базам данных выполняются в пуле потоков первой из них: у каждого потока свои соединения
+    return AsyncSchedule(schedule, first_master.pool.executor if isinstance(first_master, SqliteSchedule) else None)
@@ -0,0 +1,100 @@
+import asyncio
+import datetime
+import json
+import threading
+from typing import Any, Optional
+
+from audit import AuditLog, describe_state, replay_audit
+from clock import Clock
+from schedule import Schedule
+from schedule_index import MINUTES_IN_DAY, UNAVAILABLE, load_index
+from sqlite_schedule import SqliteSchedule
+from storage import AsyncSchedule
+
+DAY = datetime.date(2026, 10, 19).toordinal()
+TEN, ELEVEN, TWELVE = (DAY * MINUTES_IN_DAY + hour * 60 for hour in (10, 11, 12))
+
+
+def test_replay_matches_schedule(tmp_path) -> None:
+    filename = str(tmp_path / "schedule.json")
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump({"2026": {"months": [{"days": [{"date": "19.10.2026",
+                                                  "records": {"10:00": 0, "11:00": 0, "12:00": 0}}]}]}}, f)
+    schedule = AsyncSchedule(Schedule(filename))
+    schedule.audit = AuditLog(str(tmp_path / "audit.jsonl"))
+
+    async def change() -> None:
+        assert await schedule.book_slot(1, TEN, 0)
+        assert await schedule.book_slot(2, ELEVEN, 0)
+        assert not await schedule.book_slot(3, TEN, 0)  # Неудачная бронь в журнал не попадает
+        assert await schedule.book_slot(1, TWELVE, 0, replaces=TEN)
+        assert await schedule.cancel_booking(2, ELEVEN, 0) == ""  # Освобождена запись единственного ресурса
+        assert await schedule.book_slot(3, TEN, 0)
+        assert await schedule.set_slots_availability(4, DAY, DAY + 1, False, 11 * 60, 12 * 60, 0b1, 0) == 1
+
+    asyncio.run(change())
+    schedule.audit.close()
+    assert schedule.audit.written == 7
+    states = replay_audit(schedule.audit.filename)
+    assert states == {("", TEN): 3, ("", ELEVEN): UNAVAILABLE, ("", TWELVE): 1}
+    assert all(schedule.schedule.get_slot_state(key) == state for (_, key), state in states.items())
+    assert [describe_state(state) for state in (3, 0, UNAVAILABLE)] == ["забронирована 3", "свободна", "закрыта"]
+    schedule.close()
+
+
+def test_time_has_shop_offset(tmp_path) -> None:
+    moment = datetime.datetime(2026, 10, 18, 9, 0, tzinfo=datetime.timezone.utc)
+
+    def now(tz: Optional[datetime.tzinfo]) -> datetime.datetime:  # Как datetime.datetime.now
+        return moment.astimezone(tz) if tz is not None else moment.astimezone().replace(tzinfo=None)
+
+    for timezone, expected in (("Europe/Moscow", "2026-10-18T12:00:00.000+03:00"), ("", None)):
+        filename = str(tmp_path / f"audit{timezone.replace('/', '')}.jsonl")
+        audit = AuditLog(filename, Clock(timezone, now))
+        audit.record("book", 1, "", TEN, 0, 1, 0.0)
+        audit.close()
+        with open(filename, encoding="utf-8") as f:
+            created = datetime.datetime.fromisoformat(json.loads(f.readline())["time"])
+        assert created.utcoffset() is not None  # Время всегда со смещением часового пояса
+        if expected is not None:
+            assert created.isoformat(timespec="milliseconds") == expected
+
+
+
+class ThreadRecordingAudit(AuditLog):
+    """
+    Журнал аудита, который запоминает потоки, в которых записываются изменения.
+    """
+
+    def __init__(self, filename: str) -> None:
+        super().__init__(filename)
+        self.threads: set[str] = set()
+
+    def record(self, *args: Any) -> None:
+        self.threads.add(threading.current_thread().name.split("_")[0])
+        super().record(*args)
+
+
+def test_changes_recorded_by_storage_threads(tmp_path) -> None:
+    filename = str(tmp_path / "schedule.json")
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump({"2026": {"months": [{"days": [{"date": "19.10.2026", "records": {"10:00": 0}}]}]}}, f)
+    sqlite_schedule = SqliteSchedule(str(tmp_path / "schedule.db"), 4)
+    sqlite_schedule.import_index(load_index(filename))
+    schedule = AsyncSchedule(sqlite_schedule, sqlite_schedule.pool.executor)
+    audit = schedule.audit = ThreadRecordingAudit(str(tmp_path / "audit.jsonl"))
+
+    async def book_and_cancel(user_id: int) -> None:
+        if await schedule.book_slot(user_id, TEN, 0):
+            await schedule.cancel_booking(user_id, TEN, 0)
+
+    async def change() -> None:
+        await asyncio.gather(*(book_and_cancel(user_id) for user_id in range(1, 21)))
+        assert await schedule.book_slot(21, TEN, 0)
+
+    asyncio.run(change())
+    audit.close()
+    # Изменения записываются сразу после выполнения в потоке хранилища, а не после возврата в цикл событий
+    assert audit.threads == {"sqlite"}
+    assert replay_audit(audit.filename) == {("", TEN): 21}
+    schedule.close()
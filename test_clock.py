@@ -0,0 +1,40 @@
+import asyncio
+import datetime
+from typing import Any, Optional
+
+from clock import Clock, ClockMiddleware
+from schedule_index import MINUTES_IN_DAY
+
+# 18.10.2026 22:30 UTC - в Москве (UTC+3) уже 19.10.2026 01:30
+INSTANT = datetime.datetime(2026, 10, 18, 22, 30, tzinfo=datetime.timezone.utc)
+
+
+def source(timezone: Optional[datetime.tzinfo]) -> datetime.datetime:
+    return INSTANT.astimezone(timezone)
+
+
+def test_cutoff_in_shop_timezone() -> None:
+    utc = Clock("UTC", source)
+    moscow = Clock("Europe/Moscow", source)
+    assert utc.cutoff() == datetime.date(2026, 10, 18).toordinal() * MINUTES_IN_DAY + 22 * 60 + 30
+    assert moscow.cutoff() == datetime.date(2026, 10, 19).toordinal() * MINUTES_IN_DAY + 60 + 30
+    assert moscow.cutoff() - utc.cutoff() == 3 * 60  # Тот же момент, но другой день
+    assert moscow.now().date() == datetime.date(2026, 10, 19)
+
+
+def test_middleware_passes_one_cutoff() -> None:
+    now = [INSTANT]
+    clock = Clock("Europe/Moscow", lambda timezone: now[0].astimezone(timezone))
+    seen: list[int] = []
+
+    async def handler(event: Any, data: dict[str, Any]) -> str:
+        seen.append(data["cutoff"])
+        now[0] += datetime.timedelta(minutes=5)  # Время идет во время обработки
+        seen.append(data["cutoff"])
+        return "done"
+
+    data: dict[str, Any] = {}
+    assert asyncio.run(ClockMiddleware(clock)(handler, object(), data)) == "done"
+    expected = datetime.date(2026, 10, 19).toordinal() * MINUTES_IN_DAY + 60 + 30
+    assert seen == [expected, expected]
+    assert clock.cutoff() == expected + 5
@@ -0,0 +1,73 @@
+import datetime
+import json
+import os
+import threading
+
+from journal import SEGMENT_PREFIX, BookingJournal
+from schedule import Schedule
+from schedule_index import MINUTES_IN_DAY
+
+DAY = datetime.date(2026, 10, 19).toordinal()
+TEN, ELEVEN = 0, 1  # Номера столбцов записей 10:00 и 11:00
+
+
+def write_schedule(path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"2026": {"months": [{"days": [{"date": "19.10.2026", "records": {"10:00": 0, "11:00": 0}}]}]}}, f)
+
+
+def test_replay_after_crash(tmp_path) -> None:
+    filename, directory = str(tmp_path / "schedule.json"), str(tmp_path / "journal")
+    write_schedule(filename)
+    crashed = Schedule(filename, directory)
+    reopened = None
+    try:
+        crashed.set_record_state(DAY, TEN, 5, 5)
+        crashed.set_record_state(DAY, ELEVEN, 6, 6)
+        crashed.set_record_state(DAY, ELEVEN, 0, 6)
+        # Процесс завершился, не закрыв журнал, во время записи брони пользователя 7
+        segment = max(name for name in os.listdir(directory) if name.startswith(SEGMENT_PREFIX))
+        with open(os.path.join(directory, segment), "ab") as f:
+            f.write(f"{DAY} 660 7".encode())
+        reopened = Schedule(filename, directory)
+        assert reopened.index.get_state(DAY, TEN) == 5
+        assert reopened.index.get_state(DAY, ELEVEN) == 0  # Недописанная строка пропущена
+        reopened.set_record_state(DAY, ELEVEN, 7, 7)
+    finally:
+        crashed.close()  # Только чтобы остановить потоки журнала
+        if reopened is not None:
+            reopened.close()
+    restored = Schedule(filename, directory)  # Из снимка, сделанного после восстановления, и нового сегмента
+    try:
+        assert restored.index.get_state(DAY, TEN) == 5
+        assert restored.index.get_state(DAY, ELEVEN) == 7
+        assert 7 in restored.booked_users_id
+    finally:
+        restored.close()
+
+
+def test_masters_share_journal(tmp_path) -> None:
+    filename, directory = str(tmp_path / "schedule.json"), str(tmp_path / "journal")
+    write_schedule(filename)
+
+    def open_masters() -> tuple[BookingJournal, list[Schedule]]:
+        journal = BookingJournal(directory, compact_every=2)
+        masters = [Schedule(filename, None, {}, {}, None, journal, resource) for resource in ("1.1", "1.2")]
+        journal.open(compact=journal.replayed > 0)
+        return journal, masters
+
+    journal, (first, second) = open_masters()
+    try:
+        assert first.book_slot(5, DAY * MINUTES_IN_DAY + 600, 0)
+        assert second.book_slot(6, DAY * MINUTES_IN_DAY + 600, 0)
+        assert second.book_slot(7, DAY * MINUTES_IN_DAY + 660, 0)  # Сегмент переполнен: снимок обоих мастеров
+        assert sum(thread.name == "journal-fsync" for thread in threading.enumerate()) == 1
+    finally:
+        journal.close()
+    journal, (first, second) = open_masters()
+    try:
+        assert (first.index.get_state(DAY, TEN), first.index.get_state(DAY, ELEVEN)) == (5, 0)
+        assert (second.index.get_state(DAY, TEN), second.index.get_state(DAY, ELEVEN)) == (6, 7)
+        assert (list(first.booked_users_id), sorted(second.booked_users_id)) == ([5], [6, 7])
+    finally:
+        journal.close()
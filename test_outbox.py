@@ -0,0 +1,63 @@
+import asyncio
+from typing import Any
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from outbox import Outbox
+
+
+class FakeBot:
+    """
+    Подменный бот: запоминает отправленные сообщения, первые ответы можно заменить ошибками.
+    """
+
+    def __init__(self, *errors: Exception) -> None:
+        self.errors: list[Exception] = list(errors)
+        self.sent: list[tuple[int, str, Any]] = []
+
+    async def send_message(self, chat_id: int, text: str, reply_markup: Any = None) -> str:
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append((chat_id, text, reply_markup))
+        return text
+
+
+def make_outbox(bot: FakeBot) -> Outbox:
+    return Outbox(bot, global_rate=1e9, chat_rate=1e9, chat_burst=1)  # type: ignore[arg-type]
+
+
+def test_messages_of_chat_merged() -> None:
+    bot = FakeBot()
+
+    async def check() -> None:
+        outbox = make_outbox(bot)
+        first = outbox.send(1, "a")
+        outbox.send(1, "b", reply_markup="keyboard")  # Клавиатура завершает объединенное сообщение
+        outbox.send(1, "c")
+        outbox.send(2, "d")
+        await outbox.close()
+        assert await first == "a\n\nb"
+        assert outbox.stats()["merged"] == 1
+        assert outbox.stats()["depth"] == 0
+
+    asyncio.run(check())
+    assert sorted(bot.sent) == [(1, "a\n\nb", "keyboard"), (1, "c", None), (2, "d", None)]
+
+
+def test_retry_after_and_failure() -> None:
+    method = SendMessage(chat_id=1, text="a")
+    bot = FakeBot(TelegramRetryAfter(method, "Too Many Requests", 0))
+
+    async def check() -> None:
+        outbox = make_outbox(bot)
+        delivered = outbox.send(1, "a")
+        assert await delivered == "a"  # Отправлено повторно после 429
+        bot.errors.append(TelegramBadRequest(method, "chat not found"))
+        failed = outbox.send(1, "b")
+        assert await failed is None  # Ошибка, которую повтор не исправит
+        stats = outbox.stats()
+        assert (stats["sent"], stats["retries"], stats["failed"]) == (3, 1, 1)
+
+    asyncio.run(check())
+    assert bot.sent == [(1, "a", None)]
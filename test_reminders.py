@@ -0,0 +1,103 @@
+import asyncio
+
+from reminders import REMINDERS, ReminderScheduler, TimerWheel
+from schedule_index import MINUTES_IN_DAY
+
+
+class FakeClock:
+    """
+    Подменные часы: текущий момент в минутах, сдвигается вручную.
+    """
+
+    def __init__(self, now: int) -> None:
+        self.now: int = now
+
+    def __call__(self) -> int:
+        return self.now
+
+
+def test_timer_wheel_fires_in_deadline_order() -> None:
+    wheel: TimerWheel[str] = TimerWheel(now=0, size=4, levels=2)
+    for key, deadline in (("a", 3), ("b", 1), ("c", 17), ("d", 100)):  # "c" - на втором уровне, "d" - за горизонтом
+        wheel.add(key, deadline, key)
+    assert len(wheel) == 4
+    assert wheel.advance(2) == ["b"]
+    assert wheel.advance(16) == ["a"]
+    assert wheel.advance(17) == ["c"]
+    assert wheel.advance(99) == []
+    assert wheel.advance(200) == ["d"]
+    assert len(wheel) == 0
+
+
+def test_timer_wheel_cancel_and_replace() -> None:
+    wheel: TimerWheel[str] = TimerWheel(now=10, size=4, levels=2)
+    wheel.add("a", 12, "a")
+    wheel.add("b", 30, "b")
+    assert wheel.cancel("a")
+    assert not wheel.cancel("a")
+    wheel.add("b", 11, "b2")  # Таймер с тем же ключом заменяется
+    wheel.add("late", 5, "late")  # Срок прошел: срабатывает на следующем такте
+    assert "a" not in wheel
+    assert wheel.advance(11) == ["b2", "late"]
+    assert wheel.advance(40) == []
+    assert len(wheel) == 0
+
+
+def test_scheduler_sends_due_reminders() -> None:
+    key = 739000 * MINUTES_IN_DAY + 10 * 60
+    clock = FakeClock(key - 2 * MINUTES_IN_DAY)
+    sent: list[tuple[int, str]] = []
+
+    async def send(chat_id: int, text: str) -> None:
+        sent.append((chat_id, text))
+
+    async def check() -> None:
+        scheduler = ReminderScheduler(send, clock)
+        scheduler.add(7, key)
+        assert len(scheduler.wheel) == len(REMINDERS)
+        assert await scheduler.tick() == 0
+        clock.now = key - MINUTES_IN_DAY
+        assert await scheduler.tick() == 1
+        clock.now = key - 2 * 60
+        assert await scheduler.tick() == 1
+        assert [chat_id for chat_id, _ in sent] == [7, 7]
+        assert "10:00" in sent[1][1]
+
+    asyncio.run(check())
+
+
+def test_scheduler_cancel_and_recheck() -> None:
+    key = 739000 * MINUTES_IN_DAY + 10 * 60
+    clock = FakeClock(key - 2 * MINUTES_IN_DAY)
+    sent: list[int] = []
+
+    async def send(chat_id: int, text: str) -> None:
+        sent.append(chat_id)
+
+    async def is_booked(user_id: int, slot: int) -> bool:
+        return user_id != 2  # Бронь пользователя 2 отменена в другом процессе
+
+    async def check() -> None:
+        scheduler = ReminderScheduler(send, clock, is_booked)
+        for user_id in (1, 2, 3):
+            scheduler.add(user_id, key)
+        scheduler.cancel(3, key)
+        clock.now = key
+        assert await scheduler.tick() == len(REMINDERS)
+        assert sent == [1] * len(REMINDERS)
+
+    asyncio.run(check())
+
+
+def test_scheduler_disabled() -> None:
+    key = 739000 * MINUTES_IN_DAY
+    clock = FakeClock(key - 2 * MINUTES_IN_DAY)
+
+    async def send(chat_id: int, text: str) -> None:
+        raise AssertionError("Выключенные напоминания не отправляются")
+
+    scheduler = ReminderScheduler(send, clock, enabled=False)
+    scheduler.add(1, key)
+    assert len(scheduler.wheel) == 0
+    clock.now = key
+    assert asyncio.run(scheduler.tick()) == 0
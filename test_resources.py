@@ -0,0 +1,101 @@
+import datetime
+import json
+
+import pytest
+
+from resources import BranchSchedule, ResourceSchedule
+from schedule import Schedule
+from schedule_index import MINUTES_IN_DAY
+
+DAY = datetime.date(2026, 10, 19).toordinal()
+TEN, ELEVEN = DAY * MINUTES_IN_DAY + 10 * 60, DAY * MINUTES_IN_DAY + 11 * 60
+
+
+@pytest.fixture
+def resources(tmp_path) -> ResourceSchedule:
+    """
+    Филиал "A" с мастерами "1" (10:00 занята пользователем 9) и "2", филиал "B" с мастером "3" (10:00 занята
+    пользователем 9).
+    """
+    booking_dates: dict = {}
+
+    def master(name: str, records: dict[str, int]) -> tuple[str, Schedule]:
+        filename = str(tmp_path / f"{name}.json")
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump({"2026": {"months": [{"days": [{"date": "19.10.2026", "records": records}]}]}}, f)
+        return name, Schedule(filename, None, booking_dates)
+
+    result = ResourceSchedule([
+        ("A", BranchSchedule([master("1", {"10:00": 9, "11:00": 0}), master("2", {"10:00": 0, "11:00": 0})],
+                             booking_dates)),
+        ("B", BranchSchedule([master("3", {"10:00": 9, "11:00": 0})], booking_dates)),
+    ], booking_dates)
+    yield result
+    result.close()
+
+
+def test_branch_aggregates_masters(resources: ResourceSchedule) -> None:
+    branch = resources.branches[0][1]
+    assert [name for name, _ in resources.resources()] == ["A / 1", "A / 2", "B / 3"]
+    assert branch.get_slot_state(TEN) == 0  # Свободна у мастера 2
+    assert branch.find_free_slots(DAY, DAY + 1, cutoff=0) == [TEN, ELEVEN]
+    assert branch.get_closest_free_dates(3, DAY * MINUTES_IN_DAY) == (datetime.date(2026, 10, 19),)
+    assert branch.book_slot(1, TEN, 0)  # У мастера 2: у мастера 1 запись занята
+    assert branch.masters[1][1].get_slot_state(TEN) == 1
+    assert branch.get_slot_state(TEN) > 0
+    assert not branch.book_slot(2, TEN, 0)
+    assert branch.find_free_slots(DAY, DAY + 1, cutoff=0) == [ELEVEN]
+    assert sorted(resources.get_all_bookings(0)) == [(1, TEN), (9, TEN), (9, TEN)]
+
+
+def test_reschedule_across_masters_and_branches(resources: ResourceSchedule) -> None:
+    branch = resources.branches[0][1]
+    first, second = branch.masters[0][1], branch.masters[1][1]
+    assert branch.book_slot(1, ELEVEN, 0)  # У мастера 1
+    assert branch.book_slot(1, TEN, 0, replaces=ELEVEN)  # 10:00 у мастера 1 занята: перенос к мастеру 2
+    assert (second.get_slot_state(TEN), first.get_slot_state(ELEVEN)) == (1, 0)
+    assert resources.select(1, 1, 0)  # Филиал "B", мастер "3"
+    assert not resources.book_slot(1, TEN, 0, replaces=TEN)  # У мастера 3 время занято
+    assert resources.book_slot(1, ELEVEN, 0, replaces=TEN)
+    assert resources.branches[1][1].masters[0][1].get_slot_state(ELEVEN) == 1
+    assert second.get_slot_state(TEN) == 0
+    assert resources.get_user_bookings(1, 0) == [ELEVEN]
+
+
+def test_branch_index_follows_masters(tmp_path) -> None:
+    booking_dates: dict = {}
+    masters = []
+    for name, records in (("1", {"10:00": 0, "11:00": 0}), ("2", {"10:30": 0, "11:00": 0})):
+        filename = str(tmp_path / f"{name}.json")
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump({"2026": {"months": [{"days": [{"date": "19.10.2026", "records": records},
+                                                     {"date": "20.10.2026", "records": records}]}]}}, f)
+        masters.append((name, Schedule(filename, None, booking_dates)))
+    branch = BranchSchedule(masters, booking_dates)
+    merged = BranchSchedule(masters, booking_dates)
+    merged._index_checked = True  # Запросы по расписаниям мастеров, без общего индекса
+    first, second = masters[0][1], masters[1][1]
+    half_past_ten = DAY * MINUTES_IN_DAY + 10 * 60 + 30
+
+    def check() -> None:
+        for cutoff in (0, TEN, ELEVEN):
+            assert branch.find_free_slots(DAY, DAY + 2, cutoff=cutoff, limit=10) == \
+                merged.find_free_slots(DAY, DAY + 2, cutoff=cutoff, limit=10)
+            assert branch.get_closest_free_dates(3, cutoff) == merged.get_closest_free_dates(3, cutoff)
+
+    check()
+    assert branch._index is not None
+    assert first.book_slot(1, TEN, 0) and second.book_slot(2, half_past_ten, 0)
+    check()
+    assert branch.find_free_slots(DAY, DAY + 1, cutoff=0) == [ELEVEN]
+    assert first.book_slot(3, ELEVEN, 0) and second.book_slot(4, ELEVEN, 0)  # День 19.10 занят у всех мастеров
+    check()
+    assert branch.get_closest_free_dates(3, TEN) == (datetime.date(2026, 10, 20),)
+    assert branch.set_slots_availability(DAY + 1, DAY + 2, False, cutoff=0)
+    check()
+    assert branch.get_closest_free_dates(3, TEN) == ()
+    assert first.cancel_booking(3, ELEVEN, 0) and branch.set_slots_availability(DAY + 1, DAY + 2, True, cutoff=0)
+    check()
+    assert branch.find_free_slots(DAY, DAY + 2, cutoff=0) == [ELEVEN, TEN + MINUTES_IN_DAY, half_past_ten +
+                                                              MINUTES_IN_DAY, ELEVEN + MINUTES_IN_DAY]
+    branch.close()
@@ -0,0 +1,58 @@
+import datetime
+import json
+
+import pytest
+
+from schedule import BaseSchedule, Schedule
+from schedule_index import MINUTES_IN_DAY, load_index
+from sqlite_schedule import SqliteSchedule
+
+FIRST = datetime.date(2026, 10, 19).toordinal()  # Понедельник
+BOOKED = {(FIRST + 2, "10:00"): 5, (FIRST + 7, "11:00"): 6}  # Среда и следующий понедельник
+
+
+def key(day: int, minutes: int) -> int:
+    return (FIRST + day) * MINUTES_IN_DAY + minutes
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def schedule(request: pytest.FixtureRequest, tmp_path) -> BaseSchedule:
+    days = [{"date": datetime.date.fromordinal(ordinal).strftime("%d.%m.%Y"),
+             "records": {time: BOOKED.get((ordinal, time), 0) for time in ("09:00", "10:00", "11:00", "12:00")}}
+            for ordinal in range(FIRST, FIRST + 10)]
+    filename = str(tmp_path / "schedule.json")
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump({"2026": {"months": [{"days": days}]}}, f)
+    if request.param == "json":
+        result: BaseSchedule = Schedule(filename)
+    else:
+        result = SqliteSchedule(str(tmp_path / "schedule.db"), 1)
+        result.import_index(load_index(filename))
+    request.addfinalizer(result.close)
+    return result
+
+
+def test_find_free_slots_pages(schedule: BaseSchedule) -> None:
+    cutoff = key(0, 10 * 60 + 30)
+    pages = []
+    after = None
+    while True:  # Понедельники и среды, с 10:00 до 12:00, по 2 записи на странице
+        page = schedule.find_free_slots(FIRST, FIRST + 10, 10 * 60, 12 * 60, 0b101, 2, after, cutoff)
+        if not page:
+            break
+        pages.append(page)
+        after = page[-1]
+    assert pages == [[key(0, 660), key(2, 660)], [key(7, 600), key(9, 600)], [key(9, 660)]]
+
+
+def test_find_free_slots_range(schedule: BaseSchedule) -> None:
+    # Последний день не входит в промежуток, записи до cutoff не находятся
+    assert schedule.find_free_slots(FIRST + 1, FIRST + 2, limit=10, cutoff=key(1, 10 * 60)) == \
+        [key(1, 660), key(1, 720)]
+    assert schedule.find_free_slots(FIRST, FIRST + 10, 12 * 60, MINUTES_IN_DAY, 0b1000000, cutoff=0) == \
+        [key(6, 720)]
+
+
+def test_base_schedule_is_abstract() -> None:
+    with pytest.raises(TypeError):
+        BaseSchedule()  # type: ignore[abstract]
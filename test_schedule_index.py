@@ -0,0 +1,60 @@
+import datetime
+
+import pytest
+
+from schedule_index import NO_RECORD, ScheduleIndex, load_binary
+
+FIRST = datetime.date(2026, 10, 19).toordinal()
+
+
+def make_index() -> ScheduleIndex:
+    """
+    Индекс из двух дней с пропуском между ними: рабочий день FIRST и нерабочий день FIRST + 2.
+    """
+    return ScheduleIndex.from_json_data({"2026": {"months": [{"days": [
+        {"date": "19.10.2026", "records": {"10:00": 0, "11:00": 0}},
+        {"date": "21.10.2026", "is_workday": False, "records": {"10:00": 2, "11:00": 2}},
+    ]}]}})
+
+
+def test_set_state_updates_free_days() -> None:
+    index = make_index()
+    index.set_state(FIRST, 0, 5)
+    index.set_state(FIRST, 1, 6)
+    assert index.free_days_between(FIRST, FIRST + 3) == []
+    assert index.day_bookings(FIRST) == [(0, 5), (1, 6)]
+    index.set_state(FIRST, 1, 0)
+    assert index.free_days_between(FIRST, FIRST + 3) == [FIRST]
+
+
+@pytest.mark.parametrize("ordinal, slot", [(FIRST - 1, 0), (FIRST + 1, 0), (FIRST + 3, 0), (FIRST, -1), (FIRST, 2)])
+def test_set_state_rejects_missing_record(ordinal: int, slot: int) -> None:
+    index = make_index()
+    states = index.states.tolist()
+    with pytest.raises(ValueError):
+        index.set_state(ordinal, slot, 5)
+    assert index.states.tolist() == states  # Ни одна запись не изменена
+    assert index.get_state(ordinal, slot) == NO_RECORD
+
+
+def test_non_workday_has_no_bookings() -> None:
+    index = make_index()
+    assert index.get_state(FIRST + 2, 0) == 2
+    assert index.booking_state(FIRST + 2, 0) < 0
+    assert index.day_bookings(FIRST + 2) == []
+
+
+def test_snapshot_keeps_state_at_freeze(tmp_path) -> None:
+    index = make_index()
+    index.set_state(FIRST, 0, 5)
+    snapshot = index.freeze()
+    index.set_state(FIRST, 1, 6)  # После снимка: в файл не попадает
+    index.set_state(FIRST, 0, 0)
+    snapshot.save(str(tmp_path / "index.bin"))
+    index.set_state(FIRST, 1, 0)  # После записи снимок уже не сохраняет строки
+    assert index.snapshot is None
+    saved = load_binary(str(tmp_path / "index.bin"))
+    assert (saved.get_state(FIRST, 0), saved.get_state(FIRST, 1)) == (5, 0)
+    assert saved.free_days_between(FIRST, FIRST + 3) == [FIRST]
+    assert saved.find_free(FIRST, FIRST + 3, 0, saved.window_mask(0, 24 * 60)) == [FIRST * 24 * 60 + 11 * 60]
+    assert saved.get_state(FIRST + 2, 0) == 2
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+
+from session_store import SessionStorage, SessionStore
+
+
+class FakeClock:
+    """
+    Подменные часы: текущее время в секундах, сдвигается вручную.
+    """
+
+    def __init__(self) -> None:
+        self.now: float = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_expired_entries_removed() -> None:
+    clock = FakeClock()
+    store: SessionStore[int, str] = SessionStore(max_size=10, ttl=60, sweep_interval=30, clock=clock)
+    store[1] = "a"
+    store[2] = "b"
+    clock.now = 50
+    assert store[1] == "a"  # Обращение продлевает запись
+    clock.now = 100
+    assert 2 not in store
+    with pytest.raises(KeyError):
+        store[2]
+    assert store.get(1) == "a"
+    store[3] = "c"  # Запись запускает периодическую очистку
+    assert store.stats() == {"size": 2, "hits": 2, "misses": 1, "evictions": 0, "expirations": 1}
+    clock.now = 1000
+    assert store.sweep() == 2
+    assert len(store) == 0
+    assert store.expirations == 3
+
+
+def test_least_recently_used_evicted() -> None:
+    store: SessionStore[int, str] = SessionStore(max_size=2, clock=FakeClock())
+    store[1] = "a"
+    store[2] = "b"
+    assert store[1] == "a"
+    store[3] = "c"  # Вытесняется 2: к ней обращались раньше всех
+    assert sorted(store) == [1, 3]
+    store[1] = "a2"  # Перезапись не вытесняет записи
+    assert store.evictions == 1
+    assert dict(store.items()) == {1: "a2", 3: "c"}
+
+
+def test_storage_drops_cleared_sessions() -> None:
+    storage = SessionStorage(SessionStore(max_size=10, clock=FakeClock()))
+    key = StorageKey(bot_id=1, chat_id=2, user_id=2)
+
+    async def check() -> None:
+        await storage.set_state(key, "booking:date")
+        await storage.set_data(key, {"reschedule": 1})
+        assert await storage.get_state(key) == "booking:date"
+        assert await storage.get_data(key) == {"reschedule": 1}
+        await storage.set_state(key, None)
+        await storage.set_data(key, {})
+        assert len(storage.store) == 0
+
+    asyncio.run(check())
@@ -0,0 +1,112 @@
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from schedule_index import MINUTES_IN_DAY, ScheduleIndex
+from sqlite_schedule import SqlitePool, SqliteSchedule, SqliteSessionStore
+
+DAY = datetime.date(2026, 10, 19).toordinal()
+TEN = DAY * MINUTES_IN_DAY + 10 * 60
+
+
+@pytest.fixture
+def database(tmp_path) -> str:
+    result = str(tmp_path / "schedule.db")
+    schedule = SqliteSchedule(result, 1)
+    schedule.import_index(ScheduleIndex.from_json_data({"2026": {"months": [{"days": [
+        {"date": "19.10.2026", "records": {"10:00": 0, "11:00": 0}}]}]}}))
+    schedule.close()
+    return result
+
+
+def read_version(schedule: SqliteSchedule, minutes: int) -> int:
+    return schedule.pool.connection().execute("SELECT version FROM slots WHERE day = ? AND minute = ?",
+                                              (DAY, minutes)).fetchone()[0]
+
+
+def test_past_record_not_booked(database: str) -> None:
+    schedule = SqliteSchedule(database, 1)
+    try:
+        assert schedule.set_booking_date(1, "19.10.2026", 0)
+        assert not schedule.try_book_record(1, "10:00", TEN)  # Время уже наступило
+        assert schedule.try_book_record(1, "11:00", TEN)
+        assert schedule.get_date_records(1, schedule.free_record, 0) == ("10:00",)
+        assert schedule.booked_users_id == {1}
+    finally:
+        schedule.close()
+
+
+def test_stale_version_rejected(database: str) -> None:
+    first, second = SqliteSchedule(database, 1), SqliteSchedule(database, 1)
+    try:
+        version = read_version(first, 600)
+        assert read_version(second, 600) == version
+        assert first.compare_and_set_record(DAY, 600, version, 5, 5)
+        assert not second.compare_and_set_record(DAY, 600, version, 6, 6)  # Версия устарела
+        assert read_version(second, 600) == version + 1
+        assert second.booked_users_id == {5}
+    finally:
+        first.close()
+        second.close()
+
+
+def test_compare_and_set_records_all_or_nothing(database: str) -> None:
+    schedule = SqliteSchedule(database, 1)
+    try:
+        ten_version, eleven_version = read_version(schedule, 600), read_version(schedule, 660)
+        assert schedule.compare_and_set_record(DAY, 660, eleven_version, 9, 9)
+        # Версия второй записи устарела: первая запись тоже не изменяется
+        assert not schedule.compare_and_set_records([(DAY, 600, ten_version, 5), (DAY, 660, eleven_version, 0)], 5)
+        assert read_version(schedule, 600) == ten_version
+        assert schedule.get_slot_state(TEN) == 0
+        assert schedule.get_slot_state(TEN + 60) == 9
+        assert schedule.booked_users_id == {9}
+    finally:
+        schedule.close()
+
+
+def test_concurrent_bookings_one_winner(database: str) -> None:
+    schedules = [SqliteSchedule(database, 1) for _ in range(2)]  # Как два процесса
+    barrier = threading.Barrier(8)
+
+    def book(user_id: int) -> bool:
+        schedule = schedules[user_id % 2]
+        assert schedule.set_booking_date(user_id, "19.10.2026", 0)
+        barrier.wait()
+        return schedule.try_book_record(user_id, "10:00", 0)
+
+    try:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(book, range(1, 9)))
+        assert results.count(True) == 1
+        assert schedules[0].booked_users_id == {results.index(True) + 1}
+    finally:
+        for schedule in schedules:
+            schedule.close()
+
+
+def test_session_store_expires_and_evicts(tmp_path) -> None:
+    now = [0.0]
+    pool = SqlitePool(str(tmp_path / "sessions.db"), 1)
+    store = SqliteSessionStore(pool, max_size=2, ttl=60, sweep_interval=30, clock=lambda: now[0])
+    first, second = datetime.date(2026, 10, 19), datetime.date(2026, 10, 20)
+    try:
+        store[1] = first
+        store[2] = second
+        now[0] = 50
+        assert store[1] == first  # Обращение продлевает дату
+        now[0] = 100
+        assert 2 not in store
+        with pytest.raises(KeyError):
+            store[2]
+        store[3] = second
+        store[4] = first  # Вытесняется 1: к ней обращались раньше остальных
+        assert sorted(store) == [3, 4]
+        assert store.stats() == {"size": 2, "hits": 1, "misses": 1, "evictions": 1, "expirations": 1}
+        now[0] = 1000
+        assert store.sweep() == 2
+        assert len(store) == 0
+    finally:
+        pool.close()
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+from typing import Optional
+
+import pytest
+
+from waitlist import AsyncWaitlist, SqliteWaitlist, Waitlist
+
+KEY = 739000 * 1440 + 600
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def waitlist(request: pytest.FixtureRequest, tmp_path) -> Waitlist:
+    if request.param == "memory":
+        return Waitlist(max_waiting=2)
+    result = SqliteWaitlist(str(tmp_path / "waitlist.db"), max_waiting=2)
+    request.addfinalizer(result.close)
+    return result
+
+
+def test_queues_per_resource(waitlist: Waitlist) -> None:
+    assert waitlist.join(["A", "B"], KEY, 1, KEY - 60) == 1
+    assert waitlist.join(["A"], KEY, 2, KEY - 60) == 2
+    assert waitlist.join(["A"], KEY, 3, KEY - 60) == 0  # Лист ожидания у A заполнен
+    assert waitlist.join(["A", "B"], KEY, 3, KEY - 60) == 2
+    assert waitlist.join(["A"], KEY, 2, KEY - 60) == 2  # Повторная постановка не меняет место
+    assert waitlist.waiting_count() == 3
+    assert waitlist.first("B", KEY) == 1
+    assert waitlist.leave(KEY, 1)  # Из листов у всех ресурсов
+    assert waitlist.first("A", KEY) == 2
+    assert waitlist.first("B", KEY) == 3
+    assert waitlist.first("C", KEY) is None
+    assert not waitlist.leave(KEY, 1)
+
+
+def test_past_slots_removed(waitlist: Waitlist) -> None:
+    waitlist.join(["A"], KEY, 1, KEY - 60)
+    waitlist.join(["A"], KEY + 60, 2, KEY)
+    assert waitlist.first("A", KEY) is None
+    assert waitlist.first("A", KEY + 60) == 2
+
+
+def test_offer_closed_once(waitlist: Waitlist) -> None:
+    waitlist.offer("A", KEY, 1, 100.0)
+    waitlist.offer("B", KEY, 2, 200.0)
+    assert sorted(waitlist.pending_offers()) == [("A", KEY, 1, 100.0), ("B", KEY, 2, 200.0)]
+    assert not waitlist.close_offer("A", KEY, 2)
+    assert waitlist.close_offer("A", KEY, 1)
+    assert not waitlist.close_offer("A", KEY, 1)
+    assert waitlist.pending_offers() == [("B", KEY, 2, 200.0)]
+
+
+def test_sqlite_waitlist_survives_restart(tmp_path) -> None:
+    database = str(tmp_path / "waitlist.db")
+    first = SqliteWaitlist(database)
+    first.join(["A"], KEY, 1, KEY - 60)
+    first.join(["A"], KEY, 2, KEY - 60)
+    first.offer("A", KEY, 3, 100.0)
+    first.close()
+    second = SqliteWaitlist(database)
+    other = SqliteWaitlist(database)  # Другой процесс с той же базой данных
+    try:
+        assert second.first("A", KEY) == 1
+        assert second.pending_offers() == [("A", KEY, 3, 100.0)]
+        assert other.close_offer("A", KEY, 3)
+        assert not second.close_offer("A", KEY, 3)
+    finally:
+        second.close()
+        other.close()
+
+
+class ThreadRecordingWaitlist(SqliteWaitlist):
+    """
+    Лист ожидания, запоминающий потоки, в которых выполняются запросы first.
+    """
+
+    threads: list[str] = []
+
+    def first(self, resource: str, key: int) -> Optional[int]:
+        self.threads.append(threading.current_thread().name)
+        return super().first(resource, key)
+
+
+def test_async_waitlist_queries_off_event_loop(tmp_path) -> None:
+    waitlist = AsyncWaitlist(ThreadRecordingWaitlist(str(tmp_path / "waitlist.db")))
+
+    async def check() -> None:
+        assert await waitlist.join(["A", "B"], KEY, 1, KEY - 60) == 1
+        assert await waitlist.join(["A"], KEY, 2, KEY - 60) == 2
+        assert waitlist.waiting == 2
+        assert await waitlist.first("A", KEY) == 1
+        assert await waitlist.leave(KEY, 1)
+        assert waitlist.waiting == 1
+        await waitlist.offer("A", KEY, 2, 100.0)
+        assert await waitlist.pending_offers() == [("A", KEY, 2, 100.0)]
+        assert await waitlist.close_offer("A", KEY, 2)
+
+    try:
+        asyncio.run(check())
+    finally:
+        waitlist.close()
+    assert ThreadRecordingWaitlist.threads == ["waitlist_0"]
@@ -0,0 +1,418 @@
+import asyncio
+import sqlite3
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Optional
+
+SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS waiting (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, -- Порядок постановки в лист ожидания
+    slot INTEGER NOT NULL,                -- Момент записи
+    resource TEXT NOT NULL,               -- Ресурс (мастер), см. BaseSchedule.resources
+    user_id INTEGER NOT NULL,
+    UNIQUE (slot, resource, user_id)
+);
+CREATE TABLE IF NOT EXISTS offers (
+    resource TEXT NOT NULL,
+    slot INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,             -- Пользователь, который должен подтвердить бронь
+    deadline REAL NOT NULL,               -- Время окончания подтверждения (time.time)
+    PRIMARY KEY (resource, slot)
+);
+"""
+
+
+class Waitlist:
+    """
+    Листы ожидания занятых записей. Когда запись освобождается, она предлагается первому ожидающему пользователю:
+    запись сразу бронируется на него, и он должен подтвердить бронь за ограниченное время. Если пользователь
+    отказывается или не отвечает, бронь отменяется и запись предлагается следующему.
+
+    Лист ожидания хранится в памяти процесса (общий для процессов и сохраняющийся при перезапуске - SqliteWaitlist).
+    Записи указываются ресурсом (мастером, см. BaseSchedule.resources) и моментом (см. schedule.BaseSchedule):
+    у каждого мастера свой лист ожидания записи, и освободившаяся запись предлагается ожидающим записи
+    этого мастера.
+    """
+
+    def __init__(self, max_waiting: int = 20) -> None:
+        """
+        Конструктор.
+
+        :param max_waiting: Сколько пользователей может ждать одну запись
+        """
+        self.max_waiting: int = max_waiting
+        # Пул потоков для запросов к хранилищу листов ожидания или None, если операции выполняются в цикле событий
+        self.executor: Optional[Executor] = None
+        # Момент записи -> ресурс -> ожидающие пользователи, по порядку
+        self._queues: dict[int, dict[str, deque[int]]] = {}
+        # (ресурс, момент записи) -> (пользователь, который подтверждает бронь, время окончания подтверждения)
+        self._offers: dict[tuple[str, int], tuple[int, float]] = {}
+
+    def join(self, resources: Iterable[str], key: int, user_id: int, cutoff: int) -> int:
+        """
+        Постановка пользователя в листы ожидания записи у нескольких ресурсов (например, у всех мастеров филиала,
+        у которых запись занята). Заодно удаляются листы ожидания прошедших записей.
+
+        :param resources: Ресурсы
+        :param key: Момент записи
+        :param user_id: Id пользователя
+        :param cutoff: Текущий момент
+        :return: Лучшее место пользователя в листах ожидания (с 1) или 0, если все листы ожидания заполнены
+        """
+        for past_key in [past_key for past_key in self._queues if past_key <= cutoff]:
+            del self._queues[past_key]
+        queues = self._queues.setdefault(key, {})
+        positions = []
+        for resource in resources:
+            queue = queues.setdefault(resource, deque())
+            if user_id in queue:
+                positions.append(queue.index(user_id) + 1)
+            elif len(queue) < self.max_waiting:
+                queue.append(user_id)
+                positions.append(len(queue))
+            elif not queue:
+                del queues[resource]
+        if not queues:
+            del self._queues[key]
+        return min(positions, default=0)
+
+    def leave(self, key: int, user_id: int) -> bool:
+        """
+        Удаление пользователя из листов ожидания записи у всех ресурсов.
+
+        :param key: Момент записи
+        :param user_id: Id пользователя
+        :return: Был ли пользователь хотя бы в одном листе ожидания
+        """
+        queues = self._queues.get(key)
+        if queues is None:
+            return False
+        found = False
+        for resource, queue in list(queues.items()):
+            if user_id in queue:
+                queue.remove(user_id)
+                found = True
+                if not queue:
+                    del queues[resource]
+        if not queues:
+            del self._queues[key]
+        return found
+
+    def first(self, resource: str, key: int) -> Optional[int]:
+        """
+        Первый пользователь в листе ожидания записи ресурса. Из листов он удаляется отдельно (leave), когда запись
+        забронирована на него.
+
+        :param resource: Ресурс, у которого освободилась запись
+        :param key: Момент записи
+        :return: Id пользователя или None, если запись никто не ждет
+        """
+        queue = self._queues.get(key, {}).get(resource)
+        return queue[0] if queue else None
+
+    def offer(self, resource: str, key: int, user_id: int, deadline: float) -> None:
+        """
+        Запоминание предложения записи пользователю (запись уже забронирована на него у ресурса).
+
+        :param resource: Ресурс
+        :param key: Момент записи
+        :param user_id: Id пользователя
+        :param deadline: Время окончания подтверждения (time.time)
+        :return: None
+        """
+        self._offers[(resource, key)] = (user_id, deadline)
+
+    def close_offer(self, resource: str, key: int, user_id: int) -> bool:
+        """
+        Завершение предложения записи пользователю: при подтверждении, отказе, отмене брони или истечении времени.
+
+        :param resource: Ресурс
+        :param key: Момент записи
+        :param user_id: Id пользователя
+        :return: Было ли предложение еще открыто (False, если оно уже завершено)
+        """
+        offer = self._offers.get((resource, key))
+        if offer is None or offer[0] != user_id:
+            return False
+        del self._offers[(resource, key)]
+        return True
+
+    def pending_offers(self) -> list[tuple[str, int, int, float]]:
+        """
+        Открытые предложения записей (при запуске бота по ним заново заводятся таймеры подтверждения).
+
+        :return: Предложения: (ресурс, момент записи, id пользователя, время окончания подтверждения)
+        """
+        return [(resource, key, user_id, deadline) for (resource, key), (user_id, deadline) in self._offers.items()]
+
+    def waiting_count(self) -> int:
+        """
+        Количество пользователей во всех листах ожидания (пользователь, ожидающий запись у нескольких ресурсов,
+        считается один раз).
+
+        :return: Количество
+        """
+        return sum(len(set().union(*queues.values())) for queues in self._queues.values())
+
+    def close(self) -> None:
+        """
+        Завершение работы с листами ожидания.
+
+        :return: None
+        """
+
+
+class SqliteWaitlist(Waitlist):
+    """
+    Листы ожидания и предложения записей в базе данных SQLite (см. Waitlist). Подставляется вместо Waitlist,
+    чтобы несколько процессов бота работали с общими листами ожидания, а листы и открытые предложения сохранялись
+    при перезапуске. Завершение предложения (close_offer) - один запрос DELETE, поэтому подтверждение, отказ
+    и истечение времени завершают предложение ровно один раз, даже если они произошли в разных процессах.
+
+    Запросы выполняются в отдельном потоке (self.executor, см. AsyncWaitlist): ожидание блокировки базы данных,
+    занятой другим процессом, не останавливает цикл событий. Поток один, поэтому соединение не используется
+    одновременно из нескольких потоков.
+    """
+
+    def __init__(self, database: str, max_waiting: int = 20) -> None:
+        """
+        Конструктор. Создает схему базы данных, если её нет.
+
+        :param database: Файл базы данных
+        :param max_waiting: Сколько пользователей может ждать одну запись
+        """
+        super().__init__(max_waiting)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="waitlist")
+        # isolation_level=None: транзакции открываются явно, одиночные запросы выполняются в автокоммите.
+        # check_same_thread=False: соединение создается в главном потоке, а запросы выполняются в потоке executor
+        self.connection: sqlite3.Connection = sqlite3.connect(database, isolation_level=None,
+                                                              check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA busy_timeout = 5000")
+        self.connection.executescript(SCHEMA)
+
+    def join(self, resources: Iterable[str], key: int, user_id: int, cutoff: int) -> int:
+        """
+        Постановка пользователя в листы ожидания записи у нескольких ресурсов (см. Waitlist.join). Выполняется
+        одной транзакцией: размер листа ожидания не превышается, даже если в него встают из разных процессов.
+
+        :param resources: Ресурсы
+        :param key: Момент записи
+        :param user_id: Id пользователя
+        :param cutoff: Текущий момент
+        :return: Лучшее место пользователя в листах ожидания (с 1) или 0, если все листы ожидания заполнены
+        """
+        positions = []
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("DELETE FROM waiting WHERE slot <= ?", (cutoff,))
+            for resource in resources:
+                row = connection.execute("SELECT id FROM waiting WHERE slot = ? AND resource = ? AND user_id = ?",
+                                         (key, resource, user_id)).fetchone()
+                if row is None:
+                    count = connection.execute("SELECT COUNT(*) FROM waiting WHERE slot = ? AND resource = ?",
+                                               (key, resource)).fetchone()[0]
+                    if count >= self.max_waiting:
+                        continue
+                    connection.execute("INSERT INTO waiting (slot, resource, user_id) VALUES (?, ?, ?)",
+                                       (key, resource, user_id))
+                    positions.append(count + 1)
+                else:
+                    positions.append(connection.execute(
+                        "SELECT COUNT(*) FROM waiting WHERE slot = ? AND resource = ? AND id <= ?",
+                        (key, resource, row[0])).fetchone()[0])
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return min(positions, default=0)
+
+    def leave(self, key: int, user_id: int) -> bool:
+        """
+        Удаление пользователя из листов ожидания записи у всех ресурсов (см. Waitlist.leave).
+
+        :param key: Момент записи
+        :param user_id: Id пользователя
+        :return: Был ли пользователь хотя бы в одном листе ожидания
+        """
+        return self.connection.execute("DELETE FROM waiting WHERE slot = ? AND user_id = ?",
+                                       (key, user_id)).rowcount > 0
+
+    def first(self, resource: str, key: int) -> Optional[int]:
+        """
+        Первый пользователь в листе ожидания записи ресурса (см. Waitlist.first).
+
+        :param resource: Ресурс, у которого освободилась запись
+        :param key: Момент записи
+        :return: Id пользователя или None, если запись никто не ждет
+        """
+        row = self.connection.execute(
+            "SELECT user_id FROM waiting WHERE slot = ? AND resource = ? ORDER BY id LIMIT 1", (key, resource)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def offer(self, resource: str, key: int, user_id: int, deadline: float) -> None:
+        """
+        Запоминание предложения записи пользователю (см. Waitlist.offer).
+
+        :param resource: Ресурс
+        :param key: Момент записи
+        :param user_id: Id пользователя
+        :param deadline: Время окончания подтверждения (time.time)
+        :return: None
+        """
+        self.connection.execute("INSERT OR REPLACE INTO offers (resource, slot, user_id, deadline) VALUES (?, ?, ?, ?)",
+                                (resource, key, user_id, deadline))
+
+    def close_offer(self, resource: str, key: int, user_id: int) -> bool:
+        """
+        Завершение предложения записи пользователю (см. Waitlist.close_offer).
+
+        :param resource: Ресурс
+        :param key: Момент записи
+        :param user_id: Id пользователя
+        :return: Было ли предложение еще открыто
+        """
+        return self.connection.execute("DELETE FROM offers WHERE resource = ? AND slot = ? AND user_id = ?",
+                                       (resource, key, user_id)).rowcount == 1
+
+    def pending_offers(self) -> list[tuple[str, int, int, float]]:
+        """
+        Открытые предложения записей, в том числе сделанные до перезапуска и в других процессах.
+
+        :return: Предложения: (ресурс, момент записи, id пользователя, время окончания подтверждения)
+        """
+        return self.connection.execute("SELECT resource, slot, user_id, deadline FROM offers").fetchall()
+
+    def waiting_count(self) -> int:
+        """
+        Количество пользователей во всех листах ожидания (см. Waitlist.waiting_count).
+
+        :return: Количество
+        """
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM (SELECT DISTINCT slot, user_id FROM waiting)").fetchone()[0]
+
+    def close(self) -> None:
+        """
+        Завершение запросов в потоке и закрытие соединения с базой данных.
+
+        :return: None
+        """
+        self.executor.shutdown(wait=True)
+        self.connection.close()
+
+
+class AsyncWaitlist:
+    """
+    Асинхронный доступ к листам ожидания для обработчиков бота (см. Waitlist). Операции выполняются в пуле потоков
+    листов ожидания (если он есть, см. SqliteWaitlist), поэтому цикл событий не блокируется на базе данных.
+    Количество ожидающих пользователей (waiting) обновляется после каждого изменения листов ожидания, чтобы
+    метрики читали его без запроса к базе данных.
+    """
+
+    def __init__(self, waitlist: Waitlist) -> None:
+        """
+        Конструктор.
+
+        :param waitlist: Листы ожидания
+        """
+        self.waitlist: Waitlist = waitlist
+        self.waiting: int = waitlist.waiting_count()  # Пользователи во всех листах ожидания
+
+    async def _run(self, function: Callable[..., Any], *args: Any) -> Any:
+        """
+        Выполнение операции с листами ожидания.
+
+        :param function: Операция
+        :param args: Аргументы
+        :return: Результат операции
+        """
+        if self.waitlist.executor is None:
+            return function(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.waitlist.executor, function, *args)
+
+    def _counted(self, function: Callable[..., Any], *args: Any) -> tuple[Any, int]:
+        """
+        Изменение листов ожидания и подсчет ожидающих пользователей (в том же потоке).
+
+        :param function: Операция
+        :param args: Аргументы
+        :return: Результат операции и количество ожидающих пользователей
+        """
+        return function(*args), self.waitlist.waiting_count()
+
+    async def join(self, resources: Iterable[str], key: int, user_id: int, cutoff: int) -> int:
+        """
+        Постановка пользователя в листы ожидания записи (см. Waitlist.join).
+
+        :param resources: Ресурсы
+        :param key: Момент записи
+        :param user_id: Id пользователя
+        :param cutoff: Текущий момент
+        :return: Место пользователя в листе ожидания (с 1) или 0, если встать в лист ожидания нельзя
+        """
+        position, self.waiting = await self._run(self._counted, self.waitlist.join, list(resources), key, user_id,
+                                                 cutoff)
+        return position
+
+    async def leave(self, key: int, user_id: int) -> bool:
+        """
+        Удаление пользователя из листов ожидания записи (см. Waitlist.leave).
+
+        :param key: Момент записи
+        :param user_id: Id пользователя
+        :return: Был ли пользователь в листе ожидания
+        """
+        left, self.waiting = await self._run(self._counted, self.waitlist.leave, key, user_id)
+        return left
+
+    async def first(self, resource: str, key: int) -> Optional[int]:
+        """
+        Первый пользователь в листе ожидания записи (см. Waitlist.first).
+
+        :param resource: Ресурс
+        :param key: Момент записи
+        :return: Id пользователя или None, если запись никто не ждет
+        """
+        return await self._run(self.waitlist.first, resource, key)
+
+    async def offer(self, resource: str, key: int, user_id: int, deadline: float) -> None:
+        """
+        Запоминание предложения записи пользователю (см. Waitlist.offer).
+
+        :param resource: Ресурс
+        :param key: Момент записи
+        :param user_id: Id пользователя
+        :param deadline: Время окончания подтверждения (time.time)
+        :return: None
+        """
+        await self._run(self.waitlist.offer, resource, key, user_id, deadline)
+
+    async def close_offer(self, resource: str, key: int, user_id: int) -> bool:
+        """
+        Завершение предложения записи пользователю (см. Waitlist.close_offer).
+
+        :param resource: Ресурс
+        :param key: Момент записи
+        :param user_id: Id пользователя
+        :return: Было ли предложение еще открыто
+        """
+        return await self._run(self.waitlist.close_offer, resource, key, user_id)
+
+    async def pending_offers(self) -> list[tuple[str, int, int, float]]:
+        """
+        Открытые предложения записей (см. Waitlist.pending_offers).
+
+        :return: Предложения: (ресурс, момент записи, id пользователя, время окончания подтверждения)
+        """
+        return await self._run(self.waitlist.pending_offers)
+
+    def close(self) -> None:
+        """
+        Завершение работы с листами ожидания.
+
+        :return: None
+        """
+        self.waitlist.close()
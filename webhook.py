@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from typing import Callable, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from settings import Settings
+
+
+class GracefulRequestHandler(SimpleRequestHandler):
+    """
+    Обработчик запросов от Telegram. Каждое обновление обрабатывается в отдельной задаче (Telegram сразу получает
+    ответ), поэтому обновления от разных пользователей обрабатываются одновременно. При остановке сервера
+    обработчик дожидается уже принятых обновлений. Сессия бота закрывается после остановки диспетчера
+    (см. create_webhook_app), чтобы при остановке успели отправиться сообщения из очереди (см. outbox.Outbox).
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret_token: Optional[str] = None,
+                 shutdown_timeout: float = 10.0) -> None:
+        """
+        Конструктор.
+
+        :param dispatcher: Обработчик сообщений
+        :param bot: Объект бота
+        :param secret_token: Секретный токен, который Telegram передает в заголовке X-Telegram-Bot-Api-Secret-Token
+        :param shutdown_timeout: Сколько секунд ждать обработки принятых обновлений при остановке
+        """
+        super().__init__(dispatcher, bot, handle_in_background=True, secret_token=secret_token or None)
+        self.shutdown_timeout: float = shutdown_timeout
+
+    async def close(self) -> None:
+        """
+        Ожидание обработки принятых обновлений.
+
+        :return: None
+        """
+        tasks = set(self._background_feed_update_tasks)
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=self.shutdown_timeout)
+            if pending:
+                logging.warning("Не дождались обработки %d обновлений при остановке", len(pending))
+
+
+def create_webhook_app(dispatcher: Dispatcher, bot: Bot, settings: Settings,
+                       on_cleanup: Optional[Callable[[], None]] = None) -> web.Application:
+    """
+    Создание веб-приложения, принимающего обновления от Telegram по адресу settings.webhook_path.
+    Если задан settings.webhook_url, адрес регистрируется в Telegram при запуске.
+
+    :param dispatcher: Обработчик сообщений
+    :param bot: Объект бота
+    :param settings: Настройки
+    :param on_cleanup: Функция, вызываемая после остановки сервера (например, закрытие расписания)
+    :return: Веб-приложение
+    """
+    app = web.Application()
+    GracefulRequestHandler(dispatcher, bot, settings.webhook_secret).register(app, path=settings.webhook_path)
+    setup_application(app, dispatcher, bot=bot)
+
+    if settings.webhook_url:
+        async def register_webhook(_: web.Application) -> None:
+            await bot.set_webhook(settings.webhook_url + settings.webhook_path,
+                                  secret_token=settings.webhook_secret or None)
+        app.on_startup.append(register_webhook)
+
+    async def cleanup(_: web.Application) -> None:
+        await bot.session.close()
+        if on_cleanup is not None:
+            on_cleanup()
+    app.on_cleanup.append(cleanup)
+    return app
+
+
+def run_webhook(dispatcher: Dispatcher, bot: Bot, settings: Settings,
+                on_cleanup: Optional[Callable[[], None]] = None) -> None:
+    """
+    Запуск бота в режиме webhook. Сервер останавливается по SIGINT/SIGTERM.
+
+    :param dispatcher: Обработчик сообщений
+    :param bot: Объект бота
+    :param settings: Настройки
+    :param on_cleanup: Функция, вызываемая после остановки сервера
+    :return: None
+    """
+    app = create_webhook_app(dispatcher, bot, settings, on_cleanup)
+    web.run_app(app, host=settings.webhook_host, port=settings.webhook_port)